@@ -0,0 +1,256 @@
+"""
+Micro-benchmarks for the hot paths of the streaming process.
+
+These are not run with the tests. Run them from the project directory with:
+
+    python -m twitter_stream.benchmarks [name ...]
+
+where each name is one of the benchmarks below (default: all of them).
+"""
+
+import os
+import sys
+import time
+
+if __name__ == "__main__":
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "test_settings")
+
+from twitter_stream.utils.streaming import TweetQueue
+
+
+def timed(func, *args, **kwargs):
+    """Returns the seconds func took to run, and its result."""
+    start = time.time()
+    result = func(*args, **kwargs)
+    return time.time() - start, result
+
+
+def make_status(i):
+    """Returns a synthetic parsed status that looks like a streamed tweet."""
+    return {
+        'id': 500000000000000000 + i,
+        'id_str': str(500000000000000000 + i),
+        'text': 'Synthetic tweet number %d about #things http://t.co/abcdefgh' % i,
+        'truncated': False,
+        'lang': 'en',
+        'created_at': 'Wed Jun 06 20:%02d:%02d +0000 2012' % ((i // 60) % 60, i % 60),
+        'filter_level': 'medium',
+        'coordinates': {'type': 'Point', 'coordinates': [-122.3 - i * 1e-6, 47.6]} if i % 10 == 0 else None,
+        'favorite_count': 0,
+        'retweet_count': i % 7,
+        'in_reply_to_status_id': None,
+        'entities': {'hashtags': [{'text': 'things', 'indices': [30, 37]}], 'urls': [], 'user_mentions': []},
+        'user': {
+            'id': 1000 + i % 5000,
+            'id_str': str(1000 + i % 5000),
+            'screen_name': 'user%d' % (i % 5000),
+            'name': 'User Number %d' % (i % 5000),
+            'verified': False,
+            'utc_offset': -25200,
+            'time_zone': 'Pacific Time (US & Canada)',
+            'geo_enabled': i % 3 == 0,
+            'location': 'Seattle, WA',
+            'followers_count': 100 + i % 1000,
+            'friends_count': 200,
+            'description': 'Just a synthetic user with a moderately long profile description.',
+        },
+    }
+
+
+def make_statuses(count):
+    return [make_status(i) for i in range(count)]
+
+
+class TestDatabase(object):
+    """Context manager that sets up (and tears down) the test database."""
+
+    def __enter__(self):
+        from django.db import connection
+        self.old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0)
+        return connection
+
+    def __exit__(self, *exc_info):
+        from django.db import connection
+        connection.creation.destroy_test_db(self.old_name, verbosity=0)
+
+
+class PoppingTweetQueue(TweetQueue):
+    """The old TweetQueue, which popped items one at a time while holding the lock."""
+
+    def _get_all(self):
+        result = []
+        while len(self.queue):
+            result.append(self.queue.popleft())
+        return result
+
+
+def bench_queue_drain(depths=(1000, 10000, 100000, 1000000)):
+    """Lock hold time of TweetQueue.get_all() vs. queue depth."""
+
+    print("%10s %15s %15s" % ("depth", "popleft (ms)", "swap (ms)"))
+
+    for depth in depths:
+        row = []
+        for queue_class in (PoppingTweetQueue, TweetQueue):
+            q = queue_class()
+            for i in range(depth):
+                q.put_nowait(i)
+
+            # Time only the part done while holding the lock
+            q.mutex.acquire()
+            try:
+                elapsed, items = timed(q._get_all)
+            finally:
+                q.mutex.release()
+
+            assert len(items) == depth
+            row.append(elapsed * 1000)
+
+        print("%10d %15.3f %15.3f" % (depth, row[0], row[1]))
+
+
+def bench_parse(count=50000):
+    """Tweets / sec parsed into model instances vs. plain rows."""
+    from twitter_stream.models import Tweet
+
+    statuses = make_statuses(count)
+
+    elapsed, _ = timed(lambda: [Tweet.create_from_json(s) for s in statuses])
+    print("%20s %10.0f tweets / sec" % ("create_from_json", count / elapsed))
+
+    elapsed, _ = timed(lambda: [Tweet.row_from_json(s) for s in statuses])
+    print("%20s %10.0f tweets / sec" % ("row_from_json", count / elapsed))
+
+
+def bench_insert(count=20000, batch_size=1000):
+    """Tweets / sec parsed and inserted with each insert backend the database supports."""
+    from twitter_stream.models import Tweet
+
+    statuses = make_statuses(count)
+
+    with TestDatabase() as connection:
+        backends = ['bulk_create', 'insert']
+        if connection.vendor == 'postgresql':
+            backends.append('copy')
+        elif connection.vendor == 'mysql':
+            backends.append('load_data')
+
+        def with_models():
+            Tweet.objects.bulk_create([Tweet.create_from_json(s) for s in statuses], batch_size)
+
+        def with_rows(backend):
+            Tweet.insert_rows([Tweet.row_from_json(s) for s in statuses], batch_size, backend)
+
+        for backend in backends:
+            Tweet.objects.all().delete()
+            if backend == 'bulk_create':
+                elapsed, _ = timed(with_models)
+            else:
+                elapsed, _ = timed(with_rows, backend)
+            assert Tweet.objects.count() == count
+            print("%20s %10.0f tweets / sec" % (backend, count / elapsed))
+
+        rows = [Tweet.row_from_json(s) for s in statuses]
+        elapsed, _ = timed(Tweet.format_text_rows, rows)
+        print("%20s %10.0f tweets / sec" % ("(COPY formatting)", count / elapsed))
+
+
+def bench_datetime(count=100000, tweets_per_second=20):
+    """created_at strings / sec parsed with email.utils vs. the fixed-format parser."""
+    from twitter_stream import models
+
+    strings = [make_status(i // tweets_per_second)['created_at'] for i in range(count)]
+
+    elapsed, _ = timed(lambda: [models._parse_email_datetime(s) for s in strings])
+    print("%20s %10.0f / sec" % ("email.utils", count / elapsed))
+
+    elapsed, _ = timed(lambda: [models._parse_twitter_datetime(s) for s in strings])
+    print("%20s %10.0f / sec" % ("fixed format", count / elapsed))
+
+    models._datetime_cache.clear()
+    elapsed, _ = timed(lambda: [models.parse_datetime(s) for s in strings])
+    print("%20s %10.0f / sec" % ("cached", count / elapsed))
+
+
+def bench_json(count=20000):
+    """Tweets / sec decoded and encoded by each installed JSON backend."""
+    from twitter_stream.utils import fastjson
+
+    lines = [fastjson.dumps(s) for s in make_statuses(count)]
+    texts = [line.decode('utf-8') for line in lines]
+
+    print("%10s %15s %15s" % ("backend", "loads / sec", "dumps / sec"))
+    for name in fastjson.BACKENDS:
+        try:
+            loads, dumps = fastjson.get_backend(name)
+        except ImportError:
+            print("%10s %15s" % (name, "not installed"))
+            continue
+
+        elapsed, statuses = timed(lambda: [loads(t) for t in texts])
+        loads_rate = count / elapsed
+        elapsed, _ = timed(lambda: [dumps(s) for s in statuses])
+        print("%10s %15.0f %15.0f" % (name, loads_rate, count / elapsed))
+
+
+def bench_read(count=200000):
+    """Tweets / sec read from a file (without decoding) line by line vs. with a memory map."""
+    import json
+    import tempfile
+    from twitter_stream.utils.file_stream import FakeTwitterStream, MappedTweetFile
+
+    with tempfile.NamedTemporaryFile() as tweets_file:
+        for status in make_statuses(count):
+            tweets_file.write(json.dumps(status).encode('utf-8') + b'\n')
+        tweets_file.flush()
+
+        stream = FakeTwitterStream(tweets_file.name, None, None)
+        with open(tweets_file.name, 'rb') as infile:
+            elapsed, read = timed(lambda: sum(1 for raw in stream.read_records(infile)))
+        assert read == count
+        print("%20s %10.0f tweets / sec" % ("readline", count / elapsed))
+
+        mapped = MappedTweetFile(tweets_file.name)
+        elapsed, read = timed(lambda: sum(1 for raw in mapped.lines()))
+        assert read == count
+        mapped.close()
+        print("%20s %10.0f tweets / sec" % ("mmap", count / elapsed))
+
+
+def bench_pretty(count=50000):
+    """Tweets / sec parsed from pretty-printed dumps by iter_json_objects()."""
+    import json
+    from twitter_stream.utils.jsonstream import iter_json_objects
+
+    statuses = make_statuses(count)
+
+    for name, indent in (("compact array", None), ("indent 2", 2), ("indent 4", 4)):
+        data = ('[' + ',\n'.join(json.dumps(s, indent=indent) for s in statuses) + ']').encode('utf-8')
+        chunks = [data[i:i + 65536] for i in range(0, len(data), 65536)]
+
+        elapsed, read = timed(lambda: sum(1 for tweet in iter_json_objects(chunks)))
+        assert read == count
+        print("%20s %10.0f tweets / sec" % (name, count / elapsed))
+
+
+BENCHMARKS = {
+    'queue_drain': bench_queue_drain,
+    'parse': bench_parse,
+    'insert': bench_insert,
+    'datetime': bench_datetime,
+    'json': bench_json,
+    'read': bench_read,
+    'pretty': bench_pretty,
+}
+
+
+def main(names):
+    for name in names or sorted(BENCHMARKS.keys()):
+        print("== %s: %s" % (name, BENCHMARKS[name].__doc__))
+        BENCHMARKS[name]()
+        print("")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
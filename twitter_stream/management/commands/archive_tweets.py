@@ -0,0 +1,188 @@
+import time
+from datetime import datetime, timedelta
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from swapper import load_model
+
+from twitter_stream import models, settings
+from twitter_stream.utils import fastjson
+from twitter_stream.utils.archive import RotatingArchiveWriter
+
+
+class Command(BaseCommand):
+    """
+    Moves tweets created before a cutoff out of the database, into
+    (compressed) files with one JSON tweet per line, which can be
+    loaded again with the stream command's --from-file option.
+
+    Tweets are exported and deleted in chunks, in id order, pausing
+    between chunks so that the stream can keep inserting.
+
+    Example usage:
+    python manage.py archive_tweets --older-than 90 --to-file archive/tweets.json
+    python manage.py archive_tweets --before 2014-01-01 --rotate-size 1000000000
+    python manage.py archive_tweets --older-than 30 --no-export
+    """
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--before',
+            action='store',
+            dest='before',
+            default=None,
+            help='Archive tweets created before this date (YYYY-MM-DD, UTC).'
+        ),
+        make_option(
+            '--older-than',
+            action='store',
+            dest='older_than',
+            default=None,
+            type=int,
+            help='Archive tweets created more than this many days ago.'
+        ),
+        make_option(
+            '--to-file',
+            action='store',
+            dest='to_file',
+            default='tweet_archive.json',
+            help='The file to write the tweets to. An extension is added for the compression.'
+        ),
+        make_option(
+            '--compress',
+            action='store',
+            dest='compression',
+            default='gzip',
+            choices=['gzip', 'zstd', 'none'],
+            help='Compression for the file: gzip, zstd, or none.'
+        ),
+        make_option(
+            '--rotate-size',
+            action='store',
+            dest='rotate_size',
+            default=None,
+            type=int,
+            help='Start a new file after this many bytes of tweets.'
+        ),
+        make_option(
+            '--chunk-size',
+            action='store',
+            dest='chunk_size',
+            default=10000,
+            type=int,
+            help='Tweets to export and delete at a time.'
+        ),
+        make_option(
+            '--pause',
+            action='store',
+            dest='pause',
+            default=1.0,
+            type=float,
+            help='After each chunk, wait this many times as long as the chunk took.'
+        ),
+        make_option(
+            '--no-export',
+            action='store_false',
+            dest='export',
+            default=True,
+            help='Just delete the tweets, without saving them anywhere.'
+        ),
+        make_option(
+            '--no-delete',
+            action='store_false',
+            dest='delete',
+            default=True,
+            help='Just export the tweets, without deleting them.'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        Tweet = load_model("twitter_stream", "Tweet")
+
+        before = options.get('before', None)
+        older_than = options.get('older_than', None)
+        if bool(before) == (older_than is not None):
+            raise CommandError("Give either --before or --older-than")
+
+        if before:
+            try:
+                before = datetime.strptime(before, '%Y-%m-%d')
+            except ValueError:
+                raise CommandError("Dates look like 2014-01-31, not %s" % before)
+            if settings.USE_TZ:
+                before = timezone.make_aware(before, timezone.utc)
+        else:
+            before = timezone.now() - timedelta(days=older_than)
+
+        export = options.get('export', True)
+        delete = options.get('delete', True)
+        if not export and not delete:
+            raise CommandError("Nothing to do with both --no-export and --no-delete")
+
+        chunk_size = options.get('chunk_size', 10000)
+        pause = options.get('pause', 1.0)
+
+        writer = None
+        if export:
+            compression = options.get('compression', 'gzip')
+            writer = RotatingArchiveWriter(options.get('to_file', 'tweet_archive.json'),
+                                           compression=None if compression == 'none' else compression,
+                                           max_bytes=options.get('rotate_size', None))
+
+        tweets = Tweet.objects.filter(created_at__lt=before).order_by('pk')
+        last_id = 0
+        archived = 0
+
+        # Bounds the chunks, so that the last one does not go on
+        # looking through all the newer tweets for more to archive
+        max_id = tweets.aggregate(max_id=Max('pk'))['max_id']
+
+        try:
+            while max_id is not None and last_id < max_id:
+                started = time.time()
+
+                chunk = list(tweets.filter(pk__gt=last_id, pk__lte=max_id)[:chunk_size])
+                if not chunk:
+                    break
+
+                first_id, last_id = chunk[0].pk, chunk[-1].pk
+
+                if writer is not None:
+                    # Tweets saved with NORMALIZE_USERS have blank user columns
+                    users = {}
+                    user_ids = set(tweet.user_id for tweet in chunk if not tweet.user_screen_name)
+                    if user_ids:
+                        users = models.TwitterUser.objects.in_bulk(user_ids)
+
+                    writer.write(b"".join(fastjson.dumps(tweet.to_json(users.get(tweet.user_id))) + b"\n"
+                                          for tweet in chunk))
+                    # Make sure they are safe before deleting them
+                    writer.sync()
+
+                if delete:
+                    with transaction.atomic():
+                        deleted = Tweet.delete_id_range(first_id, last_id, before)
+                        if settings.COUNT_APPROX_SOURCE == 'counter':
+                            models.TweetTableStats.add_tweets(Tweet, -deleted)
+                        if settings.COUNT_ROLLUPS:
+                            models.TweetCount.remove_counts(tweet.created_at for tweet in chunk)
+
+                archived += len(chunk)
+                self.stdout.write("Archived %d tweets (up to id %d, created %s)" % (
+                    archived, last_id, chunk[-1].created_at))
+
+                # Give everything else a turn
+                if pause:
+                    time.sleep((time.time() - started) * pause)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        # The earliest tweets are gone (deleting them cleared the watermarks)
+        if delete and archived:
+            models.TweetTableStats.refresh_created_range(Tweet)
+
+        self.stdout.write("Archived %d tweets created before %s" % (archived, before))
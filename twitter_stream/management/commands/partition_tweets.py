@@ -0,0 +1,124 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from swapper import load_model
+
+from twitter_stream import models, settings
+from twitter_stream.partitions import INTERVALS, get_partitioner
+
+
+class Command(BaseCommand):
+    """
+    Manages the created_at partitions of the tweet table (PostgreSQL 11+ or MySQL).
+    Creates partitions for the days ahead and drops (or detaches) expired ones.
+    Run it daily, e.g. from cron.
+
+    Example usage:
+    python manage.py partition_tweets --setup
+    python manage.py partition_tweets --ahead 14 --retention 90
+    python manage.py partition_tweets --retention 30 --detach
+    python manage.py partition_tweets --dry-run
+    """
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--setup',
+            action='store_true',
+            dest='setup',
+            default=False,
+            help='Convert the tweet table to a partitioned table first. '
+                 'Existing tweets go into a legacy partition. This can take a long time on MySQL.'
+        ),
+        make_option(
+            '--interval',
+            action='store',
+            dest='interval',
+            default=settings.PARTITION_INTERVAL,
+            type='choice',
+            choices=INTERVALS,
+            help='Partition size: day or week.'
+        ),
+        make_option(
+            '--ahead',
+            action='store',
+            dest='ahead',
+            default=settings.PARTITION_AHEAD,
+            type=int,
+            help='Number of partitions to create ahead of the current one.'
+        ),
+        make_option(
+            '--retention',
+            action='store',
+            dest='retention',
+            default=settings.PARTITION_RETENTION_DAYS,
+            type=int,
+            help='Remove partitions that ended more than this many days ago.'
+        ),
+        make_option(
+            '--detach',
+            action='store_true',
+            dest='detach',
+            default=False,
+            help='Keep expired partitions as tables of their own instead of dropping them.'
+        ),
+        make_option(
+            '--dry-run',
+            action='store_true',
+            dest='dry_run',
+            default=False,
+            help='Print the SQL without running it.'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        Tweet = load_model("twitter_stream", "Tweet")
+
+        try:
+            partitioner = get_partitioner(Tweet, options.get('interval', settings.PARTITION_INTERVAL))
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        dry_run = options.get('dry_run', False)
+        today = timezone.now().date()
+
+        def run(statements):
+            for sql in statements:
+                self.stdout.write(sql + ";")
+            if not dry_run:
+                with transaction.atomic():
+                    partitioner.execute(statements)
+
+        if options.get('setup', False):
+            if partitioner.is_partitioned():
+                raise CommandError("%s is already partitioned" % partitioner.table)
+            run(partitioner.setup_sql(today))
+            if dry_run:
+                # The rest depends on the table being partitioned already
+                return
+
+        elif not partitioner.is_partitioned():
+            raise CommandError("%s is not partitioned yet, use --setup" % partitioner.table)
+
+        to_create, to_drop = partitioner.plan(today, options.get('ahead', settings.PARTITION_AHEAD),
+                                              options.get('retention', settings.PARTITION_RETENTION_DAYS))
+
+        run(partitioner.create_sql(to_create))
+        for name in to_drop:
+            if options.get('detach', False):
+                run(partitioner.detach_sql(name))
+            else:
+                run(partitioner.drop_sql(name))
+
+            if settings.COUNT_ROLLUPS and not dry_run:
+                # Its tweets are no longer in the table
+                models.TweetCount.remove_range(*partitioner.created_range(name))
+
+        if not dry_run:
+            # The earliest tweets may be gone
+            if to_drop:
+                models.TweetTableStats.refresh_created_range(Tweet)
+
+            self.stdout.write("Created %d partitions, %s %d" % (
+                len(to_create), "detached" if options.get('detach', False) else "dropped", len(to_drop)))
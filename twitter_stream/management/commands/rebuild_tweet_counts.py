@@ -0,0 +1,58 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from swapper import load_model
+
+from twitter_stream import models
+
+
+class Command(BaseCommand):
+    """
+    Recounts the per-minute and per-hour tweet counts (see COUNT_ROLLUPS),
+    the running count of tweets (see COUNT_APPROX_SOURCE), and the earliest
+    and latest created_at, from the tweets in the database, e.g. after
+    turning either setting on.
+    Stop the stream first, or tweets inserted meanwhile may be counted twice.
+
+    Example usage:
+    python manage.py rebuild_tweet_counts
+    """
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--chunk-size',
+            action='store',
+            dest='chunk_size',
+            default=100000,
+            type=int,
+            help='Tweets to read at a time.'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        Tweet = load_model("twitter_stream", "Tweet")
+        chunk_size = options.get('chunk_size', 100000)
+
+        models.TweetCount.objects.all().delete()
+
+        # Walk the primary key, so no chunk needs a sort or a big offset
+        tweets = Tweet.objects.order_by('pk').values_list('pk', 'created_at')
+        last_id = 0
+        counted = 0
+
+        while True:
+            chunk = list(tweets.filter(pk__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+
+            last_id = chunk[-1][0]
+            models.TweetCount.add_counts(created_at for pk, created_at in chunk)
+
+            counted += len(chunk)
+            self.stdout.write("Counted %d tweets" % counted)
+
+        models.TweetTableStats.set_tweet_count(Tweet, counted)
+        models.TweetTableStats.refresh_created_range(Tweet)
+
+        self.stdout.write("Counted %d tweets in %d minutes" % (
+            counted, models.TweetCount.objects.filter(resolution=models.TweetCount.MINUTE).count()))
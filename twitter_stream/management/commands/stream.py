@@ -51,6 +51,13 @@ class Command(BaseCommand):
             default=settings.POLL_INTERVAL,
             help='Seconds between term updates and tweet inserts.'
         ),
+        make_option(
+            '--writer-thread',
+            action='store_true',
+            dest='writer_thread',
+            default=settings.WRITER_THREAD,
+            help='Insert tweets continuously from a separate thread instead of once per poll interval.'
+        ),
         make_option(
             '--prevent-exit',
             action='store_true',
@@ -65,19 +72,58 @@ class Command(BaseCommand):
             default=None,
             help='Write tweets to the given JSON file instead of the database.'
         ),
+        make_option(
+            '--raw',
+            action='store_true',
+            dest='raw',
+            default=False,
+            help='With --to-file, write tweets exactly as received from Twitter, without parsing them.'
+        ),
+        make_option(
+            '--compress',
+            action='store',
+            dest='compression',
+            default=settings.ARCHIVE_COMPRESSION,
+            choices=['gzip', 'zstd'],
+            help='With --to-file, compress the output with gzip or zstd.'
+        ),
+        make_option(
+            '--rotate-size',
+            action='store',
+            dest='rotate_bytes',
+            default=settings.ARCHIVE_ROTATE_BYTES,
+            type=int,
+            help='With --to-file, start a new file after this many bytes of tweets.'
+        ),
+        make_option(
+            '--rotate-interval',
+            action='store',
+            dest='rotate_seconds',
+            default=settings.ARCHIVE_ROTATE_SECONDS,
+            type=int,
+            help='With --to-file, start a new file after this many seconds.'
+        ),
         make_option(
             '--from-file',
             action='store',
             dest='from_file',
             default=None,
-            help='Read tweets from a given file, one JSON tweet per line.'
+            help='Read tweets from a given file (or glob pattern of files, possibly compressed), one JSON tweet per line.'
         ),
         make_option(
             '--from-file-long',
             action='store',
             dest='from_file_long',
             default=None,
-            help='Read tweets from a given file, where JSON tweets are pretty-printed.'
+            help='Read tweets from a given file, where JSON tweets are pretty-printed (or laid out any other way, e.g. as a JSON array).'
+        ),
+        make_option(
+            '--workers',
+            action='store',
+            dest='workers',
+            default=1,
+            type=int,
+            help='With --from-file, split the file across this many processes that insert tweets in parallel.'
         ),
         make_option(
             '--rate-limit',
@@ -87,6 +133,22 @@ class Command(BaseCommand):
             type=float,
             help='Rate to read in tweets, used ONLY if streaming from a file.'
         ),
+        make_option(
+            '--replay-speed',
+            action='store',
+            dest='replay_speed',
+            default=None,
+            type=float,
+            help='With --from-file, reproduce the original gaps between tweets (from created_at), sped up by this factor, e.g. 1 for real time or 10 for ten times faster.'
+        ),
+        make_option(
+            '--burst',
+            action='store',
+            dest='burst',
+            default=None,
+            type=int,
+            help='With --rate-limit, how many tweets may be read at once after a slowdown.'
+        ),
         make_option(
             '--limit',
             action='store',
@@ -104,16 +166,42 @@ class Command(BaseCommand):
         # The suggested time between hearbeats
         poll_interval = float(options.get('poll_interval', settings.POLL_INTERVAL))
         prevent_exit = options.get('prevent_exit', settings.PREVENT_EXIT)
+        writer_thread = options.get('writer_thread', settings.WRITER_THREAD)
         to_file = options.get('to_file', None)
+        raw = options.get('raw', False)
+        compression = options.get('compression', settings.ARCHIVE_COMPRESSION)
+        rotate_bytes = options.get('rotate_bytes', settings.ARCHIVE_ROTATE_BYTES)
+        rotate_seconds = options.get('rotate_seconds', settings.ARCHIVE_ROTATE_SECONDS)
         from_file = options.get('from_file', None)
         from_file_long = options.get('from_file_long', None)
         rate_limit = options.get('rate_limit', 50)
         limit = options.get('limit', None)
+        burst = options.get('burst', None)
+        replay_speed = options.get('replay_speed', None)
+        workers = options.get('workers', 1)
+
+        if rate_limit and replay_speed:
+            logger.error("Cannot use both --rate-limit and --replay-speed")
+            exit(1)
 
         if from_file and from_file_long:
             logger.error("Cannot use both --from-file and --from-file-long")
             exit(1)
 
+        if raw and not to_file:
+            logger.error("--raw only works with --to-file")
+            exit(1)
+
+        # From here on, both work the same except for how the file is parsed
+        read_pretty = False
+        if from_file_long:
+            from_file = from_file_long
+            read_pretty = True
+
+        if workers > 1 and (not from_file or from_file == '-' or from_file_long or to_file or limit or rate_limit or replay_speed):
+            logger.error("--workers only works with --from-file, and not with stdin, --to-file, --limit, --rate-limit, or --replay-speed")
+            exit(1)
+
         # First expire any old stream process records that have failed
         # to report in for a while
         timeout_seconds = 3 * poll_interval
@@ -124,7 +212,15 @@ class Command(BaseCommand):
             timeout_seconds=timeout_seconds
         )
 
-        listener = utils.QueueStreamListener(to_file=to_file)
+        # Set if the file is split across several processes
+        replay = None
+
+        listener = utils.QueueStreamListener(to_file=to_file, raw=raw,
+                                             compression=compression,
+                                             rotate_bytes=rotate_bytes,
+                                             rotate_seconds=rotate_seconds)
+        if writer_thread:
+            listener.start_writer()
 
         if from_file:
             checker = utils.FakeTermChecker(queue_listener=listener,
@@ -142,9 +238,18 @@ class Command(BaseCommand):
                 stream_process.status = models.StreamProcess.STREAM_STATUS_STOPPED
                 stream_process.heartbeat()
 
+            if replay:
+                replay.terminate()
+
             # Let the tweet listener know it should be quitting asap
             listener.set_terminate()
 
+            # Save whatever the writer thread has left
+            listener.stop_writer(timeout=poll_interval)
+
+            # Journal anything that is still waiting
+            listener.close()
+
             logger.error("Terminating")
 
             raise SystemExit()
@@ -183,12 +288,13 @@ class Command(BaseCommand):
                 # Start and maintain the streaming connection...
                 stream = twitter_monitor.DynamicTwitterStream(auth, listener, checker)
 
-            elif from_file or from_file_long:
+            elif workers > 1:
+                logger.info("Reading tweets from JSON file %s with %d workers", from_file, workers)
+                replay = utils.ParallelFileReplay(from_file, workers, stream_process)
+                replay.run(poll_interval)
+                return
 
-                read_pretty = False
-                if from_file_long:
-                    from_file = from_file
-                    read_pretty = True
+            elif from_file or from_file_long:
 
                 if from_file == '-':
                     from_file = sys.stdin
@@ -201,7 +307,8 @@ class Command(BaseCommand):
 
                 stream = utils.FakeTwitterStream(from_file, pretty=read_pretty,
                                                  listener=listener, term_checker=checker,
-                                                 limit=limit, rate_limit=rate_limit)
+                                                 limit=limit, rate_limit=rate_limit,
+                                                 burst=burst, replay_speed=replay_speed)
             else:
                 raise Exception("No api keys and we're not streaming from a file.")
 
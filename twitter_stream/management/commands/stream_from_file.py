@@ -40,6 +40,7 @@ class Command(BaseCommand):
     python manage.py stream_from_file tweets.json
     python manage.py stream_from_file tweets.json --limit 100000
     python manage.py stream_from_file tweets.json --rate-limit 25 --poll-interval 25
+    python manage.py stream_from_file tweets.json --workers 4
     """
 
     option_list = BaseCommand.option_list + (
@@ -51,6 +52,21 @@ class Command(BaseCommand):
             type=int,
             help='Seconds between tweet inserts.'
         ),
+        make_option(
+            '--writer-thread',
+            action='store_true',
+            dest='writer_thread',
+            default=settings.WRITER_THREAD,
+            help='Insert tweets continuously from a separate thread instead of once per poll interval.'
+        ),
+        make_option(
+            '--workers',
+            action='store',
+            dest='workers',
+            default=1,
+            type=int,
+            help='Split the file across this many processes that insert tweets in parallel.'
+        ),
         make_option(
             '--rate-limit',
             action='store',
@@ -59,6 +75,22 @@ class Command(BaseCommand):
             type=float,
             help='Rate to read in tweets.'
         ),
+        make_option(
+            '--replay-speed',
+            action='store',
+            dest='replay_speed',
+            default=None,
+            type=float,
+            help='Reproduce the original gaps between tweets (from created_at), sped up by this factor, e.g. 1 for real time or 10 for ten times faster.'
+        ),
+        make_option(
+            '--burst',
+            action='store',
+            dest='burst',
+            default=None,
+            type=int,
+            help='How many tweets may be read at once after a slowdown.'
+        ),
         make_option(
             '--limit',
             action='store',
@@ -77,7 +109,19 @@ class Command(BaseCommand):
         poll_interval = float(options.get('poll_interval', settings.POLL_INTERVAL))
         rate_limit = options.get('rate_limit', 50)
         limit = options.get('limit', None)
+        burst = options.get('burst', None)
+        replay_speed = options.get('replay_speed', None)
         prevent_exit = options.get('prevent_exit', settings.PREVENT_EXIT)
+        writer_thread = options.get('writer_thread', settings.WRITER_THREAD)
+        workers = options.get('workers', 1)
+
+        if rate_limit and replay_speed:
+            logger.error("Cannot use both --rate-limit and --replay-speed")
+            exit(1)
+
+        if workers > 1 and (limit or rate_limit or replay_speed):
+            logger.error("--workers cannot be used with --limit, --rate-limit, or --replay-speed")
+            exit(1)
 
         # First expire any old stream process records that have failed
         # to report in for a while
@@ -88,7 +132,12 @@ class Command(BaseCommand):
             timeout_seconds=timeout_seconds
         )
 
+        # Set if the file is split across several processes
+        replay = None
+
         listener = utils.QueueStreamListener()
+        if writer_thread:
+            listener.start_writer()
         checker = utils.FakeTermChecker(queue_listener=listener,
                                          stream_process=stream_process)
 
@@ -103,9 +152,18 @@ class Command(BaseCommand):
                 stream_process.status = models.StreamProcess.STREAM_STATUS_STOPPED
                 stream_process.heartbeat()
 
+            if replay:
+                replay.terminate()
+
             # Let the tweet listener know it should be quitting asap
             listener.set_terminate()
 
+            # Save whatever the writer thread has left
+            listener.stop_writer(timeout=poll_interval)
+
+            # Journal anything that is still waiting
+            listener.close()
+
             raise SystemExit()
 
         # Installs signal handlers for handling SIGINT and SIGTERM
@@ -118,9 +176,15 @@ class Command(BaseCommand):
             logger.info("Rate limit: %f", rate_limit)
 
         try:
+            if workers > 1:
+                replay = utils.ParallelFileReplay(tweets_file, workers, stream_process)
+                replay.run(poll_interval)
+                return
+
             stream = utils.FakeTwitterStream(tweets_file,
                                              listener=listener, term_checker=checker,
-                                             limit=limit, rate_limit=rate_limit)
+                                             limit=limit, rate_limit=rate_limit,
+                                             burst=burst, replay_speed=replay_speed)
 
             if prevent_exit:
                 while checker.ok():
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding field 'StreamProcess.insert_batch_size'
+        db.add_column(u'twitter_stream_streamprocess', 'insert_batch_size',
+                      self.gf('django.db.models.fields.PositiveIntegerField')(default=0),
+                      keep_default=False)
+
+        # Adding field 'StreamProcess.insert_rate'
+        db.add_column(u'twitter_stream_streamprocess', 'insert_rate',
+                      self.gf('django.db.models.fields.FloatField')(default=0),
+                      keep_default=False)
+
+
+    def backwards(self, orm):
+        # Deleting field 'StreamProcess.insert_batch_size'
+        db.delete_column(u'twitter_stream_streamprocess', 'insert_batch_size')
+
+        # Deleting field 'StreamProcess.insert_rate'
+        db.delete_column(u'twitter_stream_streamprocess', 'insert_rate')
+
+
+    models = {
+        u'twitter_stream.apikey': {
+            'Meta': {'object_name': 'ApiKey'},
+            'access_token': ('django.db.models.fields.CharField', [], {'max_length': '250'}),
+            'access_token_secret': ('django.db.models.fields.CharField', [], {'max_length': '250'}),
+            'api_key': ('django.db.models.fields.CharField', [], {'max_length': '250'}),
+            'api_secret': ('django.db.models.fields.CharField', [], {'max_length': '250'}),
+            'app_name': ('django.db.models.fields.CharField', [], {'max_length': '250'}),
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'email': ('django.db.models.fields.EmailField', [], {'default': 'None', 'max_length': '75', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'user_name': ('django.db.models.fields.CharField', [], {'max_length': '250'})
+        },
+        u'twitter_stream.filterterm': {
+            'Meta': {'object_name': 'FilterTerm'},
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'enabled': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'term': ('django.db.models.fields.CharField', [], {'max_length': '250'})
+        },
+        u'twitter_stream.streamprocess': {
+            'Meta': {'object_name': 'StreamProcess'},
+            'blocked_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'dropped_newest_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'dropped_oldest_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'error_count': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'}),
+            'expires_at': ('django.db.models.fields.DateTimeField', [], {}),
+            'hostname': ('django.db.models.fields.CharField', [], {'max_length': '250'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'insert_batch_size': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'insert_rate': ('django.db.models.fields.FloatField', [], {'default': '0'}),
+            'keys': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['twitter_stream.ApiKey']", 'null': 'True'}),
+            'last_heartbeat': ('django.db.models.fields.DateTimeField', [], {}),
+            'memory_usage': ('django.db.models.fields.CharField', [], {'default': 'None', 'max_length': '30', 'null': 'True', 'blank': 'True'}),
+            'process_id': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'spilled_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'status': ('django.db.models.fields.CharField', [], {'default': "'WAITING'", 'max_length': '10'}),
+            'timeout_seconds': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'tweet_rate': ('django.db.models.fields.FloatField', [], {'default': '0'})
+        },
+        u'twitter_stream.tweet': {
+            'Meta': {'object_name': 'Tweet'},
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True'}),
+            'favorite_count': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'filter_level': ('django.db.models.fields.CharField', [], {'default': 'None', 'max_length': '6', 'null': 'True', 'blank': 'True'}),
+            'id': ('twitter_stream.fields.PositiveBigAutoField', [], {'primary_key': 'True'}),
+            'in_reply_to_status_id': ('django.db.models.fields.BigIntegerField', [], {'default': 'None', 'null': 'True', 'blank': 'True'}),
+            'lang': ('django.db.models.fields.CharField', [], {'default': 'None', 'max_length': '9', 'null': 'True', 'blank': 'True'}),
+            'latitude': ('django.db.models.fields.FloatField', [], {'default': 'None', 'null': 'True', 'blank': 'True'}),
+            'longitude': ('django.db.models.fields.FloatField', [], {'default': 'None', 'null': 'True', 'blank': 'True'}),
+            'retweet_count': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'retweeted_status_id': ('django.db.models.fields.BigIntegerField', [], {'default': 'None', 'null': 'True', 'blank': 'True'}),
+            'text': ('django.db.models.fields.CharField', [], {'max_length': '250'}),
+            'truncated': ('django.db.models.fields.BooleanField', [], {}),
+            'tweet_id': ('django.db.models.fields.BigIntegerField', [], {}),
+            'user_followers_count': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'user_friends_count': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'user_geo_enabled': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'user_id': ('django.db.models.fields.BigIntegerField', [], {}),
+            'user_location': ('django.db.models.fields.CharField', [], {'default': 'None', 'max_length': '150', 'null': 'True', 'blank': 'True'}),
+            'user_name': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'user_screen_name': ('django.db.models.fields.CharField', [], {'max_length': '50'}),
+            'user_time_zone': ('django.db.models.fields.CharField', [], {'default': 'None', 'max_length': '150', 'null': 'True', 'blank': 'True'}),
+            'user_utc_offset': ('django.db.models.fields.IntegerField', [], {'default': 'None', 'null': 'True', 'blank': 'True'}),
+            'user_verified': ('django.db.models.fields.BooleanField', [], {})
+        }
+    }
+
+    complete_apps = ['twitter_stream']
\ No newline at end of file
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'TwitterUser'
+        db.create_table(u'twitter_stream_twitteruser', (
+            ('user_id', self.gf('django.db.models.fields.BigIntegerField')(primary_key=True)),
+            ('screen_name', self.gf('django.db.models.fields.CharField')(max_length=50, db_index=True)),
+            ('name', self.gf('django.db.models.fields.CharField')(max_length=150)),
+            ('verified', self.gf('django.db.models.fields.BooleanField')(default=False)),
+            ('utc_offset', self.gf('django.db.models.fields.IntegerField')(default=None, null=True, blank=True)),
+            ('time_zone', self.gf('django.db.models.fields.CharField')(default=None, max_length=150, null=True, blank=True)),
+            ('geo_enabled', self.gf('django.db.models.fields.BooleanField')(default=False)),
+            ('location', self.gf('django.db.models.fields.CharField')(default=None, max_length=150, null=True, blank=True)),
+            ('followers_count', self.gf('django.db.models.fields.PositiveIntegerField')(null=True, blank=True)),
+            ('friends_count', self.gf('django.db.models.fields.PositiveIntegerField')(null=True, blank=True)),
+            ('updated_at', self.gf('django.db.models.fields.DateTimeField')()),
+        ))
+        db.send_create_signal(u'twitter_stream', ['TwitterUser'])
+
+
+    def backwards(self, orm):
+        # Deleting model 'TwitterUser'
+        db.delete_table(u'twitter_stream_twitteruser')
+
+
+    models = {
+        u'twitter_stream.apikey': {
+            'Meta': {'object_name': 'ApiKey'},
+            'access_token': ('django.db.models.fields.CharField', [], {'max_length': '250'}),
+            'access_token_secret': ('django.db.models.fields.CharField', [], {'max_length': '250'}),
+            'api_key': ('django.db.models.fields.CharField', [], {'max_length': '250'}),
+            'api_secret': ('django.db.models.fields.CharField', [], {'max_length': '250'}),
+            'app_name': ('django.db.models.fields.CharField', [], {'max_length': '250'}),
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'email': ('django.db.models.fields.EmailField', [], {'default': 'None', 'max_length': '75', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'user_name': ('django.db.models.fields.CharField', [], {'max_length': '250'})
+        },
+        u'twitter_stream.filterterm': {
+            'Meta': {'object_name': 'FilterTerm'},
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'enabled': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'term': ('django.db.models.fields.CharField', [], {'max_length': '250'})
+        },
+        u'twitter_stream.streamprocess': {
+            'Meta': {'object_name': 'StreamProcess'},
+            'blocked_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'dedup_checked_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'dedup_hit_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'dedup_ignored_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'dropped_newest_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'dropped_oldest_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'error_count': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'}),
+            'expires_at': ('django.db.models.fields.DateTimeField', [], {}),
+            'hostname': ('django.db.models.fields.CharField', [], {'max_length': '250'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'insert_batch_size': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'insert_rate': ('django.db.models.fields.FloatField', [], {'default': '0'}),
+            'keys': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['twitter_stream.ApiKey']", 'null': 'True'}),
+            'last_heartbeat': ('django.db.models.fields.DateTimeField', [], {}),
+            'memory_usage': ('django.db.models.fields.CharField', [], {'default': 'None', 'max_length': '30', 'null': 'True', 'blank': 'True'}),
+            'process_id': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'spilled_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'status': ('django.db.models.fields.CharField', [], {'default': "'WAITING'", 'max_length': '10'}),
+            'timeout_seconds': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'tweet_rate': ('django.db.models.fields.FloatField', [], {'default': '0'})
+        },
+        u'twitter_stream.tweet': {
+            'Meta': {'object_name': 'Tweet'},
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True'}),
+            'favorite_count': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'filter_level': ('django.db.models.fields.CharField', [], {'default': 'None', 'max_length': '6', 'null': 'True', 'blank': 'True'}),
+            'id': ('twitter_stream.fields.PositiveBigAutoField', [], {'primary_key': 'True'}),
+            'in_reply_to_status_id': ('django.db.models.fields.BigIntegerField', [], {'default': 'None', 'null': 'True', 'blank': 'True'}),
+            'lang': ('django.db.models.fields.CharField', [], {'default': 'None', 'max_length': '9', 'null': 'True', 'blank': 'True'}),
+            'latitude': ('django.db.models.fields.FloatField', [], {'default': 'None', 'null': 'True', 'blank': 'True'}),
+            'longitude': ('django.db.models.fields.FloatField', [], {'default': 'None', 'null': 'True', 'blank': 'True'}),
+            'retweet_count': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'retweeted_status_id': ('django.db.models.fields.BigIntegerField', [], {'default': 'None', 'null': 'True', 'blank': 'True'}),
+            'text': ('django.db.models.fields.CharField', [], {'max_length': '250'}),
+            'truncated': ('django.db.models.fields.BooleanField', [], {}),
+            'tweet_id': ('django.db.models.fields.BigIntegerField', [], {}),
+            'user_followers_count': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'user_friends_count': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'user_geo_enabled': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'user_id': ('django.db.models.fields.BigIntegerField', [], {}),
+            'user_location': ('django.db.models.fields.CharField', [], {'default': 'None', 'max_length': '150', 'null': 'True', 'blank': 'True'}),
+            'user_name': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'user_screen_name': ('django.db.models.fields.CharField', [], {'max_length': '50'}),
+            'user_time_zone': ('django.db.models.fields.CharField', [], {'default': 'None', 'max_length': '150', 'null': 'True', 'blank': 'True'}),
+            'user_utc_offset': ('django.db.models.fields.IntegerField', [], {'default': 'None', 'null': 'True', 'blank': 'True'}),
+            'user_verified': ('django.db.models.fields.BooleanField', [], {})
+        },
+        u'twitter_stream.twitteruser': {
+            'Meta': {'object_name': 'TwitterUser'},
+            'followers_count': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'friends_count': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'geo_enabled': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'location': ('django.db.models.fields.CharField', [], {'default': 'None', 'max_length': '150', 'null': 'True', 'blank': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'screen_name': ('django.db.models.fields.CharField', [], {'max_length': '50', 'db_index': 'True'}),
+            'time_zone': ('django.db.models.fields.CharField', [], {'default': 'None', 'max_length': '150', 'null': 'True', 'blank': 'True'}),
+            'updated_at': ('django.db.models.fields.DateTimeField', [], {}),
+            'user_id': ('django.db.models.fields.BigIntegerField', [], {'primary_key': 'True'}),
+            'utc_offset': ('django.db.models.fields.IntegerField', [], {'default': 'None', 'null': 'True', 'blank': 'True'}),
+            'verified': ('django.db.models.fields.BooleanField', [], {'default': 'False'})
+        }
+    }
+
+    complete_apps = ['twitter_stream']
\ No newline at end of file
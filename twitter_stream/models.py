@@ -1,10 +1,13 @@
-from django.db import models, connection
-from django.conf import settings as django_settings
+from django.db import models, connection, transaction, IntegrityError
 from datetime import datetime, timedelta
+from collections import Counter
 from email.utils import parsedate
 from django.utils import timezone
+from django.utils import six
+import io
 import os
 import socket
+import tempfile
 from . import settings
 from django.core.exceptions import ObjectDoesNotExist
 from swapper import swappable_setting
@@ -12,12 +15,110 @@ from . import fields
 
 current_timezone = timezone.get_current_timezone()
 
+MONTHS = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12,
+}
+
+# Recently parsed created_at strings. Tweets arrive roughly in order,
+# so when this fills up it is simply emptied and refilled.
+DATETIME_CACHE_SIZE = 4096
+_datetime_cache = {}
+
 def parse_datetime(string):
+    """
+    Parses a Twitter created_at string, like "Wed Jun 06 20:07:10 +0000 2012".
+    Many tweets share the same second, so results are cached.
+    """
+    try:
+        return _datetime_cache[string]
+    except KeyError:
+        pass
+
+    try:
+        result = _parse_twitter_datetime(string)
+    except (ValueError, KeyError):
+        result = _parse_email_datetime(string)
+
+    if len(_datetime_cache) >= DATETIME_CACHE_SIZE:
+        _datetime_cache.clear()
+    _datetime_cache[string] = result
+
+    return result
+
+def _parse_twitter_datetime(string):
+    """
+    Parses Twitter's fixed created_at format without going through
+    email.utils, and without depending on the locale.
+    """
+    if len(string) != 30 or string[3] != ' ' or string[19] != ' ' or string[25] != ' ':
+        raise ValueError("Unexpected date format: %s" % string)
+
+    # Like parsedate, this ignores the UTC offset, which is always +0000 anyway
+    fields = (int(string[26:30]), MONTHS[string[4:7]], int(string[8:10]),
+              int(string[11:13]), int(string[14:16]), int(string[17:19]))
+
+    if settings.USE_TZ:
+        return datetime(*fields, tzinfo=current_timezone)
+    else:
+        return datetime(*fields)
+
+DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+MONTH_NAMES = dict((number, name) for name, number in MONTHS.items())
+
+def format_datetime(value):
+    """
+    Formats a datetime the way Twitter does, in UTC.
+    """
+    if timezone.is_aware(value):
+        value = value.astimezone(timezone.utc)
+
+    return "%s %s %02d %02d:%02d:%02d +0000 %04d" % (
+        DAYS[value.weekday()], MONTH_NAMES[value.month], value.day,
+        value.hour, value.minute, value.second, value.year)
+
+def _parse_email_datetime(string):
     if settings.USE_TZ:
         return datetime(*(parsedate(string)[:6]), tzinfo=current_timezone)
     else:
         return datetime(*(parsedate(string)[:6]))
 
+# Escapes for the tab-separated text format read by COPY (PostgreSQL)
+# and LOAD DATA (MySQL). NUL characters are not allowed in text columns.
+TEXT_FORMAT_ESCAPES = {
+    ord(u'\\'): u'\\\\',
+    ord(u'\t'): u'\\t',
+    ord(u'\n'): u'\\n',
+    ord(u'\r'): u'\\r',
+    0: None,
+}
+
+
+def format_text_value(value):
+    """
+    Formats a column value for COPY or LOAD DATA.
+    """
+    if value is None:
+        return u'\\N'
+    if value is True:
+        return u'1'
+    if value is False:
+        return u'0'
+    if isinstance(value, float):
+        return six.text_type(repr(value))
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    elif not isinstance(value, six.text_type):
+        return six.text_type(value)
+    return value.translate(TEXT_FORMAT_ESCAPES)
+
+
+def count_or_none(count):
+    """Replace negative counts with None to indicate missing data"""
+    if count is not None and count < 0:
+        return None
+    return count
+
 class ApiKey(models.Model):
     """
     Keys for accessing the Twitter Streaming API.
@@ -79,11 +180,44 @@ class StreamProcess(models.Model):
     tweet_rate = models.FloatField(default=0)
     error_count = models.PositiveSmallIntegerField(default=0)
 
+    # Tweets affected by each of the queue overflow policies
+    blocked_count = models.PositiveIntegerField(default=0)
+    dropped_oldest_count = models.PositiveIntegerField(default=0)
+    dropped_newest_count = models.PositiveIntegerField(default=0)
+    spilled_count = models.PositiveIntegerField(default=0)
+
+    # The current insert batch size, and recent tweets / sec inserted
+    insert_batch_size = models.PositiveIntegerField(default=0)
+    insert_rate = models.FloatField(default=0)
+
+    # Tweets checked against the recently saved ids, how many of those were
+    # skipped, and how many more the database skipped (see IGNORE_DUPLICATES)
+    dedup_checked_count = models.PositiveIntegerField(default=0)
+    dedup_hit_count = models.PositiveIntegerField(default=0)
+    dedup_ignored_count = models.PositiveIntegerField(default=0)
+
     @property
     def lifetime(self):
         """Get the age of the streaming process"""
         return self.last_heartbeat - self.created_at
 
+    @property
+    def dropped_count(self):
+        """Get the number of tweets lost because the queue was full"""
+        return self.dropped_oldest_count + self.dropped_newest_count
+
+    @property
+    def duplicate_count(self):
+        """Get the number of tweets skipped because they were already saved"""
+        return self.dedup_hit_count + self.dedup_ignored_count
+
+    @property
+    def dedup_hit_rate(self):
+        """Get the fraction of tweets skipped because they were seen recently"""
+        if not self.dedup_checked_count:
+            return 0.0
+        return float(self.dedup_hit_count) / self.dedup_checked_count
+
     def get_memory_usage(self):
         try:
             import resource
@@ -137,6 +271,24 @@ class StreamProcess(models.Model):
             .update(status=StreamProcess.STREAM_STATUS_STOPPED)
 
 
+class TweetQuerySet(models.query.QuerySet):
+    """
+    Forgets the created_at watermarks of the table when tweets are deleted,
+    since the earliest or latest ones may have gone.
+    """
+
+    def delete(self):
+        super(TweetQuerySet, self).delete()
+        TweetTableStats.forget_created_range(self.model)
+    delete.alters_data = True
+
+
+class TweetManager(models.Manager):
+
+    def get_queryset(self):
+        return TweetQuerySet(self.model, using=self._db)
+
+
 class AbstractTweet(models.Model):
     """
     Selected fields from a Twitter Status object.
@@ -147,12 +299,14 @@ class AbstractTweet(models.Model):
     Note that we are not using tweet_id as a primary key -- this application
     does not enforce integrity w/ regard to individual tweets.
     We just add them to the database as they come in, even if we've seen
-    them before.
+    them before, unless DEDUP_CACHE_SIZE or IGNORE_DUPLICATES is set.
     """
 
     class Meta:
         abstract = True
 
+    objects = TweetManager()
+
     id = fields.PositiveBigAutoField(primary_key=True)
 
     # Basic tweet info
@@ -195,11 +349,33 @@ class AbstractTweet(models.Model):
     def is_retweet(self):
         return self.retweeted_status_id is not None
 
+    # The columns filled in by row_from_json(), in order
+    ROW_FIELDS = (
+        'tweet_id', 'text', 'truncated', 'lang',
+        'user_id', 'user_screen_name', 'user_name', 'user_verified',
+        'created_at', 'user_utc_offset', 'user_time_zone',
+        'filter_level',
+        'latitude', 'longitude', 'user_geo_enabled', 'user_location',
+        'favorite_count', 'retweet_count', 'user_followers_count', 'user_friends_count',
+        'in_reply_to_status_id', 'retweeted_status_id',
+    )
+
     @classmethod
     def create_from_json(cls, raw):
         """
         Given a *parsed* json status object, construct a new Tweet model.
         """
+        return cls(**dict(zip(cls.ROW_FIELDS, cls.row_from_json(raw))))
+
+    @classmethod
+    def row_from_json(cls, raw):
+        """
+        Given a *parsed* json status object, return a tuple
+        of column values in the order of ROW_FIELDS.
+
+        This is much cheaper than constructing a model instance.
+        Use bulk_insert_rows() to save the rows.
+        """
 
         user = raw['user']
         retweeted_status = raw.get('retweeted_status')
@@ -222,54 +398,368 @@ class AbstractTweet(models.Model):
         if raw['coordinates']:
             coordinates = raw['coordinates']['coordinates']
 
-        # Replace negative counts with None to indicate missing data
-        counts = {
-            'favorite_count': raw.get('favorite_count'),
-            'retweet_count': raw.get('retweet_count'),
-            'user_followers_count': user.get('followers_count'),
-            'user_friends_count': user.get('friends_count'),
-            }
-        for key in counts:
-            if counts[key] is not None and counts[key] < 0:
-                counts[key] = None
-
-        return cls(
+        row = (
             # Basic tweet info
-            tweet_id=raw['id'],
-            text=raw['text'],
-            truncated=raw['truncated'],
-            lang=raw.get('lang'),
+            raw['id'],
+            raw['text'],
+            raw['truncated'],
+            raw.get('lang'),
 
             # Basic user info
-            user_id=user['id'],
-            user_screen_name=user['screen_name'],
-            user_name=user['name'],
-            user_verified=user['verified'],
+            user['id'],
+            user['screen_name'],
+            user['name'],
+            user['verified'],
 
             # Timing parameters
-            created_at=parse_datetime(raw['created_at']),
-            user_utc_offset=user.get('utc_offset'),
-            user_time_zone=user.get('time_zone'),
+            parse_datetime(raw['created_at']),
+            user.get('utc_offset'),
+            user.get('time_zone'),
 
             # none, low, or medium
-            filter_level=raw.get('filter_level'),
+            raw.get('filter_level'),
 
             # Geo parameters
-            latitude=coordinates[1],
-            longitude=coordinates[0],
-            user_geo_enabled=user.get('geo_enabled'),
-            user_location=user.get('location'),
+            coordinates[1],
+            coordinates[0],
+            bool(user.get('geo_enabled')),
+            user.get('location'),
 
             # Engagement - not likely to be very useful for streamed tweets but whatever
-            favorite_count=counts.get('favorite_count'),
-            retweet_count=counts.get('retweet_count'),
-            user_followers_count=counts.get('user_followers_count'),
-            user_friends_count=counts.get('user_friends_count'),
+            count_or_none(raw.get('favorite_count')),
+            count_or_none(raw.get('retweet_count')),
+            count_or_none(user.get('followers_count')),
+            count_or_none(user.get('friends_count')),
 
             # Relation to other tweets
-            in_reply_to_status_id=raw.get('in_reply_to_status_id'),
-            retweeted_status_id=retweeted_status['id']
+            raw.get('in_reply_to_status_id'),
+            retweeted_status['id'],
+        )
+
+        if settings.NORMALIZE_USERS:
+            row = cls.without_user_fields(row)
+        return row
+
+    # What the user columns hold when NORMALIZE_USERS keeps users in TwitterUser instead
+    NORMALIZED_USER_VALUES = {
+        'user_screen_name': u'',
+        'user_name': u'',
+        'user_verified': False,
+        'user_utc_offset': None,
+        'user_time_zone': None,
+        'user_geo_enabled': False,
+        'user_location': None,
+        'user_followers_count': None,
+        'user_friends_count': None,
+    }
+
+    @classmethod
+    def without_user_fields(cls, row):
+        """
+        Returns a row with the user columns (other than user_id) blanked out.
+        """
+        values = cls.NORMALIZED_USER_VALUES
+        return tuple(values.get(name, value) for name, value in zip(cls.ROW_FIELDS, row))
+
+    def to_json(self, user=None):
+        """
+        Returns the tweet as a status object, like the ones from the streaming API
+        but with only the fields that are saved. create_from_json() turns it
+        back into the same tweet.
+
+        If a TwitterUser is given, the user details are taken from it instead.
+        """
+        status = {
+            'id': self.tweet_id,
+            'id_str': str(self.tweet_id),
+            'text': self.text,
+            'truncated': self.truncated,
+            'lang': self.lang,
+            'created_at': format_datetime(self.created_at),
+            'filter_level': self.filter_level,
+            'coordinates': None,
+            'favorite_count': self.favorite_count,
+            'retweet_count': self.retweet_count,
+            'in_reply_to_status_id': self.in_reply_to_status_id,
+        }
+
+        if self.latitude is not None and self.longitude is not None:
+            status['coordinates'] = {
+                'type': 'Point',
+                'coordinates': [self.longitude, self.latitude],
+            }
+
+        # Only the id of the retweeted status is known
+        if self.retweeted_status_id is not None:
+            status['retweeted_status'] = {
+                'id': self.retweeted_status_id,
+                'id_str': str(self.retweeted_status_id),
+            }
+
+        if user is not None:
+            status['user'] = {
+                'id': user.user_id,
+                'id_str': str(user.user_id),
+                'screen_name': user.screen_name,
+                'name': user.name,
+                'verified': user.verified,
+                'utc_offset': user.utc_offset,
+                'time_zone': user.time_zone,
+                'geo_enabled': user.geo_enabled,
+                'location': user.location,
+                'followers_count': user.followers_count,
+                'friends_count': user.friends_count,
+            }
+        else:
+            status['user'] = {
+                'id': self.user_id,
+                'id_str': str(self.user_id),
+                'screen_name': self.user_screen_name,
+                'name': self.user_name,
+                'verified': self.user_verified,
+                'utc_offset': self.user_utc_offset,
+                'time_zone': self.user_time_zone,
+                'geo_enabled': self.user_geo_enabled,
+                'location': self.user_location,
+                'followers_count': self.user_followers_count,
+                'friends_count': self.user_friends_count,
+            }
+
+        return status
+
+    @classmethod
+    def delete_id_range(cls, first_id, last_id, before):
+        """
+        Deletes the tweets with ids from first_id to last_id (inclusive)
+        that were created before the given datetime, with a single DELETE
+        that walks the primary key. Returns the number of tweets deleted.
+        """
+        quote_name = connection.ops.quote_name
+        sql = "DELETE FROM %s WHERE %s >= %%s AND %s <= %%s AND %s < %%s" % (
+            quote_name(cls._meta.db_table), quote_name(cls._meta.pk.column),
+            quote_name(cls._meta.pk.column), quote_name(cls._meta.get_field('created_at').column))
+        before = cls._meta.get_field('created_at').get_db_prep_save(before, connection)
+
+        with transaction.atomic():
+            cursor = connection.cursor()
+            cursor.execute(sql, [first_id, last_id, before])
+            if cursor.rowcount:
+                TweetTableStats.forget_created_range(cls)
+            return cursor.rowcount
+
+    def delete(self, using=None):
+        super(AbstractTweet, self).delete(using)
+        TweetTableStats.forget_created_range(type(self))
+
+    def get_user(self):
+        """
+        Returns the TwitterUser who posted this tweet, if NORMALIZE_USERS saved one.
+        """
+        return TwitterUser.objects.filter(user_id=self.user_id).first()
+
+    @classmethod
+    def bulk_insert_rows(cls, rows, batch_size=None, ignore_duplicates=False):
+        """
+        Inserts rows made by row_from_json() using multi-row INSERT statements,
+        without going through model instances like bulk_create() does.
+
+        Only the ROW_FIELDS columns are filled in, so if you have swapped
+        in a Tweet model with extra non-null columns, extend ROW_FIELDS
+        and row_from_json() to match.
+
+        If ignore_duplicates is true, rows that violate a unique index
+        are skipped. Returns the number of rows inserted, or None
+        if the database driver does not say.
+        """
+        if not rows:
+            return 0
+
+        opts = cls._meta
+        db_fields = [opts.get_field(name) for name in cls.ROW_FIELDS]
+
+        # Datetimes need converting for the database (e.g. to naive UTC on MySQL)
+        created_at_index = cls.ROW_FIELDS.index('created_at')
+        created_at_field = db_fields[created_at_index]
+
+        # Respect the database's limit on query parameters
+        max_batch_size = max(connection.ops.bulk_batch_size(db_fields, rows), 1)
+        batch_size = min(batch_size or max_batch_size, max_batch_size)
+
+        quote_name = connection.ops.quote_name
+        insert, suffix = "INSERT", ""
+        if ignore_duplicates:
+            if connection.vendor not in cls.IGNORE_DUPLICATES_SQL:
+                raise ValueError("Cannot ignore duplicates on %s" % connection.vendor)
+            insert, suffix = cls.IGNORE_DUPLICATES_SQL[connection.vendor]
+        sql = "%s INTO %s (%s) VALUES " % (
+            insert,
+            quote_name(opts.db_table),
+            ", ".join(quote_name(f.column) for f in db_fields)
         )
+        placeholder = "(%s)" % ", ".join(["%s"] * len(db_fields))
+
+        inserted = 0
+        with transaction.atomic():
+            cursor = connection.cursor()
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+
+                params = []
+                for row in batch:
+                    row = list(row)
+                    row[created_at_index] = created_at_field.get_db_prep_save(row[created_at_index], connection)
+                    params.extend(row)
+
+                cursor.execute(sql + ", ".join([placeholder] * len(batch)) + suffix, params)
+                if inserted is not None and cursor.rowcount >= 0:
+                    inserted += cursor.rowcount
+                else:
+                    inserted = None
+
+        return inserted
+
+    # How each database skips rows that are already there: (statement, suffix)
+    IGNORE_DUPLICATES_SQL = {
+        'postgresql': ("INSERT", " ON CONFLICT DO NOTHING"),
+        'mysql': ("INSERT IGNORE", ""),
+        'sqlite': ("INSERT OR IGNORE", ""),
+    }
+
+    INSERT_BACKENDS = ('bulk_create', 'insert', 'copy', 'load_data')
+
+    @classmethod
+    def get_insert_backend(cls):
+        """
+        Returns the name of the insert backend to use,
+        based on the INSERT_BACKEND setting and the database engine:
+
+        bulk_create: model instances saved with bulk_create()
+        insert: rows saved with multi-row INSERTs (bulk_insert_rows())
+        copy: rows saved with COPY FROM STDIN (PostgreSQL only)
+        load_data: rows saved with LOAD DATA LOCAL INFILE (MySQL only)
+
+        With IGNORE_DUPLICATES, bulk_create and copy become insert,
+        since they cannot skip rows that are already there.
+        """
+        backend = settings.INSERT_BACKEND
+        if backend is None:
+            backend = 'insert' if settings.FAST_INSERT else 'bulk_create'
+
+        elif backend == 'auto':
+            backend = 'copy' if connection.vendor == 'postgresql' else 'insert'
+
+        elif backend not in cls.INSERT_BACKENDS:
+            raise ValueError("Unknown insert backend %s" % backend)
+
+        if settings.IGNORE_DUPLICATES and backend in ('bulk_create', 'copy'):
+            backend = 'insert'
+        return backend
+
+    @classmethod
+    def insert_rows(cls, rows, batch_size=None, backend=None):
+        """
+        Saves rows made by row_from_json() with the given backend
+        (by default, the one from get_insert_backend()).
+
+        Returns the number of rows inserted, which is less than len(rows)
+        if IGNORE_DUPLICATES skipped some, or None if it is not known.
+        """
+        if backend is None:
+            backend = cls.get_insert_backend()
+
+        ignore_duplicates = settings.IGNORE_DUPLICATES
+        if backend == 'copy':
+            cls.copy_rows(rows)
+        elif backend == 'load_data':
+            return cls.load_data_rows(rows, ignore_duplicates)
+        elif backend == 'insert':
+            return cls.bulk_insert_rows(rows, batch_size, ignore_duplicates)
+        else:
+            fields = cls.ROW_FIELDS
+            cls.objects.bulk_create([cls(**dict(zip(fields, row))) for row in rows], batch_size)
+        return len(rows)
+
+    @classmethod
+    def max_statement_rows(cls, rows, backend=None):
+        """
+        Returns how many of the rows the given backend can insert per statement.
+        Bigger batches are split up by bulk_create() and bulk_insert_rows(),
+        e.g. to keep under SQLite's limit on query parameters.
+        """
+        if backend is None:
+            backend = cls.get_insert_backend()
+
+        if backend in ('bulk_create', 'insert'):
+            db_fields = [cls._meta.get_field(name) for name in cls.ROW_FIELDS]
+            return max(min(connection.ops.bulk_batch_size(db_fields, rows), len(rows)), 1)
+        return max(len(rows), 1)
+
+    @classmethod
+    def format_text_rows(cls, rows):
+        """
+        Returns rows made by row_from_json() as UTF-8 encoded, tab-separated text,
+        one row per line, the way COPY and LOAD DATA read them by default.
+        """
+        created_at_index = cls.ROW_FIELDS.index('created_at')
+        created_at_field = cls._meta.get_field('created_at')
+
+        lines = []
+        for row in rows:
+            row = list(row)
+            row[created_at_index] = created_at_field.get_db_prep_save(row[created_at_index], connection)
+            lines.append(u'\t'.join([format_text_value(value) for value in row]))
+
+        lines.append(u'')
+        return u'\n'.join(lines).encode('utf-8')
+
+    @classmethod
+    def _row_columns_sql(cls):
+        quote_name = connection.ops.quote_name
+        opts = cls._meta
+        return quote_name(opts.db_table), ", ".join(quote_name(opts.get_field(name).column)
+                                                    for name in cls.ROW_FIELDS)
+
+    @classmethod
+    def copy_rows(cls, rows):
+        """
+        Saves rows made by row_from_json() with a single COPY FROM STDIN.
+        PostgreSQL only (through psycopg2's copy_expert).
+        """
+        if not rows:
+            return
+
+        sql = "COPY %s (%s) FROM STDIN" % cls._row_columns_sql()
+        data = io.BytesIO(cls.format_text_rows(rows))
+
+        with transaction.atomic():
+            cursor = connection.cursor()
+            cursor.copy_expert(sql, data)
+
+    @classmethod
+    def load_data_rows(cls, rows, ignore_duplicates=False):
+        """
+        Saves rows made by row_from_json() with LOAD DATA LOCAL INFILE,
+        from a temporary file. MySQL only, and local_infile must be
+        enabled on the server and in the connection OPTIONS.
+
+        If ignore_duplicates is true, rows that violate a unique index
+        are skipped. Returns the number of rows inserted.
+        """
+        if not rows:
+            return 0
+
+        sql = ("LOAD DATA LOCAL INFILE %%s %sINTO TABLE %s CHARACTER SET utf8mb4 "
+               "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' (%s)")
+        sql = sql % (("IGNORE " if ignore_duplicates else ""),) + cls._row_columns_sql()
+
+        with tempfile.NamedTemporaryFile(prefix='tweets-', suffix='.tsv') as datafile:
+            datafile.write(cls.format_text_rows(rows))
+            datafile.flush()
+
+            with transaction.atomic():
+                cursor = connection.cursor()
+                cursor.execute(sql, [datafile.name])
+                return cursor.rowcount
 
     @classmethod
     def get_created_in_range(cls, start, end):
@@ -281,35 +771,92 @@ class AbstractTweet(models.Model):
     @classmethod
     def get_earliest_created_at(cls):
         """
-        Returns the earliest created_at time, or None
+        Returns the earliest created_at time, or None.
+        Uses the watermark kept by the stream, if there is one.
         """
+        earliest, latest = TweetTableStats.get_created_range(cls)
+        if earliest is not None:
+            return earliest
+
         result = cls.objects.aggregate(earliest_created_at=models.Min('created_at'))
         return result['earliest_created_at']
 
     @classmethod
     def get_latest_created_at(cls):
         """
-        Returns the latest created_at time, or None
+        Returns the latest created_at time, or None.
+        Uses the watermark kept by the stream, if there is one.
         """
+        earliest, latest = TweetTableStats.get_created_range(cls)
+        if latest is not None:
+            return latest
+
         result = cls.objects.aggregate(latest_created_at=models.Max('created_at'))
         return result['latest_created_at']
 
     @classmethod
     def count_approx(cls):
         """
-        Get the approximate number of tweets.
-        Executes quickly, even on large InnoDB tables.
+        Get the approximate number of tweets, from the source
+        in the COUNT_APPROX_SOURCE setting. Executes quickly,
+        even on large tables, unless the source is 'exact'.
         """
-        if django_settings.DATABASES['default']['ENGINE'].endswith('mysql'):
+        source = settings.COUNT_APPROX_SOURCE
+        if source == 'exact':
+            return cls.objects.count()
+
+        if source == 'counter':
+            count = TweetTableStats.get_tweet_count(cls)
+            if count is not None:
+                return count
+
+        return cls.count_estimate()
+
+    # The statistics of the table and any partitions it has. n_live_tup is kept
+    # up to date as rows change, but is lost if the statistics are reset,
+    # so fall back to reltuples (as of the last ANALYZE, or -1 if never)
+    POSTGRES_COUNT_SQL = (
+        "SELECT SUM(CASE WHEN stats.n_live_tup > 0 THEN stats.n_live_tup "
+        "ELSE GREATEST(pg_class.reltuples, 0) END) "
+        "FROM pg_class LEFT JOIN pg_stat_user_tables stats ON stats.relid = pg_class.oid "
+        "WHERE pg_class.relkind = 'r' AND (pg_class.oid = %s::regclass OR pg_class.oid IN "
+        "(SELECT inhrelid FROM pg_inherits WHERE inhparent = %s::regclass))"
+    )
+
+    @classmethod
+    def count_estimate(cls):
+        """
+        Estimates the number of tweets from what the database already knows:
+        the table status on MySQL, the table statistics on PostgreSQL,
+        or the range of ids on SQLite (which counts deleted and skipped tweets too).
+        Other databases count the tweets.
+        """
+        table = cls._meta.db_table
+        quote_name = connection.ops.quote_name
+
+        if connection.vendor == 'mysql':
             query = "SHOW TABLE STATUS WHERE Name = %s"
             cursor = connection.cursor()
-            cursor.execute(query, [cls._meta.db_table])
+            cursor.execute(query, [table])
 
             desc = cursor.description
             row = cursor.fetchone()
             row = dict(zip([col[0].lower() for col in desc], row))
 
             return int(row['rows'])
+
+        elif connection.vendor == 'postgresql':
+            cursor = connection.cursor()
+            cursor.execute(cls.POSTGRES_COUNT_SQL, [quote_name(table)] * 2)
+            return int(cursor.fetchone()[0] or 0)
+
+        elif connection.vendor == 'sqlite':
+            # Both ends of the primary key index, without a scan
+            pk = quote_name(cls._meta.pk.column)
+            cursor = connection.cursor()
+            cursor.execute("SELECT MAX(%s) - MIN(%s) + 1 FROM %s" % (pk, pk, quote_name(table)))
+            return int(cursor.fetchone()[0] or 0)
+
         else:
             return cls.objects.count()
 
@@ -327,6 +874,372 @@ class Tweet(AbstractTweet):
         swappable = swappable_setting('twitter_stream', 'Tweet')
 
 
+class TwitterUser(models.Model):
+    """
+    The latest known details of a Twitter user.
+
+    Only filled in if NORMALIZE_USERS is on, in which case tweets
+    only keep the user_id, and their other user columns are left blank.
+    A user is saved again whenever any of these fields change.
+    """
+
+    user_id = models.BigIntegerField(primary_key=True)
+    screen_name = models.CharField(max_length=50, db_index=True)
+    name = models.CharField(max_length=150)
+    verified = models.BooleanField(default=False)
+
+    utc_offset = models.IntegerField(null=True, blank=True, default=None)
+    time_zone = models.CharField(max_length=150, null=True, blank=True, default=None)
+
+    geo_enabled = models.BooleanField(default=False)
+    location = models.CharField(max_length=150, null=True, blank=True, default=None)
+
+    followers_count = models.PositiveIntegerField(null=True, blank=True)
+    friends_count = models.PositiveIntegerField(null=True, blank=True)
+
+    # When these details were last saved
+    updated_at = models.DateTimeField()
+
+    def __unicode__(self):
+        return self.screen_name
+
+    # The columns filled in by row_from_json(), in order
+    ROW_FIELDS = (
+        'user_id', 'screen_name', 'name', 'verified',
+        'utc_offset', 'time_zone',
+        'geo_enabled', 'location',
+        'followers_count', 'friends_count',
+    )
+
+    @classmethod
+    def row_from_json(cls, user):
+        """
+        Given a *parsed* json user object, return a tuple
+        of column values in the order of ROW_FIELDS.
+        """
+        return (
+            user['id'],
+            user['screen_name'],
+            user['name'],
+            user['verified'],
+            user.get('utc_offset'),
+            user.get('time_zone'),
+            bool(user.get('geo_enabled')),
+            user.get('location'),
+            count_or_none(user.get('followers_count')),
+            count_or_none(user.get('friends_count')),
+        )
+
+    # How each database updates the rows that are already there
+    UPSERT_SQL = {
+        'postgresql': ("INSERT", " ON CONFLICT (%(pk)s) DO UPDATE SET %(updates)s", "%(column)s = EXCLUDED.%(column)s"),
+        'mysql': ("INSERT", " ON DUPLICATE KEY UPDATE %(updates)s", "%(column)s = VALUES(%(column)s)"),
+        'sqlite': ("INSERT OR REPLACE", "", None),
+    }
+
+    @classmethod
+    def upsert_rows(cls, rows):
+        """
+        Inserts rows made by row_from_json(), replacing any users already saved.
+        Each user_id should only appear once.
+        """
+        if not rows:
+            return
+
+        now = timezone.now()
+        opts = cls._meta
+        db_fields = [opts.get_field(name) for name in cls.ROW_FIELDS + ('updated_at',)]
+        updated_at = db_fields[-1].get_db_prep_save(now, connection)
+
+        if connection.vendor not in cls.UPSERT_SQL:
+            # Slow but portable
+            with transaction.atomic():
+                for row in rows:
+                    values = dict(zip(cls.ROW_FIELDS, row), updated_at=now)
+                    user_id = values.pop('user_id')
+                    if not cls.objects.filter(user_id=user_id).update(**values):
+                        cls.objects.create(user_id=user_id, **values)
+            return
+
+        quote_name = connection.ops.quote_name
+        insert, suffix, update = cls.UPSERT_SQL[connection.vendor]
+        if update:
+            suffix = suffix % {
+                'pk': quote_name(opts.pk.column),
+                'updates': ", ".join(update % {'column': quote_name(f.column)}
+                                     for f in db_fields if not f.primary_key),
+            }
+
+        sql = "%s INTO %s (%s) VALUES " % (
+            insert,
+            quote_name(opts.db_table),
+            ", ".join(quote_name(f.column) for f in db_fields)
+        )
+        placeholder = "(%s)" % ", ".join(["%s"] * len(db_fields))
+        batch_size = max(connection.ops.bulk_batch_size(db_fields, rows), 1)
+
+        with transaction.atomic():
+            cursor = connection.cursor()
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+
+                params = []
+                for row in batch:
+                    params.extend(row)
+                    params.append(updated_at)
+
+                cursor.execute(sql + ", ".join([placeholder] * len(batch)) + suffix, params)
+
+
+class TweetCount(models.Model):
+    """
+    The number of tweets created in each minute, and in each hour.
+
+    Kept up to date as tweets are inserted if COUNT_ROLLUPS is on,
+    so the status page does not have to count the tweet table,
+    and as archive_tweets and partition_tweets remove tweets.
+    Use the rebuild_tweet_counts command to count the tweets already saved.
+    """
+
+    class Meta:
+        unique_together = (('resolution', 'bucket'),)
+
+    MINUTE = 60
+    HOUR = 3600
+    RESOLUTIONS = (MINUTE, HOUR)
+
+    # Seconds per bucket, and when the bucket starts
+    resolution = models.PositiveIntegerField()
+    bucket = models.DateTimeField()
+
+    count = models.BigIntegerField(default=0)
+
+    def __unicode__(self):
+        return "%s: %d" % (self.bucket, self.count)
+
+    @classmethod
+    def bucket_start(cls, created_at, resolution):
+        if resolution == cls.HOUR:
+            return created_at.replace(minute=0, second=0, microsecond=0)
+        return created_at.replace(second=0, microsecond=0)
+
+    @classmethod
+    def bucket_counts(cls, created_ats):
+        """
+        Returns a Counter of tweets per (resolution, bucket) for the given datetimes.
+        """
+        counts = Counter()
+        for created_at in created_ats:
+            for resolution in cls.RESOLUTIONS:
+                counts[resolution, cls.bucket_start(created_at, resolution)] += 1
+        return counts
+
+    @classmethod
+    def add_counts(cls, created_ats):
+        """
+        Counts tweets created at the given datetimes.
+        Costs a query or two per bucket, however many tweets there are.
+        """
+        counts = cls.bucket_counts(created_ats)
+
+        with transaction.atomic():
+            for (resolution, bucket), count in sorted(counts.items()):
+                cls.add_count(resolution, bucket, count)
+
+    @classmethod
+    def remove_counts(cls, created_ats):
+        """
+        Stops counting tweets created at the given datetimes,
+        e.g. once they have been deleted. Buckets left empty are deleted.
+        """
+        counts = cls.bucket_counts(created_ats)
+        if not counts:
+            return
+
+        with transaction.atomic():
+            for (resolution, bucket), count in sorted(counts.items()):
+                cls.objects.filter(resolution=resolution, bucket=bucket).update(count=models.F('count') - count)
+
+            buckets = [bucket for resolution, bucket in counts]
+            cls.objects.filter(bucket__gte=min(buckets), bucket__lte=max(buckets), count__lte=0).delete()
+
+    @classmethod
+    def remove_range(cls, start, end):
+        """
+        Forgets the counts of tweets created from start (inclusive) to end
+        (exclusive), e.g. once their partition has been dropped.
+        Both should be on the hour, since only whole buckets are removed.
+        """
+        cls.objects.filter(bucket__gte=start, bucket__lt=end).delete()
+
+    @classmethod
+    def add_count(cls, resolution, bucket, count):
+        buckets = cls.objects.filter(resolution=resolution, bucket=bucket)
+        if buckets.update(count=models.F('count') + count):
+            return
+
+        try:
+            with transaction.atomic():
+                cls.objects.create(resolution=resolution, bucket=bucket, count=count)
+        except IntegrityError:
+            # Another process created it first
+            buckets.update(count=models.F('count') + count)
+
+    @classmethod
+    def get_timeline(cls, start, end=None, resolution=MINUTE):
+        """
+        Returns a list of {'time', 'tweets'} dicts for the buckets
+        from start (inclusive) to end (exclusive), in order.
+        Buckets with no tweets are left out.
+        """
+        buckets = cls.objects.filter(resolution=resolution, bucket__gte=start)
+        if end is not None:
+            buckets = buckets.filter(bucket__lt=end)
+
+        return [{'time': bucket, 'tweets': count}
+                for bucket, count in buckets.order_by('bucket').values_list('bucket', 'count')]
+
+    @classmethod
+    def get_average_rate(cls):
+        """
+        Returns the average tweets / second between the first and last minute
+        with any tweets, or None if nothing has been counted.
+        """
+        minutes = cls.objects.filter(resolution=cls.MINUTE)
+        span = minutes.aggregate(first=models.Min('bucket'), last=models.Max('bucket'))
+        if span['first'] is None:
+            return None
+
+        total = cls.objects.filter(resolution=cls.HOUR).aggregate(total=models.Sum('count'))['total']
+        seconds = (span['last'] - span['first']).total_seconds() + cls.MINUTE
+        return float(total or 0) / seconds
+
+
+class TweetTableStats(models.Model):
+    """
+    Running figures about a tweet table, kept by the stream as it inserts
+    tweets, so the status page does not have to look through the table.
+
+    The tweet count is only kept if COUNT_APPROX_SOURCE is 'counter'.
+    It is reduced by archive_tweets, but not by dropping partitions;
+    use the rebuild_tweet_counts command to count the tweets again.
+
+    The earliest and latest created_at watermarks are always kept,
+    starting from the tweets in the table when the stream first inserts.
+    Deleting tweets clears them, and the stream sets them again.
+    """
+
+    table_name = models.CharField(max_length=250, primary_key=True)
+    tweet_count = models.BigIntegerField(default=0)
+
+    earliest_created_at = models.DateTimeField(null=True, blank=True, default=None)
+    latest_created_at = models.DateTimeField(null=True, blank=True, default=None)
+
+    def __unicode__(self):
+        return "%s: %d tweets" % (self.table_name, self.tweet_count)
+
+    @classmethod
+    def add_tweets(cls, Tweet, count):
+        """
+        Adds to the tweet count of the table of the given Tweet model
+        (or subtracts, if count is negative).
+        """
+        if not count:
+            return
+
+        stats = cls.objects.filter(table_name=Tweet._meta.db_table)
+        if stats.update(tweet_count=models.F('tweet_count') + count):
+            return
+
+        try:
+            with transaction.atomic():
+                cls.objects.create(table_name=Tweet._meta.db_table, tweet_count=max(count, 0))
+        except IntegrityError:
+            # Another process created it first
+            stats.update(tweet_count=models.F('tweet_count') + count)
+
+    @classmethod
+    def set_tweet_count(cls, Tweet, count):
+        if not cls.objects.filter(table_name=Tweet._meta.db_table).update(tweet_count=count):
+            cls.objects.create(table_name=Tweet._meta.db_table, tweet_count=count)
+
+    @classmethod
+    def get_tweet_count(cls, Tweet):
+        """
+        Returns the running count of tweets in the Tweet model's table,
+        or None if there is none.
+        """
+        counts = cls.objects.filter(table_name=Tweet._meta.db_table).values_list('tweet_count', flat=True)
+        for count in counts:
+            return count
+        return None
+
+    @classmethod
+    def extend_created_range(cls, Tweet, earliest=None, latest=None):
+        """
+        Moves the watermarks of the Tweet model's table out to the given
+        created_at times, if they are not already further out.
+
+        Returns False if there are no watermarks to move (yet, or since tweets
+        were deleted). They then need setting with refresh_created_range(),
+        which looks through the table, so best not inside a long transaction.
+        """
+        stats = cls.objects.filter(table_name=Tweet._meta.db_table)
+
+        updated = 0
+        if latest is not None:
+            updated += stats.filter(latest_created_at__lt=latest).update(latest_created_at=latest)
+        if earliest is not None:
+            updated += stats.filter(earliest_created_at__gt=earliest).update(earliest_created_at=earliest)
+
+        return bool(updated) or stats.filter(latest_created_at__isnull=False).exists()
+
+    @classmethod
+    def refresh_created_range(cls, Tweet):
+        """
+        Sets the watermarks from the earliest and latest tweets in the table,
+        e.g. after deleting tweets.
+        """
+        result = Tweet.objects.aggregate(earliest=models.Min('created_at'),
+                                         latest=models.Max('created_at'))
+        values = {
+            'earliest_created_at': result['earliest'],
+            'latest_created_at': result['latest'],
+        }
+
+        stats = cls.objects.filter(table_name=Tweet._meta.db_table)
+        if stats.update(**values):
+            return
+
+        try:
+            with transaction.atomic():
+                cls.objects.create(table_name=Tweet._meta.db_table, **values)
+        except IntegrityError:
+            # Another process created it first
+            stats.update(**values)
+
+    @classmethod
+    def forget_created_range(cls, Tweet):
+        """
+        Clears the watermarks, e.g. after deleting tweets, until the stream
+        sets them again. Meanwhile, the table itself is looked at instead.
+        """
+        cls.objects.filter(table_name=Tweet._meta.db_table) \
+            .update(earliest_created_at=None, latest_created_at=None)
+
+    @classmethod
+    def get_created_range(cls, Tweet):
+        """
+        Returns the earliest and latest created_at watermarks of the
+        Tweet model's table, which are None if they are not known.
+        """
+        ranges = cls.objects.filter(table_name=Tweet._meta.db_table) \
+            .values_list('earliest_created_at', 'latest_created_at')
+        for created_range in ranges:
+            return created_range
+        return None, None
+
+
 class FilterTerm(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     term = models.CharField(max_length=250)
@@ -0,0 +1,406 @@
+"""
+Range partitioning of the tweet table by created_at, on PostgreSQL and MySQL.
+
+Each partition holds a day (or a week) of tweets, in UTC, and is named after
+the day it starts on, e.g. twitter_stream_tweet_p20140301 on PostgreSQL or
+p20140301 on MySQL. Queries on created_at only touch the partitions they need,
+and old tweets are removed by dropping whole partitions instead of deleting rows.
+
+Tweets from before the table was partitioned are kept in a "legacy" partition,
+which also covers the rest of the interval of the latest of them, so that
+regular partitions only start after it. Tweets that fall outside every partition
+go to a catch-all partition, so inserts never fail for lack of a partition.
+Neither is ever dropped.
+"""
+
+import re
+from datetime import datetime, timedelta
+
+from django.db import connection, models
+from django.utils import timezone
+
+from . import settings
+
+__all__ = ['INTERVALS', 'partition_start', 'get_partitioner',
+           'PostgresPartitioner', 'MySQLPartitioner']
+
+INTERVALS = ('day', 'week')
+
+
+def partition_start(day, interval):
+    """
+    Returns the first day of the partition that a date falls in.
+    Weekly partitions start on Mondays.
+    """
+    if isinstance(day, datetime):
+        day = day.date()
+
+    if interval == 'week':
+        return day - timedelta(days=day.weekday())
+    elif interval == 'day':
+        return day
+    raise ValueError("Unknown partition interval %s" % interval)
+
+
+def partition_length(interval):
+    return timedelta(weeks=1) if interval == 'week' else timedelta(days=1)
+
+
+class Partitioner(object):
+    """
+    Generates and runs the SQL for managing the partitions of a tweet table.
+    Subclasses fill in the SQL for each database.
+    """
+
+    vendor = None
+
+    # Partitions that are never dropped
+    LEGACY = 'legacy'
+    CATCH_ALL = 'future'
+
+    def __init__(self, model, interval='day'):
+        if interval not in INTERVALS:
+            raise ValueError("Unknown partition interval %s" % interval)
+
+        self.model = model
+        self.interval = interval
+        self.table = model._meta.db_table
+        self.quote_name = connection.ops.quote_name
+
+    def partition_name(self, start):
+        return 'p%s' % start.strftime('%Y%m%d')
+
+    def partition_start_from_name(self, name):
+        """
+        Returns the first day of the partition with the given name,
+        or None if it is not one of ours (e.g. the legacy partition).
+        """
+        match = re.search(r'p(\d{8})$', name)
+        if not match:
+            return None
+        return datetime.strptime(match.group(1), '%Y%m%d').date()
+
+    def created_range(self, name):
+        """
+        Returns the first created_at in the partition with the given name
+        and the one just after it (midnights in UTC), or None if it is not one of ours.
+        """
+        start = self.partition_start_from_name(name)
+        if start is None:
+            return None
+
+        start = datetime(start.year, start.month, start.day)
+        end = start + partition_length(self.interval)
+        if settings.USE_TZ:
+            start, end = timezone.make_aware(start, timezone.utc), timezone.make_aware(end, timezone.utc)
+        return start, end
+
+    def bound(self, day):
+        """
+        Returns an SQL literal for midnight UTC on the given day.
+        """
+        return "'%s 00:00:00'" % day.isoformat()
+
+    def parse_bound(self, text):
+        """
+        Returns the day of a partition bound as the database shows it,
+        e.g. "FOR VALUES FROM (MINVALUE) TO ('2014-03-02 00:00:00')", or None.
+        """
+        match = re.search(r"'(\d{4}-\d{2}-\d{2})", text or '')
+        if not match:
+            return None
+        return datetime.strptime(match.group(1), '%Y-%m-%d').date()
+
+    def latest_created_at(self):
+        result = self.model.objects.aggregate(latest=models.Max('created_at'))
+        latest = result['latest']
+        if latest is not None and timezone.is_aware(latest):
+            latest = latest.astimezone(timezone.utc)
+        return latest
+
+    def legacy_end_for(self, today):
+        """
+        Returns the day the legacy partition should end on, when setting up:
+        the start of today's partition, or if there are tweets from later on,
+        the start of the partition after the latest of them.
+        """
+        end = partition_start(today, self.interval)
+
+        latest = self.latest_created_at()
+        if latest is not None:
+            end = max(end, partition_start(latest, self.interval) + partition_length(self.interval))
+        return end
+
+    def plan(self, today, ahead, retention_days=None):
+        """
+        Returns the start days of the partitions to create, so that there is one
+        for today and each of the next 'ahead' intervals (except where the
+        legacy partition still covers them), and the names of the
+        existing partitions that ended over 'retention_days' days ago.
+        """
+        existing = self.existing_partitions()
+        length = partition_length(self.interval)
+        legacy_end = self.legacy_end()
+
+        start = partition_start(today, self.interval)
+        wanted = [start + length * i for i in range(ahead + 1)]
+        to_create = [day for day in wanted if day not in existing.values() and
+                     (legacy_end is None or day >= legacy_end)]
+
+        to_drop = []
+        if retention_days is not None:
+            cutoff = today - timedelta(days=retention_days)
+            to_drop = sorted(name for name, day in existing.items()
+                             if day + length <= cutoff)
+
+        return to_create, to_drop
+
+    def existing_partitions(self):
+        """
+        Returns a dict of partition names and the days they start on.
+        """
+        partitions = {}
+        for name in self.partition_names():
+            start = self.partition_start_from_name(name)
+            if start is not None:
+                partitions[name] = start
+        return partitions
+
+    def execute(self, statements):
+        cursor = connection.cursor()
+        for sql in statements:
+            cursor.execute(sql)
+
+    def partition_names(self):
+        raise NotImplementedError()
+
+    def is_partitioned(self):
+        raise NotImplementedError()
+
+    def legacy_end(self):
+        """
+        Returns the day the legacy partition ends on, or None if there is none.
+        """
+        raise NotImplementedError()
+
+    def setup_sql(self, today):
+        """
+        Returns the statements that turn the existing table into a partitioned one,
+        keeping the existing tweets in the legacy partition (see legacy_end_for()).
+        """
+        raise NotImplementedError()
+
+    def create_sql(self, days):
+        raise NotImplementedError()
+
+    def drop_sql(self, name):
+        raise NotImplementedError()
+
+    def detach_sql(self, name):
+        """
+        Returns the statements that take a partition out of the table
+        and keep it as a table of its own, for archiving.
+        """
+        raise NotImplementedError()
+
+
+class PostgresPartitioner(Partitioner):
+    """
+    Declarative partitioning, which needs PostgreSQL 11 or later.
+    Partitions are tables of their own, named after the parent table.
+    """
+
+    vendor = 'postgresql'
+
+    def partition_name(self, start):
+        return '%s_%s' % (self.table, super(PostgresPartitioner, self).partition_name(start))
+
+    def bound(self, day):
+        if settings.USE_TZ:
+            return "'%s 00:00:00+00'" % day.isoformat()
+        return super(PostgresPartitioner, self).bound(day)
+
+    def partition_names(self):
+        cursor = connection.cursor()
+        cursor.execute("SELECT child.relname FROM pg_inherits "
+                       "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                       "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                       "WHERE parent.relname = %s", [self.table])
+        return [row[0] for row in cursor.fetchall()]
+
+    def is_partitioned(self):
+        cursor = connection.cursor()
+        cursor.execute("SELECT 1 FROM pg_partitioned_table "
+                       "JOIN pg_class ON pg_class.oid = pg_partitioned_table.partrelid "
+                       "WHERE pg_class.relname = %s", [self.table])
+        return cursor.fetchone() is not None
+
+    def legacy_end(self):
+        cursor = connection.cursor()
+        cursor.execute("SELECT pg_get_expr(relpartbound, oid) FROM pg_class WHERE relname = %s",
+                       ['%s_%s' % (self.table, self.LEGACY)])
+        row = cursor.fetchone()
+        return self.parse_bound(row[0]) if row else None
+
+    def id_sequence(self):
+        cursor = connection.cursor()
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [self.table])
+        return cursor.fetchone()[0]
+
+    def setup_sql(self, today):
+        legacy_end = self.legacy_end_for(today)
+        qn = self.quote_name
+        table = qn(self.table)
+        legacy = qn('%s_%s' % (self.table, self.LEGACY))
+
+        # The id sequence has to outlive the old table
+        sequence = self.id_sequence()
+
+        statements = [
+            "ALTER TABLE %s RENAME TO %s" % (table, legacy),
+            "CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            "PARTITION BY RANGE (%s)" % (table, legacy, qn('created_at')),
+            # Unique keys have to include the partitioning column.
+            # (The old table keeps the names of its own constraints and indexes.)
+            "ALTER TABLE %s ADD CONSTRAINT %s PRIMARY KEY (%s, %s)"
+            % (table, qn('%s_part_pkey' % self.table), qn('id'), qn('created_at')),
+            "CREATE INDEX %s ON %s (%s)" % (qn('%s_part_created_at' % self.table), table, qn('created_at')),
+        ]
+        if sequence:
+            statements.append("ALTER SEQUENCE %s OWNED BY %s.%s" % (sequence, table, qn('id')))
+        statements += [
+            "ALTER TABLE %s ATTACH PARTITION %s FOR VALUES FROM (MINVALUE) TO (%s)"
+            % (table, legacy, self.bound(legacy_end)),
+            "CREATE TABLE %s PARTITION OF %s DEFAULT"
+            % (qn('%s_%s' % (self.table, self.CATCH_ALL)), table),
+        ]
+        return statements
+
+    def catch_all_has_rows(self, start, end):
+        """
+        Returns True if the catch-all partition has tweets between the given days.
+        """
+        qn = self.quote_name
+        cursor = connection.cursor()
+        cursor.execute("SELECT 1 FROM %s WHERE %s >= %s AND %s < %s LIMIT 1" % (
+            qn('%s_%s' % (self.table, self.CATCH_ALL)),
+            qn('created_at'), self.bound(start), qn('created_at'), self.bound(end)))
+        return cursor.fetchone() is not None
+
+    def create_sql(self, days):
+        qn = self.quote_name
+        table = qn(self.table)
+        catch_all = qn('%s_%s' % (self.table, self.CATCH_ALL))
+        length = partition_length(self.interval)
+
+        statements = []
+        for day in days:
+            partition = qn(self.partition_name(day))
+            start, end = self.bound(day), self.bound(day + length)
+
+            if not self.catch_all_has_rows(day, day + length):
+                statements.append("CREATE TABLE %s PARTITION OF %s FOR VALUES FROM (%s) TO (%s)"
+                                  % (partition, table, start, end))
+                continue
+
+            # A partition cannot be added while the catch-all partition has tweets
+            # that belong in it (e.g. if the command was not run for a while),
+            # so move them into it first
+            in_range = "%s >= %s AND %s < %s" % (qn('created_at'), start, qn('created_at'), end)
+            statements += [
+                "CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS INCLUDING CONSTRAINTS)" % (partition, table),
+                "INSERT INTO %s SELECT * FROM %s WHERE %s" % (partition, catch_all, in_range),
+                "DELETE FROM %s WHERE %s" % (catch_all, in_range),
+                "ALTER TABLE %s ATTACH PARTITION %s FOR VALUES FROM (%s) TO (%s)"
+                % (table, partition, start, end),
+            ]
+        return statements
+
+    def drop_sql(self, name):
+        return ["DROP TABLE %s" % self.quote_name(name)]
+
+    def detach_sql(self, name):
+        return ["ALTER TABLE %s DETACH PARTITION %s" % (self.quote_name(self.table), self.quote_name(name))]
+
+
+class MySQLPartitioner(Partitioner):
+    """
+    RANGE COLUMNS partitioning on created_at (stored as UTC by Django).
+    The catch-all partition is split to add new partitions, which moves
+    any tweets in it to the new ones, and is quick as long as it is empty.
+    """
+
+    vendor = 'mysql'
+
+    def partition_names(self):
+        cursor = connection.cursor()
+        cursor.execute("SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s "
+                       "AND PARTITION_NAME IS NOT NULL", [self.table])
+        return [row[0] for row in cursor.fetchall()]
+
+    def is_partitioned(self):
+        return bool(self.partition_names())
+
+    def legacy_end(self):
+        cursor = connection.cursor()
+        cursor.execute("SELECT PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s "
+                       "AND PARTITION_NAME = %s", [self.table, 'p_%s' % self.LEGACY])
+        row = cursor.fetchone()
+        return self.parse_bound(row[0]) if row else None
+
+    def setup_sql(self, today):
+        legacy_end = self.legacy_end_for(today)
+        qn = self.quote_name
+        table = qn(self.table)
+        return [
+            # Unique keys have to include the partitioning column
+            "ALTER TABLE %s DROP PRIMARY KEY, ADD PRIMARY KEY (%s, %s)" % (table, qn('id'), qn('created_at')),
+            "ALTER TABLE %s PARTITION BY RANGE COLUMNS(%s) ("
+            "PARTITION %s VALUES LESS THAN (%s), "
+            "PARTITION %s VALUES LESS THAN (MAXVALUE))"
+            % (table, qn('created_at'),
+               qn('p_%s' % self.LEGACY), self.bound(legacy_end),
+               qn('p_%s' % self.CATCH_ALL)),
+        ]
+
+    def create_sql(self, days):
+        if not days:
+            return []
+
+        length = partition_length(self.interval)
+        partitions = ["PARTITION %s VALUES LESS THAN (%s)"
+                      % (self.quote_name(self.partition_name(day)), self.bound(day + length))
+                      for day in sorted(days)]
+        partitions.append("PARTITION %s VALUES LESS THAN (MAXVALUE)" % self.quote_name('p_%s' % self.CATCH_ALL))
+
+        return ["ALTER TABLE %s REORGANIZE PARTITION %s INTO (%s)"
+                % (self.quote_name(self.table), self.quote_name('p_%s' % self.CATCH_ALL),
+                   ", ".join(partitions))]
+
+    def drop_sql(self, name):
+        return ["ALTER TABLE %s DROP PARTITION %s" % (self.quote_name(self.table), self.quote_name(name))]
+
+    def detach_sql(self, name):
+        qn = self.quote_name
+        table = qn(self.table)
+        detached = qn('%s_%s' % (self.table, name))
+        return [
+            "CREATE TABLE %s LIKE %s" % (detached, table),
+            "ALTER TABLE %s REMOVE PARTITIONING" % detached,
+            "ALTER TABLE %s EXCHANGE PARTITION %s WITH TABLE %s" % (table, qn(name), detached),
+        ] + self.drop_sql(name)
+
+
+PARTITIONERS = dict((cls.vendor, cls) for cls in (PostgresPartitioner, MySQLPartitioner))
+
+
+def get_partitioner(model, interval='day'):
+    """
+    Returns a Partitioner for the database in use.
+    Raises ValueError if it does not support partitioning.
+    """
+    if connection.vendor not in PARTITIONERS:
+        raise ValueError("Partitioning is not supported on %s" % connection.vendor)
+    return PARTITIONERS[connection.vendor](model, interval)
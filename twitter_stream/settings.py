@@ -22,3 +22,96 @@ MONITOR_PERFORMANCE = _stream_settings.get('MONITOR_PERFORMANCE', True)
 
 # The number of tweets to insert into the database at once
 INSERT_BATCH_SIZE = _stream_settings.get('INSERT_BATCH_SIZE', 1000)
+
+# Tune the insert batch size while running, to insert as many tweets / sec as possible,
+# between these limits, without any batch taking longer than INSERT_MAX_LATENCY seconds
+ADAPTIVE_BATCH_SIZE = _stream_settings.get('ADAPTIVE_BATCH_SIZE', False)
+INSERT_BATCH_SIZE_MIN = _stream_settings.get('INSERT_BATCH_SIZE_MIN', 100)
+INSERT_BATCH_SIZE_MAX = _stream_settings.get('INSERT_BATCH_SIZE_MAX', 20000)
+INSERT_MAX_LATENCY = _stream_settings.get('INSERT_MAX_LATENCY', 1.0)
+
+# Use a separate thread to insert tweets as they arrive, instead of once per poll interval
+WRITER_THREAD = _stream_settings.get('WRITER_THREAD', False)
+
+# With the writer thread, insert as soon as this many tweets are waiting...
+WRITER_BATCH_SIZE = _stream_settings.get('WRITER_BATCH_SIZE', 2000)
+
+# ...or as soon as the oldest waiting tweet is this many seconds old
+WRITER_MAX_AGE = _stream_settings.get('WRITER_MAX_AGE', 0.5)
+
+# The most tweets to hold in memory while waiting to be inserted (0 for no limit)
+QUEUE_MAX_SIZE = _stream_settings.get('QUEUE_MAX_SIZE', 0)
+
+# What to do with tweets when the queue is full: block, drop_oldest, drop_newest, or spill
+QUEUE_OVERFLOW_POLICY = _stream_settings.get('QUEUE_OVERFLOW_POLICY', 'block')
+
+# The directory where the spill policy journals tweets that did not fit in the queue
+QUEUE_SPILL_DIR = _stream_settings.get('QUEUE_SPILL_DIR', 'tweet_journal')
+
+# The size in bytes at which a new journal segment is started
+QUEUE_SPILL_SEGMENT_SIZE = _stream_settings.get('QUEUE_SPILL_SEGMENT_SIZE', 16 * 1024 * 1024)
+
+# Insert plain rows with raw SQL instead of building Tweet model instances
+FAST_INSERT = _stream_settings.get('FAST_INSERT', False)
+
+# How to insert tweets: bulk_create, insert, copy (PostgreSQL), load_data (MySQL),
+# or auto (copy on PostgreSQL, insert elsewhere). None means bulk_create,
+# or insert if FAST_INSERT is on.
+INSERT_BACKEND = _stream_settings.get('INSERT_BACKEND', None)
+
+# Skip tweets whose tweet_id is among this many recently saved ids (0 to save every tweet)
+DEDUP_CACHE_SIZE = _stream_settings.get('DEDUP_CACHE_SIZE', 0)
+
+# Let the database skip tweets that are already in the table. Needs a unique index
+# on tweet_id (on tweet_id, created_at if the table is partitioned);
+# uses INSERT ... ON CONFLICT DO NOTHING, INSERT IGNORE, or INSERT OR IGNORE
+IGNORE_DUPLICATES = _stream_settings.get('IGNORE_DUPLICATES', False)
+
+# Keep user details in the TwitterUser table, saved only when they change,
+# instead of on every tweet
+NORMALIZE_USERS = _stream_settings.get('NORMALIZE_USERS', False)
+
+# How many users to remember the details of, to tell whether they changed
+USER_CACHE_SIZE = _stream_settings.get('USER_CACHE_SIZE', 100000)
+
+# Keep per-minute and per-hour tweet counts up to date as tweets are inserted,
+# for the status page (run rebuild_tweet_counts to count existing tweets)
+COUNT_ROLLUPS = _stream_settings.get('COUNT_ROLLUPS', False)
+
+# Where the approximate tweet count on the status page comes from: 'estimate' (the
+# database's own statistics), 'counter' (a running count kept as tweets are inserted),
+# or 'exact' (COUNT(*), slow on big tables)
+COUNT_APPROX_SOURCE = _stream_settings.get('COUNT_APPROX_SOURCE', 'estimate')
+
+# How many seconds the status page reuses the same stream status for,
+# however many people are looking at it (0 to compute it on every request)
+STATUS_CACHE_SECONDS = _stream_settings.get('STATUS_CACHE_SECONDS', 10)
+
+# Push updates to the status page with server-sent events instead of having it poll.
+# Each open page holds a connection (and, on a synchronous WSGI server, a worker)
+# for STATUS_EVENTS_SECONDS at a time, so use a threaded or async server
+STATUS_EVENTS = _stream_settings.get('STATUS_EVENTS', False)
+STATUS_EVENTS_SECONDS = _stream_settings.get('STATUS_EVENTS_SECONDS', 300)
+
+# At most this many pages get events at once (0 for no limit); the rest poll instead.
+# Counted in Django's cache, so use a shared cache with several web server processes
+STATUS_EVENTS_MAX_CONNECTIONS = _stream_settings.get('STATUS_EVENTS_MAX_CONNECTIONS', 5)
+
+# Defaults for the partition_tweets command: the size of each created_at partition
+# ('day' or 'week'), how many to create ahead, and how many days of tweets to keep
+# (None to keep everything)
+PARTITION_INTERVAL = _stream_settings.get('PARTITION_INTERVAL', 'day')
+PARTITION_AHEAD = _stream_settings.get('PARTITION_AHEAD', 7)
+PARTITION_RETENTION_DAYS = _stream_settings.get('PARTITION_RETENTION_DAYS', None)
+
+# The JSON library for reading and writing tweet files: orjson, ujson, simdjson, json, or auto
+JSON_BACKEND = _stream_settings.get('JSON_BACKEND', 'auto')
+
+# Compress files written with --to-file: None, 'gzip', or 'zstd' (needs the zstandard package)
+ARCHIVE_COMPRESSION = _stream_settings.get('ARCHIVE_COMPRESSION', None)
+
+# Start a new --to-file segment after this many bytes of tweets (None for no limit)
+ARCHIVE_ROTATE_BYTES = _stream_settings.get('ARCHIVE_ROTATE_BYTES', None)
+
+# Start a new --to-file segment after this many seconds (None for no limit)
+ARCHIVE_ROTATE_SECONDS = _stream_settings.get('ARCHIVE_ROTATE_SECONDS', None)
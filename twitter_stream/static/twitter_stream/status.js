@@ -53,6 +53,11 @@
 
         return function (data) {
 
+            if (!data.length) {
+                barsGroup.selectAll("g").remove();
+                return;
+            }
+
             data.forEach(function (d) {
                 d.time = new Date(d.time);
             });
@@ -132,6 +137,61 @@
             });
     }
 
+    // The timeline as last received, as {time, tweets} with ISO times
+    var timeline;
+
+    function listen() {
+        var events = new EventSource(config.events_url),
+            opened = false;
+
+        events.onopen = function () {
+            opened = true;
+        };
+
+        events.onerror = function () {
+            if (!opened) {
+                // Could not connect at all, so fall back to polling
+                events.close();
+                interval = setInterval(update, UPDATE_INTERVAL);
+            }
+        };
+
+        events.addEventListener('display', function (e) {
+            status_display.html(JSON.parse(e.data));
+            toggle_status_label(true);
+        });
+
+        events.addEventListener('figures', function (e) {
+            var figures = JSON.parse(e.data);
+
+            Object.keys(figures).forEach(function (name) {
+                status_display.find('[data-figure="' + name + '"]').text(figures[name]);
+            });
+            toggle_status_label(true);
+        });
+
+        events.addEventListener('timeline', function (e) {
+            var delta = JSON.parse(e.data),
+                rows = {};
+
+            // No start means there are no tweets to show any more
+            timeline.concat(delta.changed).forEach(function (d) {
+                if (delta.start !== null && d.time >= delta.start) {
+                    rows[d.time] = d.tweets;
+                }
+            });
+
+            timeline = Object.keys(rows).sort().map(function (time) {
+                return {time: time, tweets: rows[time]};
+            });
+
+            // The chart turns the times into dates, so give it copies
+            update_chart(timeline.map(function (d) {
+                return {time: d.time, tweets: d.tweets};
+            }));
+        });
+    }
+
     function toggle_status_label(show) {
         var label = $('.status-label');
         label[0].borderWidth;
@@ -151,8 +211,16 @@
             width: chart_element.width(),
             height: CHART_HEIGHT
         });
+        timeline = config.timeline_data.map(function (d) {
+            return {time: d.time, tweets: d.tweets};
+        });
         update_chart(config.timeline_data);
-        interval = setInterval(update, UPDATE_INTERVAL);
+
+        if (config.events_url && window.EventSource) {
+            listen();
+        } else {
+            interval = setInterval(update, UPDATE_INTERVAL);
+        }
         toggle_status_label(true);
     });
 })();
\ No newline at end of file
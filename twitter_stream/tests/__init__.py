@@ -1,2 +1,9 @@
 from .test_tweet import *
 from .test_stream_process import *
+from .test_streaming import *
+from .test_archive import *
+from .test_jsonstream import *
+from .test_rate_limit import *
+from .test_batch_size import *
+from .test_partitions import *
+from .test_views import *
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+from twitter_stream.utils.archive import RotatingArchiveWriter, open_archive_lines
+from twitter_stream.utils.file_stream import MappedTweetFile
+
+
+class ArchiveTest(TestCase):
+
+    lines = [('{"id": %d, "text": "a tweet"}\n' % i).encode('utf-8') for i in range(100)]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'tweets.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, writer):
+        for line in self.lines:
+            writer.write(line)
+            writer.flush()
+        writer.close()
+
+    def test_gzip_round_trip(self):
+        """Compressed archives should read back transparently, even after appending"""
+        writer = RotatingArchiveWriter(self.path, compression='gzip')
+        writer.write(self.lines[0])
+        writer.close()
+        self.write(writer)
+
+        self.assertEqual(os.listdir(self.directory), ['tweets.json.gz'])
+        self.assertEqual(list(open_archive_lines(self.path + '.gz')), self.lines[:1] + self.lines)
+
+    def test_rotation(self):
+        """Rotated segments should read back in order with a glob pattern"""
+        writer = RotatingArchiveWriter(self.path, compression='gzip', max_bytes=500)
+        self.write(writer)
+
+        self.assertGreater(len(os.listdir(self.directory)), 1)
+        pattern = os.path.join(self.directory, 'tweets-*.json.gz')
+        self.assertEqual(list(open_archive_lines(pattern)), self.lines)
+
+    def test_renamed_on_close(self):
+        """Segments should only get their real name once they are complete"""
+        writer = RotatingArchiveWriter(self.path, compression='gzip')
+        writer.write(self.lines[0])
+        writer.sync()
+
+        self.assertEqual(os.listdir(self.directory), ['tweets.json.gz.%d.tmp' % os.getpid()])
+        writer.close()
+        self.assertEqual(os.listdir(self.directory), ['tweets.json.gz'])
+
+    def test_uncompressed(self):
+        writer = RotatingArchiveWriter(self.path)
+        self.write(writer)
+        self.assertEqual(list(open_archive_lines(self.path)), self.lines)
+
+
+class MappedTweetFileTest(TestCase):
+
+    def setUp(self):
+        self.tweets_file = tempfile.NamedTemporaryFile()
+
+    def tearDown(self):
+        self.tweets_file.close()
+
+    def read(self, data):
+        self.tweets_file.write(data)
+        self.tweets_file.flush()
+
+        mapped = MappedTweetFile(self.tweets_file.name)
+        result = [bytes(record).strip() for record in mapped.lines()]
+        mapped.close()
+        return result
+
+    def test_lines(self):
+        """Blank lines should be skipped, and the last line needs no newline"""
+        data = b'{"id": 1}\n\n  \r\n{"id": 2}\r\n {"id": 3} \n{"id": 4}'
+        self.assertEqual(self.read(data), [('{"id": %d}' % i).encode('utf-8') for i in range(1, 5)])
@@ -0,0 +1,60 @@
+from django.test import TestCase
+from twitter_stream.utils.batch_size import BatchSizer
+
+
+def insert_time(rows):
+    """A pretend database: per-statement overhead, then slower past 5000 rows."""
+    return 0.02 + rows * 0.00005 + max(0, rows - 5000) ** 2 * 1e-9
+
+
+class BatchSizerTest(TestCase):
+
+    def run_sizer(self, sizer, batches=300):
+        sizes = []
+        for i in range(batches):
+            sizes.append(sizer.size)
+            sizer.record(sizer.size, insert_time(sizer.size))
+        return sizes
+
+    def test_fixed(self):
+        """Without adapting, the size should not change"""
+        sizer = BatchSizer(1000)
+        self.assertEqual(set(self.run_sizer(sizer)), set([1000]))
+        self.assertAlmostEqual(sizer.rate, 1000 / insert_time(1000))
+
+    def test_adaptive(self):
+        """The size should climb from a small start to around the best size"""
+        sizer = BatchSizer(100, min_size=10, max_size=100000, adaptive=True)
+        sizes = self.run_sizer(sizer)
+        settled = sizes[-100:]
+        self.assertGreater(min(settled), 2000)
+        self.assertLess(max(settled), 20000)
+
+    def test_latency_ceiling(self):
+        """Batches should stay under the latency ceiling, most of the time"""
+        sizer = BatchSizer(1000, min_size=10, max_size=100000, max_latency=0.1, adaptive=True)
+        sizes = self.run_sizer(sizer)
+        too_slow = [size for size in sizes if insert_time(size) > 0.1]
+        self.assertLess(len(too_slow), len(sizes) / 5)
+
+    def test_failure(self):
+        """A failed batch should halve the size"""
+        sizer = BatchSizer(1000, adaptive=True)
+        sizer.failed()
+        self.assertEqual(sizer.size, 500)
+
+    def test_whole_transaction(self):
+        """Several batches timed together should be judged by their average latency"""
+        sizer = BatchSizer(1000, max_latency=0.1, adaptive=True)
+        sizer.record(5000, 0.25, batches=5)
+        self.assertEqual(sizer.size, 1000)
+        sizer.record(5000, 0.75, batches=5)
+        self.assertEqual(sizer.size, 500)
+
+    def test_cap(self):
+        """Capping should only ever lower the largest size"""
+        sizer = BatchSizer(1000, max_size=20000, adaptive=True)
+        sizer.cap(40)
+        self.assertEqual(sizer.size, 40)
+        sizer.cap(100)
+        self.assertEqual(sizer.max_size, 40)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import json
+
+from django.test import TestCase
+from twitter_stream.utils.jsonstream import iter_json_objects
+
+
+class JsonStreamTest(TestCase):
+
+    tweets = [
+        {'id': 1, 'text': u'Café ☕ {not a brace}', 'user': {'id': 2}},
+        {'id': 3, 'text': 'Quotes \" and \\ backslashes \\"', 'entities': {'hashtags': []}},
+        {'id': 4, 'text': '},\n{', 'user': {'id': 5}},
+    ]
+
+    def parse(self, text, chunk_size=1):
+        data = text.encode('utf-8')
+        chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+        return list(iter_json_objects(chunks, chunk_size=chunk_size))
+
+    def test_layouts(self):
+        """Any whitespace and array or comma separators should be accepted"""
+        layouts = [
+            json.dumps(self.tweets),
+            json.dumps(self.tweets, indent=4),
+            '\n'.join(json.dumps(t) for t in self.tweets),
+            ',\n'.join(json.dumps(t, indent=2) for t in self.tweets) + ',\n',
+            '  \t\r\n'.join(json.dumps(t, indent=1, separators=(' , ', ' : ')) for t in self.tweets),
+        ]
+        for text in layouts:
+            self.assertEqual(self.parse(text), self.tweets)
+
+    def test_chunk_sizes(self):
+        """Objects split across chunks should be parsed the same"""
+        text = json.dumps(self.tweets, indent=4, ensure_ascii=False)
+        for chunk_size in (1, 2, 3, 7, 100, 10000):
+            self.assertEqual(self.parse(text, chunk_size), self.tweets)
+
+    def test_truncated(self):
+        """A cut-off object at the end should be an error"""
+        text = json.dumps(self.tweets, indent=4)
+        with self.assertRaises(ValueError):
+            self.parse(text[:-10])
+
+    def test_fails_early(self):
+        """A malformed object should be an error once it ends, without reading on"""
+        read = []
+
+        def chunks():
+            yield b'{"id": 1} {"id": nope} '
+            while True:
+                read.append(True)
+                yield b'{"id": 2} '
+
+        with self.assertRaises(ValueError):
+            list(iter_json_objects(chunks(), chunk_size=10))
+        self.assertEqual(read, [])
+
+    def test_not_an_object(self):
+        with self.assertRaises(ValueError):
+            self.parse('{"id": 1}, "text"')
+
+    def test_large_object(self):
+        """An object much bigger than a chunk should come out whole"""
+        tweet = {'id': 1, 'entities': [{'text': 'x' * 100, 'indices': [i, i + 1]} for i in range(1000)]}
+        self.assertEqual(self.parse(json.dumps(tweet, indent=4), chunk_size=1000), [tweet])
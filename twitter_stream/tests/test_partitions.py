@@ -0,0 +1,90 @@
+from datetime import date, datetime
+
+from django.test import TestCase
+from twitter_stream.models import Tweet
+from twitter_stream.partitions import partition_start, PostgresPartitioner, MySQLPartitioner
+
+
+class PartitionTest(TestCase):
+
+    def partitioner(self, cls, names, interval='day', legacy_end=None, catch_all_days=()):
+        partitioner = cls(Tweet, interval)
+        partitioner.partition_names = lambda: names
+        partitioner.legacy_end = lambda: legacy_end
+        partitioner.catch_all_has_rows = lambda start, end: start in catch_all_days
+        return partitioner
+
+    def test_partition_start(self):
+        self.assertEqual(partition_start(date(2014, 3, 5), 'day'), date(2014, 3, 5))
+        self.assertEqual(partition_start(date(2014, 3, 5), 'week'), date(2014, 3, 3))
+        self.assertRaises(ValueError, partition_start, date(2014, 3, 5), 'month')
+
+    def test_created_range(self):
+        table = Tweet._meta.db_table
+        partitioner = self.partitioner(PostgresPartitioner, [], interval='week')
+        self.assertEqual(partitioner.created_range(table + '_p20140303'),
+                         (datetime(2014, 3, 3), datetime(2014, 3, 10)))
+        self.assertEqual(partitioner.created_range(table + '_legacy'), None)
+
+    def test_plan(self):
+        """Missing partitions should be created, and expired ones dropped, but never the legacy one"""
+        table = Tweet._meta.db_table
+        names = [table + '_legacy', table + '_future', table + '_p20140301',
+                 table + '_p20140302', table + '_p20140304']
+        partitioner = self.partitioner(PostgresPartitioner, names)
+
+        to_create, to_drop = partitioner.plan(date(2014, 3, 4), ahead=2, retention_days=1)
+        self.assertEqual(to_create, [date(2014, 3, 5), date(2014, 3, 6)])
+        self.assertEqual(to_drop, [table + '_p20140301', table + '_p20140302'])
+
+        to_create, to_drop = partitioner.plan(date(2014, 3, 4), ahead=0)
+        self.assertEqual((to_create, to_drop), ([], []))
+
+    def test_mysql_create_sql(self):
+        """New MySQL partitions should be split off the catch-all partition"""
+        partitioner = self.partitioner(MySQLPartitioner, [], interval='week')
+        statements = partitioner.create_sql([date(2014, 3, 10), date(2014, 3, 3)])
+
+        self.assertEqual(len(statements), 1)
+        sql = statements[0]
+        self.assertIn('REORGANIZE PARTITION', sql)
+        self.assertLess(sql.index('p20140303'), sql.index('p20140310'))
+        self.assertIn("LESS THAN ('2014-03-17 00:00:00')", sql)
+        self.assertIn('LESS THAN (MAXVALUE)', sql)
+
+    def test_setup_with_todays_tweets(self):
+        """The legacy partition should take in today's tweets, and partitions start after it"""
+        status = {
+            'id': 1,
+            'text': 'A tweet from today',
+            'truncated': False,
+            'created_at': 'Tue Mar 04 12:00:00 +0000 2014',
+            'coordinates': None,
+            'user': {'id': 6253282, 'screen_name': 'twitterapi', 'name': 'Twitter API', 'verified': False},
+        }
+        Tweet.bulk_insert_rows([Tweet.row_from_json(status)])
+        today = date(2014, 3, 4)
+
+        partitioner = self.partitioner(PostgresPartitioner, [])
+        partitioner.id_sequence = lambda: None
+        attach = [sql for sql in partitioner.setup_sql(today) if 'MINVALUE' in sql]
+        self.assertEqual(len(attach), 1)
+        self.assertIn("TO ('2014-03-05 00:00:00", attach[0])
+
+        partitioner = self.partitioner(MySQLPartitioner, [], interval='week')
+        self.assertIn("LESS THAN ('2014-03-10 00:00:00')", partitioner.setup_sql(today)[-1])
+
+        partitioner = self.partitioner(PostgresPartitioner, [], legacy_end=date(2014, 3, 5))
+        to_create, to_drop = partitioner.plan(today, ahead=2)
+        self.assertEqual(to_create, [date(2014, 3, 5), date(2014, 3, 6)])
+
+    def test_create_moves_catch_all_rows(self):
+        """Tweets in the catch-all partition should be moved into a new partition that covers them"""
+        partitioner = self.partitioner(PostgresPartitioner, [], catch_all_days=[date(2014, 3, 5)])
+        statements = partitioner.create_sql([date(2014, 3, 5), date(2014, 3, 6)])
+
+        self.assertEqual(len(statements), 5)
+        self.assertTrue(statements[1].startswith('INSERT INTO'))
+        self.assertTrue(statements[2].startswith('DELETE FROM'))
+        self.assertIn('ATTACH PARTITION', statements[3])
+        self.assertIn('PARTITION OF', statements[4])
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+from twitter_stream.utils.rate_limit import TokenBucket, ReplayPacer
+
+
+class FakeClock(object):
+    """A clock that only moves when something sleeps."""
+
+    def __init__(self, oversleep=0.0):
+        self.now = 1000.0
+        self.oversleep = oversleep
+        self.sleeps = 0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds + self.oversleep
+        self.sleeps += 1
+
+
+class TokenBucketTest(TestCase):
+
+    def bucket(self, rate, burst=None, oversleep=0.0):
+        clock = FakeClock(oversleep)
+        return TokenBucket(rate, burst=burst, clock=clock.time, sleep=clock.sleep), clock
+
+    def test_rate(self):
+        """Tweets should come out at the target rate, a batch per sleep"""
+        bucket, clock = self.bucket(5000)
+        for i in range(50000):
+            bucket.acquire()
+
+        self.assertAlmostEqual(bucket.achieved_rate(), 5000, delta=100)
+        self.assertLess(clock.sleeps, 50000 / bucket.batch + 1)
+
+    def test_oversleeping(self):
+        """Sleeping too long should not lower the average rate"""
+        bucket, clock = self.bucket(5000, burst=100, oversleep=0.002)
+        for i in range(50000):
+            bucket.acquire()
+
+        self.assertAlmostEqual(bucket.achieved_rate(), 5000, delta=100)
+
+    def test_burst(self):
+        """Tokens should not build up beyond the burst size"""
+        bucket, clock = self.bucket(100, burst=10)
+        bucket.acquire()
+        clock.now += 60
+
+        for i in range(10):
+            bucket.acquire()
+        self.assertEqual(clock.sleeps, 0)
+
+        bucket.acquire()
+        self.assertEqual(clock.sleeps, 1)
+
+
+class ReplayPacerTest(TestCase):
+
+    start = datetime(2014, 6, 1, 12, 0, 0)
+    offsets = [0, 0, 1, 1, 1, 5, 5, 65]
+
+    def replay(self, **kwargs):
+        """Returns the times at which each tweet was let through."""
+        clock = FakeClock()
+        pacer = ReplayPacer(clock=clock.time, sleep=clock.sleep, **kwargs)
+
+        times = []
+        for offset in self.offsets:
+            pacer.wait(self.start + timedelta(seconds=offset))
+            times.append(clock.now - 1000)
+        return times
+
+    def test_real_time(self):
+        """Tweets should come out with their original gaps"""
+        self.assertEqual(self.replay(), self.offsets)
+
+    def test_speed(self):
+        """Gaps should shrink with the speed"""
+        for actual, offset in zip(self.replay(speed=10), self.offsets):
+            self.assertAlmostEqual(actual, offset / 10.0)
+
+    def test_max_gap(self):
+        """Long gaps should be cut short"""
+        self.assertEqual(self.replay(max_gap=10)[-1], 15)
@@ -0,0 +1,395 @@
+import time
+import shutil
+import tempfile
+from datetime import datetime
+
+from django.test import TestCase
+from twitter_stream.utils.streaming import TweetQueue, QueueStreamListener, queue
+from twitter_stream.utils.journal import OverflowJournal
+from twitter_stream.utils import fastjson
+from twitter_stream.utils.parallel import split_file
+from twitter_stream.utils.dedup import RecentIds
+from twitter_stream.utils.users import UserCache
+
+
+class TweetQueueTest(TestCase):
+
+    def test_wait_for_batch_empty(self):
+        """wait_for_batch() should give up if nothing arrives"""
+        q = TweetQueue()
+        self.assertFalse(q.wait_for_batch(10, 0.1, timeout=0.01))
+
+    def test_wait_for_batch_full(self):
+        """wait_for_batch() should return immediately once batch_size items are waiting"""
+        q = TweetQueue()
+        for i in range(10):
+            q.put_nowait(i)
+
+        start = time.time()
+        self.assertTrue(q.wait_for_batch(10, 5, timeout=5))
+        self.assertLess(time.time() - start, 1)
+
+    def test_wait_for_batch_max_age(self):
+        """wait_for_batch() should return a partial batch once it is old enough"""
+        q = TweetQueue()
+        q.put_nowait(1)
+
+        start = time.time()
+        self.assertTrue(q.wait_for_batch(10, 0.1, timeout=5))
+        self.assertGreaterEqual(time.time() - start, 0.05)
+        self.assertEqual(q.get_all_nowait(), [1])
+
+    def test_get_up_to(self):
+        """get_up_to() should return at most count items, oldest first"""
+        q = TweetQueue()
+        for i in range(5):
+            q.put_nowait(i)
+
+        self.assertEqual(q.get_up_to_nowait(3), [0, 1, 2])
+        self.assertEqual(q.get_up_to_nowait(3), [3, 4])
+        self.assertRaises(queue.Empty, q.get_up_to_nowait, 3)
+
+
+class QueueWriterTest(TestCase):
+
+    def test_writer_drains_queue(self):
+        """The writer thread should save everything, including what is left when stopped"""
+        listener = QueueStreamListener()
+
+        batches = []
+        listener.save_batch = lambda batch: batches.append(list(batch)) or len(batch)
+
+        listener.start_writer(batch_size=5, max_age=0.05)
+        for i in range(12):
+            listener.on_status(i)
+        listener.stop_writer(timeout=5)
+
+        self.assertFalse(listener.writer.is_alive())
+        self.assertEqual(sum(batches, []), list(range(12)))
+
+    def test_writer_replays_journal_after_queue(self):
+        """Journaled tweets should only be saved after everything queued before them"""
+        directory = tempfile.mkdtemp()
+        try:
+            listener = QueueStreamListener(max_size=10)
+            listener.overflow_policy = QueueStreamListener.OVERFLOW_SPILL
+            listener.journal = OverflowJournal(directory, segment_size=20)
+
+            saved = []
+            listener.save_batch = lambda batch: saved.extend(s['i'] for s in batch) or len(batch)
+
+            # The last 5 don't fit in the queue
+            for i in range(15):
+                listener.on_status({'i': i})
+
+            listener.start_writer(batch_size=3, max_age=0.01)
+            deadline = time.time() + 5
+            while len(saved) < 15 and time.time() < deadline:
+                time.sleep(0.01)
+            listener.stop_writer(timeout=5)
+
+            self.assertEqual(saved, list(range(15)))
+        finally:
+            shutil.rmtree(directory)
+
+
+class QueueOverflowTest(TestCase):
+
+    def fill(self, policy):
+        listener = QueueStreamListener(max_size=3, overflow_policy=policy)
+        for i in range(5):
+            listener.on_status(i)
+        return listener
+
+    def test_drop_newest(self):
+        listener = self.fill(QueueStreamListener.OVERFLOW_DROP_NEWEST)
+        self.assertEqual(listener.queue.get_all_nowait(), [0, 1, 2])
+        self.assertEqual(listener.overflow_counts[QueueStreamListener.OVERFLOW_DROP_NEWEST], 2)
+
+    def test_drop_oldest(self):
+        listener = self.fill(QueueStreamListener.OVERFLOW_DROP_OLDEST)
+        self.assertEqual(listener.queue.get_all_nowait(), [2, 3, 4])
+        self.assertEqual(listener.overflow_counts[QueueStreamListener.OVERFLOW_DROP_OLDEST], 2)
+
+    def test_unknown_policy(self):
+        self.assertRaises(ValueError, QueueStreamListener, overflow_policy='explode')
+
+
+class OverflowJournalTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_read_in_order(self):
+        """Segments should come back oldest first, with prepended ones before the rest"""
+        journal = OverflowJournal(self.directory, segment_size=20)
+        for i in range(5):
+            journal.append({'i': i})
+        journal.prepend([{'i': -2}, {'i': -1}])
+
+        statuses = []
+        while journal.pending:
+            sequence, batch = journal.read_oldest()
+            statuses.extend(s['i'] for s in batch)
+            journal.mark_saved(sequence)
+
+        self.assertEqual(statuses, [-2, -1, 0, 1, 2, 3, 4])
+
+    def test_read_in_batches(self):
+        """A segment should be read a batch at a time, and only removed once all of it is saved"""
+        journal = OverflowJournal(self.directory, segment_size=1024)
+        for i in range(5):
+            journal.append({'i': i})
+
+        sequence, batch = journal.read_oldest(2)
+        self.assertEqual(batch, [{'i': 0}, {'i': 1}])
+
+        # Not saved yet, so the same ones come back
+        self.assertEqual(journal.read_oldest(2), (sequence, batch))
+        journal.mark_saved(sequence)
+
+        self.assertEqual(journal.read_oldest(10), (sequence, [{'i': 2}, {'i': 3}, {'i': 4}]))
+        self.assertTrue(journal.pending)
+        journal.mark_saved(sequence)
+        self.assertFalse(journal.pending)
+
+    def test_spilled_once(self):
+        """Tweets that fail to save again should not be journaled or counted again"""
+        listener = QueueStreamListener(max_size=2, overflow_policy=QueueStreamListener.OVERFLOW_SPILL)
+        listener.journal = OverflowJournal(self.directory, segment_size=1024)
+
+        failing = [True]
+        saved = []
+
+        def save_batch(batch):
+            if failing[0] and batch:
+                raise ValueError("The database is down")
+            saved.extend(s['i'] for s in batch)
+            return len(batch)
+
+        listener.save_batch = save_batch
+
+        # The last 3 don't fit in the queue
+        for i in range(5):
+            listener.on_status({'i': i})
+
+        listener.process_tweet_queue()
+        listener.process_tweet_queue()
+        self.assertEqual(listener.overflow_counts[QueueStreamListener.OVERFLOW_SPILL], 5)
+
+        # All of it, in one go
+        failing[0] = False
+        listener.REPLAY_BATCH_SIZE = 2
+        listener.process_tweet_queue()
+        self.assertFalse(listener.journal.pending)
+        self.assertEqual(saved, list(range(5)))
+        self.assertEqual(listener.overflow_counts[QueueStreamListener.OVERFLOW_SPILL], 5)
+
+    def test_survives_restart(self):
+        """A new journal should pick up segments left in the directory"""
+        journal = OverflowJournal(self.directory, segment_size=1024)
+        journal.append({'i': 1})
+        journal.close()
+
+        journal = OverflowJournal(self.directory, segment_size=1024)
+        self.assertTrue(journal.pending)
+        self.assertEqual(journal.read_oldest()[1], [{'i': 1}])
+
+
+class FastJsonTest(TestCase):
+
+    status = {'id': 210462857140252672, 'text': u'caf\xe9 \U0001f600', 'coordinates': None, 'truncated': False}
+
+    def test_backends_round_trip(self):
+        """Every installed backend should decode what the others encode"""
+        for name in fastjson.BACKENDS:
+            try:
+                loads, dumps = fastjson.get_backend(name)
+            except ImportError:
+                continue
+
+            encoded = dumps(self.status)
+            self.assertIsInstance(encoded, bytes)
+            self.assertEqual(loads(encoded), self.status, name)
+            self.assertEqual(loads(memoryview(encoded)), self.status, name)
+            self.assertEqual(loads(encoded.decode('utf-8')), self.status, name)
+            self.assertEqual(fastjson.loads(encoded), self.status, name)
+
+
+class RawModeTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.to_file = self.directory + '/tweets.json'
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_writes_statuses_unchanged(self):
+        """Raw statuses should be written exactly as received, other messages skipped"""
+        listener = QueueStreamListener(to_file=self.to_file, raw=True)
+        status = '{"id":1,"in_reply_to_status_id":null,"text":"a tweet"}'
+        listener.on_data(status + '\r\n')
+        listener.on_data('{"limit":{"track":10}}')
+        listener.process_tweet_queue()
+        listener.close()
+
+        with open(self.to_file, 'rb') as infile:
+            self.assertEqual(infile.read(), status.encode('utf-8') + b"\n")
+
+    def test_requires_to_file(self):
+        self.assertRaises(ValueError, QueueStreamListener, raw=True)
+
+
+class InsertTest(TestCase):
+
+    status = {
+        'id': 210462857140252672,
+        'id_str': '210462857140252672',
+        'text': 'A tweet',
+        'truncated': False,
+        'created_at': 'Wed Jun 06 20:07:10 +0000 2012',
+        'coordinates': None,
+        'user': {'id': 6253282, 'screen_name': 'twitterapi', 'name': 'Twitter API', 'verified': False},
+    }
+
+    def test_all_or_nothing(self):
+        """If any batch fails, none of the tweets should be saved"""
+        from twitter_stream.models import Tweet
+
+        listener = QueueStreamListener()
+        listener.batch_sizer.size = 2
+        rows = [Tweet.row_from_json(dict(self.status, id=i)) for i in range(6)]
+
+        insert_rows = Tweet.insert_rows
+        calls = []
+
+        def failing_insert_rows(batch, batch_size=None, backend=None):
+            calls.append(batch)
+            if len(calls) == 3:
+                raise ValueError("Third batch fails")
+            return insert_rows(batch, batch_size, backend)
+
+        Tweet.insert_rows = staticmethod(failing_insert_rows)
+        try:
+            self.assertRaises(ValueError, listener.insert, Tweet, rows, 'insert')
+        finally:
+            del Tweet.insert_rows
+
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(Tweet.objects.count(), 0)
+        self.assertEqual(listener.ignored_count, 0)
+
+    def test_sets_created_range(self):
+        """The first insert should set the watermarks from the table, once it is committed"""
+        from twitter_stream import models
+        from twitter_stream.models import Tweet
+
+        listener = QueueStreamListener()
+        listener.insert(Tweet, [Tweet.row_from_json(self.status)], 'insert')
+
+        created_at = Tweet.objects.get().created_at
+        self.assertEqual(models.TweetTableStats.get_created_range(Tweet), (created_at, created_at))
+
+    def test_counts_only_inserted(self):
+        """With IGNORE_DUPLICATES, tweets the database skips should not be counted"""
+        from django.db import connection
+        from twitter_stream import models, settings
+        from twitter_stream.models import Tweet
+
+        cursor = connection.cursor()
+        cursor.execute("CREATE UNIQUE INDEX test_unique_tweet_id ON %s (tweet_id)" % Tweet._meta.db_table)
+        original = settings.COUNT_ROLLUPS, settings.IGNORE_DUPLICATES
+        settings.COUNT_ROLLUPS = settings.IGNORE_DUPLICATES = True
+        try:
+            listener = QueueStreamListener()
+            rows = [Tweet.row_from_json(dict(self.status, id=i)) for i in range(2)]
+            listener.insert(Tweet, rows, 'insert')
+            listener.insert(Tweet, rows + [Tweet.row_from_json(dict(self.status, id=2))] * 2, 'insert')
+        finally:
+            settings.COUNT_ROLLUPS, settings.IGNORE_DUPLICATES = original
+            cursor.execute("DROP INDEX test_unique_tweet_id")
+
+        self.assertEqual(Tweet.objects.count(), 3)
+        timeline = models.TweetCount.get_timeline(datetime(2012, 1, 1))
+        self.assertEqual(sum(row['tweets'] for row in timeline), 3)
+
+
+class SplitFileTest(TestCase):
+
+    def test_ranges_start_on_lines(self):
+        """split_file() should cover the whole file in ranges that start at line boundaries"""
+        data = b''.join(('{"id": %d, "text": "%s"}\n' % (i, 'x' * (i % 37))).encode('utf-8')
+                        for i in range(1000))
+
+        with tempfile.NamedTemporaryFile() as tweets_file:
+            tweets_file.write(data)
+            tweets_file.flush()
+
+            for parts in (1, 3, 8, 5000):
+                ranges = split_file(tweets_file.name, parts)
+                self.assertLessEqual(len(ranges), parts)
+                self.assertEqual(ranges[0][0], 0)
+                self.assertEqual(ranges[-1][1], len(data))
+                for (start, end), (next_start, _) in zip(ranges, ranges[1:]):
+                    self.assertEqual(end, next_start)
+                    self.assertEqual(data[next_start - 1:next_start], b'\n')
+
+
+class DedupTest(TestCase):
+
+    def test_recent_ids(self):
+        """The least recently seen id should be forgotten first"""
+        recent = RecentIds(3)
+        for tweet_id in (1, 2, 3):
+            self.assertFalse(recent.seen(tweet_id))
+        self.assertTrue(recent.seen(1))
+
+        recent.seen(4)
+        self.assertNotIn(2, recent)
+        self.assertIn(1, recent)
+        self.assertEqual(len(recent), 3)
+        self.assertAlmostEqual(recent.hit_rate(), 0.2)
+
+        recent.forget([1, 5])
+        self.assertFalse(recent.seen(1))
+
+    def test_skips_duplicates(self):
+        """Tweets saved recently should not be saved again"""
+        directory = tempfile.mkdtemp()
+        try:
+            listener = QueueStreamListener(to_file=directory + '/tweets.json')
+            listener.recent_ids = RecentIds(10)
+
+            statuses = [{'id': 1, 'text': 'a'}, {'id': 2, 'text': 'b'}, {'id': 1, 'text': 'a'}]
+            self.assertEqual(listener.save_batch(statuses), 2)
+            self.assertEqual(listener.save_batch([{'id': 2, 'text': 'b'}]), 0)
+            listener.close()
+
+            with open(directory + '/tweets.json', 'rb') as infile:
+                ids = [fastjson.loads(line)['id'] for line in infile]
+            self.assertEqual(ids, [1, 2])
+            self.assertEqual(listener.recent_ids.hits, 2)
+        finally:
+            shutil.rmtree(directory)
+
+
+class UserCacheTest(TestCase):
+
+    def test_changed(self):
+        """Only users that are new or changed since they were saved should be returned"""
+        cache = UserCache(10)
+        rows = [(1, 'a', 10), (2, 'b', 20), (1, 'a', 11)]
+        self.assertEqual(sorted(cache.changed(rows)), [(1, 'a', 11), (2, 'b', 20)])
+        cache.remember([(1, 'a', 11), (2, 'b', 20)])
+
+        self.assertEqual(cache.changed([(1, 'a', 11), (2, 'b', 21)]), [(2, 'b', 21)])
+
+    def test_clears_when_full(self):
+        cache = UserCache(2)
+        cache.remember([(1, 'a'), (2, 'b')])
+        cache.remember([(3, 'c')])
+        self.assertEqual(cache.changed([(1, 'a'), (3, 'c')]), [(1, 'a')])
@@ -1,12 +1,224 @@
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from django.test import TestCase
 from django.utils import timezone
-from twitter_stream import settings
+from twitter_stream import settings, models
 from twitter_stream.models import Tweet
 
 
+class ParseDatetimeTest(TestCase):
+
+    strings = [
+        'Wed Jun 06 20:07:10 +0000 2012',
+        'Sun Jan 01 00:00:00 +0000 2006',
+        'Tue Dec 31 23:59:59 +0000 2013',
+        'Sat Feb 29 12:30:01 +0000 2020',
+    ]
+
+    def tearDown(self):
+        models._datetime_cache.clear()
+
+    def check_matches_email_parser(self):
+        models._datetime_cache.clear()
+        for string in self.strings:
+            self.assertEqual(models.parse_datetime(string), models._parse_email_datetime(string))
+            # and again from the cache
+            self.assertEqual(models.parse_datetime(string), models._parse_email_datetime(string))
+
+    def test_matches_email_parser(self):
+        """parse_datetime() should give the same result as email.utils.parsedate"""
+        self.check_matches_email_parser()
+
+    def test_matches_email_parser_other_tz_setting(self):
+        """...with either USE_TZ setting"""
+        use_tz = settings.USE_TZ
+        settings.USE_TZ = not use_tz
+        try:
+            self.check_matches_email_parser()
+        finally:
+            settings.USE_TZ = use_tz
+
+    def test_other_format(self):
+        """parse_datetime() should fall back to email.utils for other formats"""
+        string = 'Wed, 06 Jun 2012 20:07:10 +0000'
+        self.assertEqual(models.parse_datetime(string), models._parse_email_datetime(string))
+
+
+class TweetRowsTest(TestCase):
+
+    status = {
+        'id': 210462857140252672,
+        'id_str': '210462857140252672',
+        'text': 'A tweet',
+        'truncated': False,
+        'created_at': 'Wed Jun 06 20:07:10 +0000 2012',
+        'coordinates': {'type': 'Point', 'coordinates': [-75.14310264, 40.05701649]},
+        'retweet_count': -1,
+        'user': {
+            'id': 6253282,
+            'screen_name': 'twitterapi',
+            'name': 'Twitter API',
+            'verified': True,
+            'geo_enabled': True,
+            'followers_count': 1000,
+        }
+    }
+
+    def test_row_matches_model(self):
+        """row_from_json() should produce the same values as create_from_json()"""
+        tweet = Tweet.create_from_json(self.status)
+        row = Tweet.row_from_json(self.status)
+
+        self.assertEqual(len(row), len(Tweet.ROW_FIELDS))
+        for name, value in zip(Tweet.ROW_FIELDS, row):
+            self.assertEqual(getattr(tweet, name), value, '%s matches' % name)
+
+    def test_bulk_insert_rows(self):
+        """bulk_insert_rows() should save the rows, in batches"""
+        rows = []
+        for i in range(5):
+            status = dict(self.status, id=i)
+            rows.append(Tweet.row_from_json(status))
+
+        Tweet.bulk_insert_rows(rows, batch_size=2)
+
+        self.assertEqual(Tweet.objects.count(), 5)
+        tweet = Tweet.objects.get(tweet_id=3)
+        self.assertEqual(tweet.user_screen_name, 'twitterapi')
+        self.assertEqual(tweet.latitude, 40.05701649)
+        self.assertEqual(tweet.retweet_count, None)
+        self.assertEqual(tweet.created_at, Tweet.create_from_json(self.status).created_at)
+
+    def test_count_approx(self):
+        """Each source should count the tweets saved in a row"""
+        Tweet.bulk_insert_rows([Tweet.row_from_json(dict(self.status, id=i)) for i in range(5)])
+        models.TweetTableStats.add_tweets(Tweet, 5)
+
+        source = settings.COUNT_APPROX_SOURCE
+        try:
+            for settings.COUNT_APPROX_SOURCE in ('estimate', 'counter', 'exact'):
+                self.assertEqual(Tweet.count_approx(), 5, settings.COUNT_APPROX_SOURCE)
+        finally:
+            settings.COUNT_APPROX_SOURCE = source
+
+    def test_created_range(self):
+        """The created_at watermarks should start from the table, then only move outwards"""
+        Tweet.bulk_insert_rows([Tweet.row_from_json(self.status)])
+        created_at = Tweet.create_from_json(self.status).created_at
+        self.assertEqual(models.TweetTableStats.get_created_range(Tweet), (None, None))
+
+        self.assertFalse(models.TweetTableStats.extend_created_range(Tweet, created_at, created_at))
+        models.TweetTableStats.refresh_created_range(Tweet)
+        self.assertEqual(models.TweetTableStats.get_created_range(Tweet), (created_at, created_at))
+
+        later = created_at + timedelta(hours=1)
+        self.assertTrue(models.TweetTableStats.extend_created_range(Tweet, later, later))
+        self.assertEqual(Tweet.get_earliest_created_at(), created_at)
+        self.assertEqual(Tweet.get_latest_created_at(), later)
+
+    def test_delete_clears_created_range(self):
+        """Deleting tweets, one way or another, should clear the watermarks"""
+        for delete in (lambda: Tweet.objects.all().delete(),
+                       lambda: Tweet.objects.get().delete(),
+                       lambda: Tweet.delete_id_range(0, 2 ** 62, datetime(2100, 1, 1))):
+            Tweet.bulk_insert_rows([Tweet.row_from_json(self.status)])
+            models.TweetTableStats.refresh_created_range(Tweet)
+            self.assertNotEqual(models.TweetTableStats.get_created_range(Tweet), (None, None))
+
+            delete()
+            self.assertEqual(models.TweetTableStats.get_created_range(Tweet), (None, None))
+            self.assertEqual(Tweet.get_latest_created_at(), None)
+
+    def test_format_text_rows(self):
+        """format_text_rows() should escape text and mark nulls for COPY / LOAD DATA"""
+        status = dict(self.status, text=u'Tab\there,\nnew line \\ \u2603')
+        data = Tweet.format_text_rows([Tweet.row_from_json(status)])
+
+        self.assertTrue(data.endswith(b'\n'))
+        fields = data[:-1].decode('utf-8').split(u'\t')
+        self.assertEqual(len(fields), len(Tweet.ROW_FIELDS))
+
+        values = dict(zip(Tweet.ROW_FIELDS, fields))
+        self.assertEqual(values['tweet_id'], u'210462857140252672')
+        self.assertEqual(values['text'], u'Tab\\there,\\nnew line \\\\ \u2603')
+        self.assertEqual(values['truncated'], u'0')
+        self.assertEqual(values['lang'], u'\\N')
+        self.assertEqual(values['latitude'], u'40.05701649')
+
+    def test_to_json(self):
+        """to_json() should give back a status that parses to the same tweet"""
+        status = dict(self.status, retweeted_status={'id': 1, 'id_str': '1'})
+        tweet = Tweet.create_from_json(status)
+        archived = json.loads(json.dumps(tweet.to_json()))
+
+        self.assertEqual(archived['created_at'], status['created_at'])
+        self.assertEqual(Tweet.row_from_json(archived), Tweet.row_from_json(status))
+
+    def test_without_user_fields(self):
+        """Normalized rows should keep the user_id and nothing else about the user"""
+        row = Tweet.without_user_fields(Tweet.row_from_json(self.status))
+        values = dict(zip(Tweet.ROW_FIELDS, row))
+        self.assertEqual(values['user_id'], 6253282)
+        self.assertEqual(values['user_screen_name'], u'')
+        self.assertEqual(values['user_followers_count'], None)
+        self.assertEqual(values['text'], 'A tweet')
+
+    def test_upsert_users(self):
+        """upsert_rows() should add new users and update existing ones"""
+        user = self.status['user']
+        models.TwitterUser.upsert_rows([models.TwitterUser.row_from_json(user)])
+        models.TwitterUser.upsert_rows([models.TwitterUser.row_from_json(dict(user, followers_count=1001)),
+                                        models.TwitterUser.row_from_json(dict(user, id=1))])
+
+        self.assertEqual(models.TwitterUser.objects.count(), 2)
+        saved = models.TwitterUser.objects.get(user_id=6253282)
+        self.assertEqual(saved.screen_name, 'twitterapi')
+        self.assertEqual(saved.followers_count, 1001)
+        self.assertTrue(saved.verified)
+
+
+class TweetCountTest(TestCase):
+
+    def test_add_counts(self):
+        """Counts should be added up by minute and by hour, across batches"""
+        start = datetime(2014, 3, 1, 12, 59, 30)
+        models.TweetCount.add_counts([start, start + timedelta(seconds=10), start + timedelta(seconds=40)])
+        models.TweetCount.add_counts([start + timedelta(seconds=50)])
+
+        timeline = models.TweetCount.get_timeline(datetime(2014, 3, 1, 12, 0))
+        self.assertEqual([row['tweets'] for row in timeline], [2, 2])
+        self.assertEqual(timeline[1]['time'], datetime(2014, 3, 1, 13, 0))
+
+        hours = models.TweetCount.get_timeline(datetime(2014, 3, 1), resolution=models.TweetCount.HOUR)
+        self.assertEqual([row['tweets'] for row in hours], [2, 2])
+
+        self.assertAlmostEqual(models.TweetCount.get_average_rate(), 4 / 120.0)
+
+    def test_remove_counts(self):
+        """Deleted tweets should be taken off the counts, and emptied buckets dropped"""
+        start = datetime(2014, 3, 1, 12, 59, 30)
+        models.TweetCount.add_counts([start, start + timedelta(seconds=10), start + timedelta(seconds=40)])
+        models.TweetCount.remove_counts([start, start + timedelta(seconds=10)])
+
+        timeline = models.TweetCount.get_timeline(datetime(2014, 3, 1, 12, 0))
+        self.assertEqual(timeline, [{'time': datetime(2014, 3, 1, 13, 0), 'tweets': 1}])
+
+        models.TweetCount.remove_range(datetime(2014, 3, 1), datetime(2014, 3, 2))
+        self.assertFalse(models.TweetCount.objects.exists())
+
+    def test_running_count(self):
+        """The running count should start on the first insert, and follow deletes"""
+        self.assertEqual(models.TweetTableStats.get_tweet_count(Tweet), None)
+
+        models.TweetTableStats.add_tweets(Tweet, 10)
+        models.TweetTableStats.add_tweets(Tweet, -3)
+        self.assertEqual(models.TweetTableStats.get_tweet_count(Tweet), 7)
+
+        models.TweetTableStats.set_tweet_count(Tweet, 2)
+        self.assertEqual(models.TweetTableStats.get_tweet_count(Tweet), 2)
+
+
 class TweetCreateFromJsonTest(TestCase):
 
     def validate_json(self, tweet_json, correct_data):
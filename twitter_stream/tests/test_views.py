@@ -0,0 +1,141 @@
+import json
+from django.core.cache import cache
+from django.test import TestCase
+from twitter_stream import settings, views
+
+
+class StatusCacheTest(TestCase):
+
+    def setUp(self):
+        cache.delete(views.STATUS_CACHE_KEY)
+        cache.delete(views.STATUS_LOCK_KEY)
+
+        self.computed = 0
+        self.original = views.stream_status, settings.STATUS_CACHE_SECONDS
+
+        def stream_status():
+            self.computed += 1
+            return {'computed': self.computed}
+
+        views.stream_status = stream_status
+
+    def tearDown(self):
+        views.stream_status, settings.STATUS_CACHE_SECONDS = self.original
+
+    def test_cached(self):
+        settings.STATUS_CACHE_SECONDS = 60
+
+        self.assertEqual(views.cached_stream_status(), {'computed': 1})
+        self.assertEqual(views.cached_stream_status(), {'computed': 1})
+        self.assertEqual(self.computed, 1)
+
+    def test_stale_while_recomputing(self):
+        settings.STATUS_CACHE_SECONDS = 60
+        views.cached_stream_status()
+
+        # Expire it while someone else is computing the next one
+        cache.set(views.STATUS_CACHE_KEY, (0, {'computed': 1}))
+        cache.add(views.STATUS_LOCK_KEY, True)
+
+        self.assertEqual(views.cached_stream_status(), {'computed': 1})
+        self.assertEqual(self.computed, 1)
+
+        cache.delete(views.STATUS_LOCK_KEY)
+        self.assertEqual(views.cached_stream_status(), {'computed': 2})
+
+    def test_no_cache(self):
+        settings.STATUS_CACHE_SECONDS = 0
+
+        views.cached_stream_status()
+        views.cached_stream_status()
+        self.assertEqual(self.computed, 2)
+
+
+class StatusEventsTest(TestCase):
+
+    status = {
+        'running': True,
+        'terms': ['hello'],
+        'processes': [],
+        'tweet_count': 10,
+        'earliest': None,
+        'latest': None,
+        'avg_rate': None,
+        'timeline': [{'time': '2014-03-01T12:00:00', 'tweets': 4},
+                     {'time': '2014-03-01T12:01:00', 'tweets': 6}],
+    }
+
+    def setUp(self):
+        self.original = (views.cached_stream_status, views._render_to_string_request,
+                         settings.STATUS_CACHE_SECONDS, settings.STATUS_EVENTS_SECONDS)
+
+        self.statuses = [self.status, dict(self.status, timeline=[
+            {'time': '2014-03-01T12:01:00', 'tweets': 6},
+            {'time': '2014-03-01T12:02:00', 'tweets': 1},
+        ])]
+        views.cached_stream_status = lambda: self.statuses[0]
+        views._render_to_string_request = lambda request, template, dictionary: 'display'
+        settings.STATUS_CACHE_SECONDS = 0.01
+        settings.STATUS_EVENTS_SECONDS = 60
+
+    def tearDown(self):
+        (views.cached_stream_status, views._render_to_string_request,
+         settings.STATUS_CACHE_SECONDS, settings.STATUS_EVENTS_SECONDS) = self.original
+
+    def parse(self, event):
+        name, data = event.split('\n')[:2]
+        return name[len('event: '):], json.loads(data[len('data: '):])
+
+    def test_only_changes_sent(self):
+        """After the first events, only the changed minutes should be sent"""
+        events = views._status_events(None)
+        self.assertEqual(next(events), 'retry: 1000\n\n')
+        self.assertEqual(self.parse(next(events)), ('display', 'display'))
+        self.assertEqual(self.parse(next(events)), ('timeline', {
+            'start': '2014-03-01T12:00:00',
+            'changed': self.status['timeline'],
+        }))
+
+        self.statuses.pop(0)
+        self.assertEqual(self.parse(next(events)), ('timeline', {
+            'start': '2014-03-01T12:01:00',
+            'changed': [{'time': '2014-03-01T12:02:00', 'tweets': 1}],
+        }))
+
+        # Nothing new, but something to keep the connection open
+        self.assertTrue(next(events).startswith(':'))
+
+    def test_figures_sent_alone(self):
+        """A changed figure should be sent on its own, without the whole display"""
+        events = views._status_events(None)
+        for i in range(3):
+            next(events)
+
+        self.statuses[0] = dict(self.status, tweet_count=12)
+        self.assertEqual(self.parse(next(events)), ('figures', {'tweet_count': '12'}))
+
+    def test_empty_timeline(self):
+        """A timeline that empties out should be sent, so the chart is cleared"""
+        events = views._status_events(None)
+        for i in range(3):
+            next(events)
+
+        self.statuses[0] = dict(self.status, timeline=[])
+        self.assertEqual(self.parse(next(events)), ('timeline', {'start': None, 'changed': []}))
+
+    def test_connection_slots(self):
+        """Connections past the limit should be turned away until one closes"""
+        original = settings.STATUS_EVENTS_MAX_CONNECTIONS
+        settings.STATUS_EVENTS_MAX_CONNECTIONS = 1
+        try:
+            slot = views._take_events_slot()
+            self.assertNotEqual(slot, None)
+            self.assertEqual(views._take_events_slot(), None)
+
+            events = views._status_events(None, slot)
+            next(events)
+            events.close()
+            self.assertEqual(views._take_events_slot(), slot)
+        finally:
+            settings.STATUS_EVENTS_MAX_CONNECTIONS = original
+            cache.delete(slot)
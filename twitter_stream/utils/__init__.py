@@ -1,2 +1,3 @@
 from .file_stream import FakeTwitterStream, FakeTermChecker
-from .streaming import FeelsTermChecker, QueueStreamListener
+from .streaming import FeelsTermChecker, QueueStreamListener, QueueWriter
+from .parallel import ParallelFileReplay
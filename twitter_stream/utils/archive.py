@@ -0,0 +1,268 @@
+"""
+Reading and writing tweet archive files, optionally compressed and rotated.
+
+Archives are JSON-formatted tweets, one per line. They can be
+compressed with gzip or, if the zstandard package is installed, zstd.
+Compressed files are recognized by their contents when read back,
+so they can be replayed just like plain files.
+"""
+
+import io
+import os
+import glob
+import gzip
+import time
+import shutil
+import logging
+import itertools
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['RotatingArchiveWriter', 'open_archive', 'open_archive_lines', 'open_archive_chunks', 'iter_chunks']
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+COMPRESSION_EXTENSIONS = {
+    None: '',
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+# For reading archives in chunks rather than lines
+CHUNK_SIZE = 1024 * 1024
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Install the zstandard package to use zstd compression")
+    return zstandard
+
+
+class RotatingArchiveWriter(object):
+    """
+    Appends to an archive file, starting a new segment once the current one
+    has max_bytes of (uncompressed) data, or is max_seconds old.
+
+    Without rotation, data is appended to the given path (plus an extension
+    for the compression). With rotation, each segment gets its own file,
+    named with a timestamp, so that the segments sort in order.
+
+    Each segment is written to a temporary file (named after the process)
+    and renamed once it is closed, so a compressed file is never left
+    truncated under its real name. Appending to an existing file copies it
+    into the temporary file first. If the process is killed, what it wrote
+    is left in the temporary file, and synced data there is still readable.
+    """
+
+    GZIP_LEVEL = 6
+    ZSTD_LEVEL = 3
+
+    # Compressed output is flushed less often, since each flush hurts compression
+    COMPRESSED_FLUSH_INTERVAL = 10
+
+    BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, path, compression=None, max_bytes=None, max_seconds=None):
+        if compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError("Unknown compression %s" % compression)
+        if compression == 'zstd':
+            _import_zstandard()
+
+        self.path = path
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+
+        self.segment_path = None
+        self._temp_path = None
+        self._raw_file = None
+        self._file = None
+        self._bytes = 0
+        self._opened_at = None
+        self._flushed_at = None
+
+    @property
+    def rotating(self):
+        return bool(self.max_bytes or self.max_seconds)
+
+    @property
+    def closed(self):
+        return self._file is None
+
+    def write(self, data):
+        if self._file is None or self._should_rotate():
+            self._open_segment()
+
+        self._file.write(data)
+        self._bytes += len(data)
+
+    def flush(self):
+        if self._file is None:
+            return
+
+        if self.compression:
+            now = time.time()
+            if now - self._flushed_at < self.COMPRESSED_FLUSH_INTERVAL:
+                return
+            self._flushed_at = now
+
+        self._file.flush()
+
+    def sync(self):
+        """
+        Flushes everything written so far all the way to disk,
+        e.g. before deleting the originals.
+        """
+        if self._file is None:
+            return
+
+        self._file.flush()
+        raw_file = self._raw_file or self._file
+        raw_file.flush()
+        os.fsync(raw_file.fileno())
+        self._flushed_at = time.time()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            if self._raw_file is not None:
+                self._raw_file.close()
+            self._file = None
+            self._raw_file = None
+
+            # The compressors may close the file themselves, so sync it separately
+            fd = os.open(self._temp_path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.rename(self._temp_path, self.segment_path)
+            self._temp_path = None
+
+    def _should_rotate(self):
+        if self.max_bytes and self._bytes >= self.max_bytes:
+            return True
+        if self.max_seconds and time.time() - self._opened_at >= self.max_seconds:
+            return True
+        return False
+
+    def _segment_path(self):
+        extension = COMPRESSION_EXTENSIONS[self.compression]
+        if not self.rotating:
+            return self.path + extension
+
+        root, ext = os.path.splitext(self.path)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        return '%s-%s%s%s' % (root, stamp, ext, extension)
+
+    def _open_segment(self):
+        self.close()
+
+        self.segment_path = self._segment_path()
+        if self.rotating:
+            logger.info("Starting archive segment %s", self.segment_path)
+
+        self._temp_path = '%s.%d.tmp' % (self.segment_path, os.getpid())
+        raw_file = open(self._temp_path, 'wb', self.BUFFER_SIZE)
+
+        # Gzip members, zstd frames and lines can all just be concatenated
+        if os.path.exists(self.segment_path):
+            with open(self.segment_path, 'rb') as existing:
+                shutil.copyfileobj(existing, raw_file)
+
+        if self.compression == 'gzip':
+            self._raw_file = raw_file
+            self._file = gzip.GzipFile(fileobj=self._raw_file, mode='ab',
+                                       compresslevel=self.GZIP_LEVEL)
+        elif self.compression == 'zstd':
+            zstandard = _import_zstandard()
+            self._raw_file = raw_file
+            compressor = zstandard.ZstdCompressor(level=self.ZSTD_LEVEL)
+            self._file = compressor.stream_writer(self._raw_file)
+        else:
+            self._file = raw_file
+
+        self._bytes = 0
+        self._opened_at = self._flushed_at = time.time()
+
+
+def open_archive(path):
+    """
+    Opens an archive file for reading lines (as bytes),
+    decompressing it if necessary.
+    """
+    infile = open(path, 'rb')
+    magic = infile.read(4)
+    infile.seek(0)
+
+    if magic.startswith(GZIP_MAGIC):
+        # Let gzip open the file itself, so that closing it closes the file
+        infile.close()
+        return gzip.open(path, 'rb')
+
+    elif magic.startswith(ZSTD_MAGIC):
+        zstandard = _import_zstandard()
+        reader = zstandard.ZstdDecompressor().stream_reader(infile, read_across_frames=True)
+        return io.BufferedReader(reader)
+
+    return infile
+
+
+def archive_paths(path):
+    """
+    Returns the files to read for a path, which may also be a glob pattern
+    (e.g. "tweets-*.json.gz") matching several rotated segments.
+    They are returned in name order, which is the order they were written.
+    """
+    if glob.has_magic(path):
+        paths = sorted(glob.glob(path))
+        if not paths:
+            raise IOError("No files match %s" % path)
+        return paths
+    return [path]
+
+
+def open_archive_lines(path):
+    """
+    Returns an iterator over the lines of an archive file,
+    or of all the files matching a glob pattern, one after the other.
+    """
+    return itertools.chain.from_iterable(_read_lines(p) for p in archive_paths(path))
+
+
+def open_archive_chunks(path, size=CHUNK_SIZE):
+    """
+    Like open_archive_lines(), but returns an iterator over chunks of (decompressed) data.
+    """
+    return itertools.chain.from_iterable(_read_chunks(p, size) for p in archive_paths(path))
+
+
+def iter_chunks(infile, size=CHUNK_SIZE):
+    """
+    Returns an iterator over chunks of data read from a file object.
+    """
+    return iter(lambda: infile.read(size), b'')
+
+
+def _read_lines(path):
+    logger.info("Reading %s", path)
+    infile = open_archive(path)
+    try:
+        for line in infile:
+            yield line
+    finally:
+        infile.close()
+
+
+def _read_chunks(path, size):
+    logger.info("Reading %s", path)
+    infile = open_archive(path)
+    try:
+        for chunk in iter_chunks(infile, size):
+            yield chunk
+    finally:
+        infile.close()
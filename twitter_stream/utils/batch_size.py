@@ -0,0 +1,122 @@
+"""
+Chooses how many tweets to insert per statement.
+"""
+
+__all__ = ['BatchSizer']
+
+
+class BatchSizer(object):
+    """
+    Keeps track of the insert batch size and of how fast batches go in.
+
+    If adaptive, the size is tuned as batches are inserted: it keeps moving
+    in the same direction (bigger or smaller) while rows / sec improves,
+    and turns around when it gets worse. A batch that takes longer than
+    max_latency, or fails, halves the size right away.
+    """
+
+    # Each step multiplies or divides the size by this
+    GROWTH = 1.5
+
+    # Full batches to average over before taking another step
+    SAMPLES_PER_STEP = 3
+
+    # Weight of the newest batch in the average rate
+    SMOOTHING = 0.3
+
+    def __init__(self, size, min_size=1, max_size=None, max_latency=None, adaptive=False):
+        self.min_size = max(1, min_size)
+        self.max_size = max_size
+        self.max_latency = max_latency
+        self.adaptive = adaptive
+
+        self.size = self.clamp(size) if adaptive else size
+
+        # +1 to grow, -1 to shrink
+        self.direction = 1
+
+        # Recent rows / sec, for reporting
+        self.rate = None
+
+        # Full batches inserted at the current size
+        self.samples = 0
+        self.sample_rows = 0
+        self.sample_time = 0.0
+
+        # Rows / sec at the previous size
+        self.previous_rate = None
+
+    def clamp(self, size):
+        size = max(self.min_size, int(size))
+        if self.max_size:
+            size = min(self.max_size, size)
+        return size
+
+    def record(self, count, elapsed, batches=1):
+        """
+        Reports that count rows were inserted in elapsed seconds,
+        in that many batches of the current size (e.g. all in one transaction).
+        """
+        if count == 0:
+            return
+
+        # What each batch cost, on average
+        latency = elapsed / max(batches, 1)
+        if self.adaptive and self.max_latency and latency > self.max_latency:
+            # Too slow: back off right away
+            self.direction = -1
+            self.resize(self.size / 2.0)
+            return
+
+        rate = count / max(elapsed, 1e-6)
+        if self.rate is None:
+            self.rate = rate
+        else:
+            self.rate += self.SMOOTHING * (rate - self.rate)
+
+        # A partial batch says little about the current size
+        if not self.adaptive or count < self.size:
+            return
+
+        self.samples += 1
+        self.sample_rows += count
+        self.sample_time += elapsed
+        if self.samples < self.SAMPLES_PER_STEP:
+            return
+
+        # Keep going the way that helped
+        step_rate = self.sample_rows / max(self.sample_time, 1e-6)
+        if self.previous_rate is not None and step_rate < self.previous_rate:
+            self.direction = -self.direction
+        self.previous_rate = step_rate
+
+        self.reset_samples()
+        self.resize(self.size * self.GROWTH ** self.direction)
+
+    def failed(self):
+        """
+        Reports that a batch failed to insert, e.g. because it was too big.
+        """
+        if self.adaptive:
+            self.direction = -1
+            self.resize(self.size / 2.0)
+
+    def cap(self, max_size):
+        """
+        Lowers the largest size, e.g. to the most rows the database
+        takes per statement, since bigger sizes would make no difference.
+        """
+        if self.max_size is None or max_size < self.max_size:
+            self.max_size = max_size
+            self.resize(self.size)
+
+    def resize(self, size):
+        size = self.clamp(size)
+        if size != self.size:
+            self.size = size
+            self.reset_samples()
+
+    def reset_samples(self):
+        self.samples = 0
+        self.sample_rows = 0
+        self.sample_time = 0.0
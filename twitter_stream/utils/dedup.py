@@ -0,0 +1,71 @@
+"""
+Skipping tweets that were saved recently.
+"""
+
+from collections import OrderedDict
+
+__all__ = ['RecentIds']
+
+
+class RecentIds(object):
+    """
+    Remembers the most recently seen tweet ids, up to 'size' of them,
+    forgetting the least recently seen first.
+
+    An LRU rather than a Bloom filter: it never skips a tweet that
+    was not seen, and popular retweets stay in it as long as they keep
+    coming back. It takes roughly 100 bytes per id.
+    """
+
+    def __init__(self, size):
+        if size <= 0:
+            raise ValueError("Size must be positive")
+
+        self.size = size
+        self.ids = OrderedDict()
+
+        # How many ids were checked, and how many had been seen
+        self.checked = 0
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, tweet_id):
+        return tweet_id in self.ids
+
+    def seen(self, tweet_id):
+        """
+        Returns True if the id was seen recently.
+        Either way, it becomes the most recently seen id.
+        """
+        self.checked += 1
+
+        ids = self.ids
+        if tweet_id in ids:
+            self.hits += 1
+
+            # Move it to the end
+            del ids[tweet_id]
+            ids[tweet_id] = None
+            return True
+
+        ids[tweet_id] = None
+        if len(ids) > self.size:
+            ids.popitem(last=False)
+        return False
+
+    def forget(self, tweet_ids):
+        """
+        Removes ids, e.g. of tweets that failed to save.
+        """
+        for tweet_id in tweet_ids:
+            self.ids.pop(tweet_id, None)
+
+    def hit_rate(self):
+        """
+        Returns the fraction of checked ids that had been seen.
+        """
+        if not self.checked:
+            return 0.0
+        return float(self.hits) / self.checked
@@ -0,0 +1,91 @@
+"""
+JSON decoding and encoding for tweets, using the fastest library available.
+
+The backend is chosen with the JSON_BACKEND setting: one of
+'orjson', 'ujson', 'simdjson', or 'json' (the standard library).
+The default, 'auto', uses the first of those that is installed.
+
+loads() accepts text, bytes, or a memoryview.
+dumps() always returns UTF-8 encoded bytes.
+"""
+
+import json
+import logging
+
+from twitter_stream import settings
+
+__all__ = ['loads', 'dumps', 'backend_name']
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('orjson', 'ujson', 'simdjson', 'json')
+
+
+def _json_loads(data):
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+def _json_dumps(obj):
+    return json.dumps(obj).encode('utf-8')
+
+
+def get_backend(name):
+    """
+    Returns a (loads, dumps) pair for the named backend.
+    Raises ImportError if it is not installed.
+    """
+    if name == 'orjson':
+        import orjson
+        return orjson.loads, orjson.dumps
+
+    elif name == 'ujson':
+        import ujson
+
+        def ujson_loads(data):
+            if isinstance(data, memoryview):
+                data = data.tobytes()
+            return ujson.loads(data)
+
+        def ujson_dumps(obj):
+            return ujson.dumps(obj).encode('utf-8')
+
+        return ujson_loads, ujson_dumps
+
+    elif name == 'simdjson':
+        import simdjson
+
+        def simdjson_loads(data):
+            if isinstance(data, memoryview):
+                data = data.tobytes()
+            return simdjson.loads(data)
+
+        # simdjson only speeds up decoding
+        return simdjson_loads, _json_dumps
+
+    elif name == 'json':
+        return _json_loads, _json_dumps
+
+    raise ValueError("Unknown JSON backend %s" % name)
+
+
+def find_backend(name='auto'):
+    """
+    Returns the name and (loads, dumps) pair of the requested backend,
+    or of the first installed backend if name is 'auto'.
+    """
+    if name != 'auto':
+        return name, get_backend(name)
+
+    for name in BACKENDS:
+        try:
+            return name, get_backend(name)
+        except ImportError:
+            pass
+
+
+backend_name, (loads, dumps) = find_backend(settings.JSON_BACKEND)
+logger.debug("Using %s for JSON", backend_name)
@@ -12,12 +12,17 @@ For example:
 
 import time
 import os
-import json
+import mmap
+import glob
 import logging
 import threading
 
 import twitter_monitor
 from twitter_stream import models
+from . import fastjson
+from .archive import open_archive_lines, open_archive_chunks, iter_chunks, GZIP_MAGIC, ZSTD_MAGIC
+from .jsonstream import iter_json_objects
+from .rate_limit import TokenBucket, ReplayPacer
 
 logger = logging.getLogger(__name__)
 
@@ -48,8 +53,12 @@ class FakeTermChecker(twitter_monitor.TermChecker):
         # Process the tweet queue -- this is more important
         # to do regularly than updating the tracking terms
         # Update the process status in the database
-        self.process.tweet_rate = self.listener.process_tweet_queue()
+        if self.listener.writer is not None:
+            self.process.tweet_rate = self.listener.writer.get_tweet_rate()
+        else:
+            self.process.tweet_rate = self.listener.process_tweet_queue()
         self.process.error_count = self.error_count
+        self.listener.update_stats(self.process)
         self.process.status = models.StreamProcess.STREAM_STATUS_RUNNING
         self.process.heartbeat()
 
@@ -65,6 +74,95 @@ class FakeTermChecker(twitter_monitor.TermChecker):
 # the chunk size for reading in the file
 TWEETS_BETWEEN_PROGRESS = 7000
 
+WHITESPACE = b' \t\r\n'
+
+
+class MappedTweetFile(object):
+    """
+    Scans a plain tweet file through a memory map.
+
+    Records are found with bytes searches over the whole file,
+    and handed out as memoryview slices of the map, so a tweet
+    is never copied before it is decoded.
+
+    Slices are only valid until the next record is read.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            self.view = memoryview(self.map)
+        except TypeError:
+            # Python 2 cannot make a memoryview of an mmap, so slices are copies
+            self.view = self.map
+
+    @classmethod
+    def can_map(cls, tweets_file):
+        """
+        True if the tweets file is a single, non-empty, uncompressed file.
+        """
+        if hasattr(tweets_file, 'read') or glob.has_magic(tweets_file):
+            return False
+        if not os.path.isfile(tweets_file) or os.path.getsize(tweets_file) == 0:
+            return False
+
+        with open(tweets_file, 'rb') as infile:
+            magic = infile.read(4)
+        return not (magic.startswith(GZIP_MAGIC) or magic.startswith(ZSTD_MAGIC))
+
+    def record(self, start, end):
+        """
+        Returns the bytes between start and end, minus surrounding whitespace,
+        or None if there is nothing there.
+        """
+        data = self.map
+        while start < end and data[start:start + 1] in WHITESPACE:
+            start += 1
+        while end > start and data[end - 1:end] in WHITESPACE:
+            end -= 1
+
+        if start == end:
+            return None
+        return self.view[start:end]
+
+    def lines(self):
+        """
+        Yields each non-blank line of the file.
+        """
+        data = self.map
+        view = self.view
+        find = data.find
+        size = len(data)
+        start = 0
+
+        while start < size:
+            end = find(b'\n', start)
+            if end < 0:
+                end = size
+
+            if data[start:start + 1] == b'{':
+                # The usual case: the decoder can skip any trailing whitespace
+                yield view[start:end]
+            else:
+                record = self.record(start, end)
+                if record is not None:
+                    yield record
+
+            start = end + 1
+
+    def close(self):
+        try:
+            if self.view is not self.map:
+                self.view.release()
+            self.map.close()
+        except BufferError:
+            # A slice is still in use somewhere (e.g. in a traceback);
+            # the map goes away with it
+            pass
+        self.file.close()
+
 class FakeTwitterStream(object):
     """
     A tweet processor with a similar interface to the
@@ -72,12 +170,15 @@ class FakeTwitterStream(object):
     reading in a separate thread.
     """
     def __init__(self, tweets_file, listener, term_checker,
-                 limit=None, rate_limit=None, pretty=False):
+                 limit=None, rate_limit=None, pretty=False, burst=None,
+                 replay_speed=None):
 
         self.tweets_file = tweets_file
 
         self.limit = limit
         self.rate_limit = rate_limit
+        self.burst = burst
+        self.replay_speed = replay_speed
         self.pretty = pretty
 
         self.listener = listener
@@ -94,36 +195,36 @@ class FakeTwitterStream(object):
         self.last_created_at = tweet['created_at']
         return self.listener.on_status(tweet)
 
-    def next_tweet_pretty(self, infile):
-        # start our read loop with valid data
-
-        raw = ''
-        tweet_start_found = False
+    def next_tweet(self, infile):
+        return next(infile, None)
 
+    def read_records(self, infile):
+        """
+        Yields the raw JSON of each tweet in an iterator over lines (as bytes).
+        """
         while True:
-            try:
-                line = next(infile)
-            except StopIteration:
-                return None
-
-            if line[0] == '{':
-                # start of tweet
-                tweet_start_found = True
-                raw = ''
-                raw += line
-            elif line[0:2] == '},' and tweet_start_found == True:
-                # end of tweet
-                raw += line[0]
-                tweet_start_found = False
-
-                return raw
-
-            elif tweet_start_found == True:
-                # some line in the middle
-                raw += line
+            raw = self.next_tweet(infile)
+            if raw is None:
+                return
 
-    def next_tweet(self, infile):
-        return next(infile, None)
+            raw = raw.strip()
+            if len(raw) > 0:
+                yield raw
+
+    def decode_records(self, records):
+        """
+        Yields each tweet, along with its raw JSON.
+        """
+        for raw in records:
+            yield fastjson.loads(raw), raw
+
+    def read_pretty(self, chunks):
+        """
+        Yields each tweet from pretty-printed JSON (or any other layout),
+        read in chunks. The raw JSON is not kept.
+        """
+        for tweet in iter_json_objects(chunks):
+            yield tweet, None
 
     def run(self):
 
@@ -131,39 +232,54 @@ class FakeTwitterStream(object):
         if self.limit:
             logger.info("up to %d tweets..." % self.limit)
 
+        mapped = None
         if hasattr(self.tweets_file, 'read'):
-            infile = self.tweets_file
+            # Read bytes, even from stdin on Python 3
+            infile = getattr(self.tweets_file, 'buffer', self.tweets_file)
+            if self.pretty:
+                tweets = self.read_pretty(iter_chunks(infile))
+            else:
+                tweets = self.decode_records(self.read_records(infile))
+        elif self.pretty:
+            # Possibly compressed, possibly several files
+            tweets = self.read_pretty(open_archive_chunks(self.tweets_file))
+        elif MappedTweetFile.can_map(self.tweets_file):
+            # Scan the file in place
+            mapped = MappedTweetFile(self.tweets_file)
+            tweets = self.decode_records(mapped.lines())
         else:
-            infile = open(self.tweets_file, "rt")
+            tweets = self.decode_records(self.read_records(open_archive_lines(self.tweets_file)))
+
+        try:
+            self.read_tweets(tweets)
+        finally:
+            # Finish the generators first, so that they let go of any files
+            tweets.close()
+            if mapped is not None:
+                mapped.close()
+
+    def read_tweets(self, tweets):
 
         tweet_count = 0
         last_report_count = 0
 
+        limiter = None
         if self.rate_limit:
-            time_of_last_tweet = time.time()
-            time_between_tweets = 1.0 / self.rate_limit
-
-        while True:
-            if self.pretty:
-                raw = self.next_tweet_pretty(infile)
-            else:
-                raw = self.next_tweet(infile)
-
-            if raw is None:
-                break
+            limiter = TokenBucket(self.rate_limit, burst=self.burst)
 
-            raw = raw.strip()
-            if len(raw) == 0:
-                continue
+        pacer = None
+        if self.replay_speed:
+            pacer = ReplayPacer(self.replay_speed)
 
-            tweet = json.loads(raw)
+        for tweet, raw in tweets:
 
             # make sure it is a tweet
             if 'user' in tweet:
 
-                if self.rate_limit:
-                    while time.time() - time_of_last_tweet < time_between_tweets:
-                        time.sleep(time_between_tweets)
+                if limiter:
+                    limiter.acquire()
+                elif pacer:
+                    pacer.wait(models.parse_datetime(tweet['created_at']))
 
                 if self.process(tweet, raw) is False:
                     logger.warn("Stopping file stream")
@@ -171,13 +287,16 @@ class FakeTwitterStream(object):
 
                 tweet_count += 1
 
-                if self.rate_limit:
-                    time_of_last_tweet = time.time()
-
             if tweet_count - last_report_count > TWEETS_BETWEEN_PROGRESS:
                 last_report_count = tweet_count
 
                 logger.info("Read in %d tweets", tweet_count)
+                if limiter:
+                    logger.info("Reading at %.1f tweets / sec (target %.1f)",
+                                limiter.achieved_rate(), limiter.rate)
+                elif pacer:
+                    logger.info("Replaying at %.1fx speed, %.1f seconds behind",
+                                pacer.speed, pacer.lag())
                 if self.last_created_at:
                     logger.info('Inserted tweets up to %s', str(self.last_created_at))
 
@@ -186,6 +305,9 @@ class FakeTwitterStream(object):
                 break
 
         logger.info("Read in %d tweets (total)", tweet_count)
+        if limiter:
+            logger.info("Read at %.1f tweets / sec (target %.1f)",
+                        limiter.achieved_rate(), limiter.rate)
         if self.last_created_at:
             logger.info('Tweets stopped at %s', str(self.last_created_at))
         logger.info("Done reading file.")
@@ -0,0 +1,219 @@
+"""
+An append-only on-disk journal for tweets that do not fit in memory.
+
+The journal is a directory of numbered segment files. Each segment
+holds raw statuses in JSON format, one per line (the same format
+as stream --to-file), so a segment can also be replayed by hand
+with stream --from-file.
+
+Segments are read back oldest-first, a batch at a time, and only deleted
+after all their tweets have been saved, so a crash means duplicates, not losses.
+"""
+
+import os
+import re
+import logging
+import threading
+
+from . import fastjson
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['OverflowJournal']
+
+
+class OverflowJournal(object):
+    """
+    A segmented, append-only journal of raw statuses.
+
+    append() is meant to be called on the streaming thread, while
+    read_oldest() and mark_saved() are called by whoever is saving tweets.
+    """
+
+    SEGMENT_NAME = 'segment-%012d.json'
+    SEGMENT_PATTERN = re.compile(r'^segment-(\d+)\.json$')
+
+    # Leaves room for prepending segments in front of the first one
+    FIRST_SEQUENCE = 1000000
+
+    def __init__(self, directory, segment_size):
+        self.directory = directory
+        self.segment_size = segment_size
+
+        self.lock = threading.Lock()
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # Pick up any segments left over from a previous process
+        self.segments = []
+        for name in os.listdir(directory):
+            match = self.SEGMENT_PATTERN.match(name)
+            if match:
+                self.segments.append(int(match.group(1)))
+        self.segments.sort()
+
+        if self.segments:
+            logger.warn("Found %d journal segments in %s", len(self.segments), directory)
+
+        # The segment currently being appended to
+        self._file = None
+        self._file_size = 0
+
+        # How far into each segment the statuses have been saved, and where
+        # the statuses read but not saved yet end, as (sequence, offset, finished).
+        # Not kept across restarts, which replay whole segments again.
+        self._saved_offsets = {}
+        self._unsaved_position = None
+
+    @property
+    def pending(self):
+        """True if there are journaled tweets waiting to be saved."""
+        return len(self.segments) > 0
+
+    def path(self, sequence):
+        return os.path.join(self.directory, self.SEGMENT_NAME % sequence)
+
+    def append(self, status):
+        """
+        Adds a status to the end of the journal.
+
+        The status is handed to the operating system right away, so it
+        survives the process dying; segments are synced to disk as they are closed.
+        """
+        line = self.encode(status)
+
+        with self.lock:
+            if self._file is None or self._file_size >= self.segment_size:
+                self._open_segment()
+
+            self._file.write(line)
+            self._file.flush()
+            self._file_size += len(line)
+
+    def prepend(self, statuses):
+        """
+        Writes a list of statuses into a new segment at the front of the journal,
+        so that they will be read back before anything already journaled.
+        """
+        if not statuses:
+            return
+
+        data = b''.join(self.encode(status) for status in statuses)
+
+        with self.lock:
+            if self.segments:
+                sequence = self.segments[0] - 1
+            else:
+                sequence = self.FIRST_SEQUENCE
+
+            # Write to a temporary name first so a half-written
+            # segment is never mistaken for a complete one
+            path = self.path(sequence)
+            with open(path + '.tmp', 'wb') as outfile:
+                outfile.write(data)
+                outfile.flush()
+                os.fsync(outfile.fileno())
+            os.rename(path + '.tmp', path)
+
+            self.segments.insert(0, sequence)
+
+    def read_oldest(self, max_count=None):
+        """
+        Returns the sequence number of the oldest segment and up to max_count
+        of its statuses (by default, all of them), or (None, []) if the journal
+        is empty. Only as much of the segment is read as is returned.
+
+        Reading carries on after the statuses last passed to mark_saved(),
+        and the segment stays in the journal until all of them have been.
+        """
+        with self.lock:
+            if not self.segments:
+                return None, []
+
+            sequence = self.segments[0]
+
+            # Stop appending to this segment so it can be read safely
+            if self._file is not None and sequence == self.segments[-1]:
+                self._close_segment()
+
+            offset = self._saved_offsets.get(sequence, 0)
+
+        statuses = []
+        with open(self.path(sequence), 'rb') as infile:
+            infile.seek(offset)
+            while max_count is None or len(statuses) < max_count:
+                line = infile.readline()
+                if not line:
+                    break
+                offset += len(line)
+
+                line = line.strip()
+                if line:
+                    statuses.append(fastjson.loads(line))
+
+            finished = offset >= os.fstat(infile.fileno()).st_size
+
+        self._unsaved_position = (sequence, offset, finished)
+        return sequence, statuses
+
+    def mark_saved(self, sequence):
+        """
+        Records that the statuses last returned by read_oldest() have been saved,
+        deleting the segment if they were the last of it.
+        """
+        if self._unsaved_position is None or self._unsaved_position[0] != sequence:
+            return
+
+        sequence, offset, finished = self._unsaved_position
+        self._unsaved_position = None
+        if finished:
+            self.remove(sequence)
+        else:
+            self._saved_offsets[sequence] = offset
+
+    def encode(self, status):
+        """
+        Returns the journal line for a status.
+        Raw statuses (bytes) are written as they are.
+        """
+        if isinstance(status, bytes):
+            return status + b"\n"
+        return fastjson.dumps(status) + b"\n"
+
+    def remove(self, sequence):
+        """
+        Deletes a segment once its tweets have been saved.
+        """
+        with self.lock:
+            os.remove(self.path(sequence))
+            self.segments.remove(sequence)
+            self._saved_offsets.pop(sequence, None)
+
+    def flush(self):
+        with self.lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self.lock:
+            self._close_segment()
+
+    def _open_segment(self):
+        self._close_segment()
+
+        if self.segments:
+            sequence = self.segments[-1] + 1
+        else:
+            sequence = self.FIRST_SEQUENCE
+
+        self._file = open(self.path(sequence), 'ab')
+        self._file_size = 0
+        self.segments.append(sequence)
+
+    def _close_segment(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
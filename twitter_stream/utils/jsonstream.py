@@ -0,0 +1,137 @@
+"""
+Incremental parsing of a stream of JSON objects.
+
+Handles dumps of tweets in any layout: a JSON array of tweets, or just
+tweets one after another, pretty-printed or not, separated by any mix of
+whitespace and commas. The input is read in chunks, and only the chunk
+being parsed (plus whatever is left of the previous one) is held in
+memory, however big the file is.
+
+The end of each object is found by scanning for braces and strings,
+carrying on from where the last chunk left off, so nothing is looked
+at twice. Each complete object is then decoded with fastjson.
+Multi-byte UTF-8 characters never contain quotes, braces, or backslashes,
+so the scanning works on the raw bytes.
+"""
+
+import re
+
+from . import fastjson
+
+__all__ = ['iter_json_objects']
+
+# Allowed between objects: whitespace, commas, and the brackets of an array
+SEPARATORS = re.compile(br'[\s,\[\]]*')
+
+# Inside an object, the next thing that matters: a brace or the start of a string
+STRUCTURE = re.compile(br'[{}"]')
+
+# The rest of a string, up to (not including) the closing quote
+STRING_BODY = re.compile(br'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
+
+# Read at least this much more before carrying on with an incomplete object
+CHUNK_SIZE = 1024 * 1024
+
+# Give up if an object is still incomplete after this much
+# (tweets are a few KB, even pretty-printed)
+MAX_OBJECT_SIZE = 4 * 1024 * 1024
+
+
+def _scan_object(buf, pos, depth, in_string):
+    """
+    Scans an object from pos, with depth braces open, until it ends
+    or the buffer does. Returns the new (pos, depth, in_string);
+    depth is 0 if the object ended, just before pos.
+    """
+    end = len(buf)
+    while pos < end:
+        if in_string:
+            pos = STRING_BODY.match(buf, pos).end()
+            if buf[pos:pos + 1] != b'"':
+                # Cut off, maybe just after a backslash
+                break
+            in_string = False
+            pos += 1
+            continue
+
+        match = STRUCTURE.search(buf, pos)
+        if match is None:
+            pos = end
+            break
+
+        pos = match.end()
+        char = match.group()
+        if char == b'"':
+            in_string = True
+        elif char == b'{':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                break
+
+    return pos, depth, in_string
+
+
+def iter_json_objects(chunks, chunk_size=CHUNK_SIZE, max_object_size=MAX_OBJECT_SIZE):
+    """
+    Yields each top-level JSON object found in an iterable of UTF-8 encoded chunks.
+
+    Chunks can be split anywhere, even in the middle of a character.
+    Raises ValueError if the input is not valid JSON, as soon as the
+    object it is in ends (or something other than an object turns up).
+    """
+    chunks = iter(chunks)
+
+    buf = b''
+    pos = 0
+
+    # Where the object being scanned starts, if there is one
+    start = None
+    depth = 0
+    in_string = False
+
+    eof = False
+
+    while True:
+        if start is None:
+            pos = SEPARATORS.match(buf, pos).end()
+            if pos < len(buf):
+                if buf[pos:pos + 1] != b'{':
+                    raise ValueError("Expected a JSON object, not %r" % buf[pos:pos + 20])
+                start, depth, in_string = pos, 1, False
+                pos += 1
+
+        if start is not None:
+            pos, depth, in_string = _scan_object(buf, pos, depth, in_string)
+            if depth == 0:
+                value = fastjson.loads(buf[start:pos])
+                start = None
+                yield value
+                continue
+
+            if eof:
+                raise ValueError("Incomplete JSON object at the end (%d bytes)" % (len(buf) - start))
+            if pos - start > max_object_size:
+                raise ValueError("No complete JSON object in %d bytes" % (pos - start))
+
+        elif eof:
+            return
+
+        # Drop what has been parsed, and read some more
+        keep = start if start is not None else pos
+        pieces = [buf[keep:]]
+        size = 0
+        while size < chunk_size:
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+                break
+
+            pieces.append(chunk)
+            size += len(chunk)
+
+        buf = b''.join(pieces)
+        pos -= keep
+        if start is not None:
+            start -= keep
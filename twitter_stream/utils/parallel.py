@@ -0,0 +1,262 @@
+"""
+Replays a large tweet file with several worker processes at once.
+
+The file is split into byte ranges that begin and end on line
+boundaries. Each worker parses and inserts the tweets in its own
+range, independently of the others. The parent process only collects
+progress reports and keeps a single StreamProcess record up to date.
+
+Only plain (uncompressed) files with one JSON tweet per line can be
+split this way, since workers need to seek into the middle of the file.
+"""
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import os
+import sys
+import time
+import signal
+import logging
+import multiprocessing
+
+from twitter_stream import models, settings
+from . import fastjson
+from .archive import GZIP_MAGIC, ZSTD_MAGIC
+
+__all__ = ['ParallelFileReplay', 'split_file']
+
+logger = logging.getLogger(__name__)
+
+
+def split_file(path, parts):
+    """
+    Returns a list of up to 'parts' (start, end) byte ranges covering the file.
+    Every range starts at the beginning of a line.
+    """
+    size = os.path.getsize(path)
+    boundaries = [0]
+
+    with open(path, 'rb') as infile:
+        for i in range(1, parts):
+            offset = size * i // parts
+            if offset <= boundaries[-1]:
+                continue
+
+            # Move up to the start of the next line
+            # (or stay put if we are already at one)
+            infile.seek(offset - 1)
+            infile.readline()
+            offset = infile.tell()
+
+            if boundaries[-1] < offset < size:
+                boundaries.append(offset)
+
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def replay_range(index, path, start, end, reports, batch_size):
+    """
+    Inserts the tweets between two byte offsets of a file.
+    Runs in a worker process.
+
+    Sends (index, tweets saved, bytes read) to the reports queue after each batch.
+    """
+
+    # The parent decides when to stop, and terminates us
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    # Imported here to avoid a circular import
+    from .streaming import QueueStreamListener
+
+    # Only used for its save_batch(), so it never needs to overflow
+    listener = QueueStreamListener(overflow_policy=QueueStreamListener.OVERFLOW_BLOCK)
+
+    saved = 0
+    batch = []
+    position = start
+
+    with open(path, 'rb') as infile:
+        infile.seek(start)
+
+        while position < end:
+            line = infile.readline()
+            if not line:
+                break
+            position += len(line)
+
+            line = line.strip()
+            if not line:
+                continue
+
+            status = fastjson.loads(line)
+
+            # make sure it is a tweet
+            if 'user' in status:
+                batch.append(status)
+
+            if len(batch) >= batch_size:
+                saved += listener.save_batch(batch)
+                batch = []
+                reports.put((index, saved, position - start))
+
+    saved += listener.save_batch(batch)
+    reports.put((index, saved, position - start))
+
+
+def get_fork_context():
+    """
+    Returns a multiprocessing context that forks, so that workers inherit
+    the parent's Django settings and apps, or None if processes cannot fork.
+    (Spawned workers would start without Django set up.)
+    """
+    if not hasattr(multiprocessing, 'get_context'):
+        # Python 2 always forks, except on Windows
+        return None if sys.platform == 'win32' else multiprocessing
+
+    try:
+        return multiprocessing.get_context('fork')
+    except ValueError:
+        return None
+
+
+class ParallelFileReplay(object):
+    """
+    Inserts the tweets in a file using several worker processes,
+    reporting their combined progress on a StreamProcess.
+
+    Used in place of FakeTwitterStream by the --workers option.
+    """
+
+    def __init__(self, tweets_file, workers, stream_process, batch_size=None):
+
+        if hasattr(tweets_file, 'read') or not os.path.isfile(tweets_file):
+            raise ValueError("Parallel replay needs a regular file, not %s" % tweets_file)
+
+        with open(tweets_file, 'rb') as infile:
+            magic = infile.read(4)
+        if magic.startswith(GZIP_MAGIC) or magic.startswith(ZSTD_MAGIC):
+            raise ValueError("Parallel replay does not work with compressed files")
+
+        self.context = get_fork_context()
+        if self.context is None:
+            raise ValueError("Parallel replay needs a platform where processes can fork")
+
+        self.tweets_file = tweets_file
+        self.workers = workers
+        self.process = stream_process
+        self.batch_size = batch_size or settings.INSERT_BATCH_SIZE
+
+        self.processes = []
+        self.reports = None
+
+        # Progress of each worker: tweets saved and bytes read
+        self.saved_counts = []
+        self.bytes_read = []
+        self.total_bytes = os.path.getsize(tweets_file)
+
+    def start(self):
+        """
+        Splits the file and launches the worker processes.
+        """
+        ranges = split_file(self.tweets_file, self.workers)
+        logger.info("Replaying %s with %d workers", self.tweets_file, len(ranges))
+
+        # Each worker must open its own database connection
+        from django import db
+        db.connection.close()
+
+        self.reports = self.context.Queue()
+        self.saved_counts = [0] * len(ranges)
+        self.bytes_read = [0] * len(ranges)
+
+        for index, (start, end) in enumerate(ranges):
+            process = self.context.Process(target=replay_range,
+                                           name="replay-%d" % index,
+                                           args=(index, self.tweets_file, start, end,
+                                                 self.reports, self.batch_size))
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+
+    def run(self, poll_interval):
+        """
+        Starts the workers and waits for them to finish,
+        updating the stream process every poll_interval seconds.
+
+        Returns the total number of tweets saved.
+        """
+        self.start()
+
+        last_report = time.time()
+        last_saved = 0
+
+        while any(process.is_alive() for process in self.processes):
+            self.collect(timeout=min(poll_interval, 1.0))
+
+            now = time.time()
+            if now - last_report >= poll_interval:
+                saved = sum(self.saved_counts)
+                self.heartbeat((saved - last_saved) / (now - last_report))
+                last_report = now
+                last_saved = saved
+
+        for process in self.processes:
+            process.join()
+
+        # Pick up the final reports
+        while self.collect(timeout=0.1):
+            pass
+
+        failed = [process.name for process in self.processes if process.exitcode != 0]
+        if failed:
+            logger.error("Workers failed: %s", ", ".join(failed))
+
+        saved = sum(self.saved_counts)
+        self.process.error_count = len(failed)
+        self.heartbeat(0)
+
+        logger.info("Inserted %d tweets from %s", saved, self.tweets_file)
+        return saved
+
+    def collect(self, timeout):
+        """
+        Reads the progress reports from the workers.
+        Returns False if there were none.
+        """
+        try:
+            index, saved, read = self.reports.get(timeout=timeout)
+        except queue.Empty:
+            return False
+
+        while True:
+            self.saved_counts[index] = saved
+            self.bytes_read[index] = read
+            try:
+                index, saved, read = self.reports.get_nowait()
+            except queue.Empty:
+                return True
+
+    def heartbeat(self, tweet_rate):
+        self.process.tweet_rate = tweet_rate
+        self.process.status = models.StreamProcess.STREAM_STATUS_RUNNING
+        self.process.heartbeat()
+
+        if self.total_bytes:
+            logger.info("Inserted %d tweets (%.1f%% of file) at %s tps",
+                        sum(self.saved_counts),
+                        100.0 * sum(self.bytes_read) / self.total_bytes,
+                        tweet_rate)
+
+    def terminate(self):
+        """
+        Stops any workers that are still running.
+        """
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join()
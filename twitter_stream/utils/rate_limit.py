@@ -0,0 +1,143 @@
+"""
+Rate limiting and pacing for replaying tweets from a file.
+"""
+
+import time
+
+__all__ = ['TokenBucket', 'ReplayPacer']
+
+
+class TokenBucket(object):
+    """
+    Lets tweets through at an average rate, using a token bucket.
+
+    Tokens accumulate at 'rate' per second, up to 'burst' tokens.
+    Each tweet takes a token. When there are none left, the caller
+    sleeps until a small batch of tokens is ready, rather than sleeping
+    once per tweet. Because tokens are counted from the clock, oversleeping
+    delays a batch without lowering the average rate.
+    """
+
+    # Sleep long enough to release this many seconds' worth of tweets at once
+    BATCH_SECONDS = 0.005
+
+    # By default, allow this many seconds' worth of tweets to build up
+    BURST_SECONDS = 0.1
+
+    def __init__(self, rate, burst=None, clock=time.time, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+
+        self.rate = float(rate)
+        if burst is None:
+            burst = self.rate * self.BURST_SECONDS
+        self.burst = max(1.0, float(burst))
+        self.batch = min(self.burst, max(1.0, self.rate * self.BATCH_SECONDS))
+
+        self.clock = clock
+        self.sleep = sleep
+
+        # Start full, so the first burst goes straight through
+        self.tokens = self.burst
+        self.last_refill = None
+
+        # For reporting the achieved rate
+        self.started = None
+        self.released = 0
+
+    def refill(self):
+        now = self.clock()
+        if self.last_refill is None:
+            self.started = now
+        else:
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self, count=1):
+        """
+        Waits until count tokens are available, and takes them.
+        """
+        if count > self.burst:
+            raise ValueError("Cannot take more than %d tokens at once" % self.burst)
+
+        self.refill()
+
+        # (allowing for rounding errors in the refill)
+        while count - self.tokens > 1e-6:
+            wanted = min(self.burst, max(count, self.batch))
+            self.sleep((wanted - self.tokens) / self.rate)
+            self.refill()
+
+        self.tokens -= count
+        self.released += count
+
+    def achieved_rate(self):
+        """
+        Returns the average rate since the first acquire(), per second.
+        """
+        if self.started is None:
+            return 0.0
+
+        elapsed = self.clock() - self.started
+        if elapsed <= 0:
+            return 0.0
+        return self.released / elapsed
+
+
+class ReplayPacer(object):
+    """
+    Lets tweets through with the same gaps between them as when they were
+    created, divided by 'speed'. So at speed 10, an hour of tweets takes
+    6 minutes, with the same spikes and lulls.
+
+    created_at only has whole seconds, so the tweets from one second
+    come out together. If the reader falls behind, tweets come out as fast
+    as possible until it catches up. Gaps in the original stream longer
+    than max_gap seconds (e.g. outages) are skipped.
+    """
+
+    def __init__(self, speed=1.0, max_gap=None, clock=time.time, sleep=time.sleep):
+        if speed <= 0:
+            raise ValueError("Speed must be positive")
+
+        self.speed = float(speed)
+        self.max_gap = max_gap
+
+        self.clock = clock
+        self.sleep = sleep
+
+        # The created_at of the first tweet, and when it was let through
+        self.origin = None
+        self.started = None
+
+        self.last_created_at = None
+        self.last_due = None
+
+    def wait(self, created_at):
+        """
+        Waits until it is time for a tweet created at the given datetime.
+        """
+        if self.origin is None:
+            self.origin = created_at
+            self.started = self.clock()
+
+        elif self.max_gap is not None and self.last_created_at is not None:
+            gap = (created_at - self.last_created_at).total_seconds()
+            if gap > self.max_gap:
+                # Move the origin so the gap disappears
+                self.started -= (gap - self.max_gap) / self.speed
+
+        self.last_created_at = created_at
+        self.last_due = self.started + (created_at - self.origin).total_seconds() / self.speed
+
+        delay = self.last_due - self.clock()
+        if delay > 0:
+            self.sleep(delay)
+
+    def lag(self):
+        """
+        Returns how many seconds late the last tweet was.
+        """
+        if self.last_due is None:
+            return 0.0
+        return max(0.0, self.clock() - self.last_due)
@@ -2,16 +2,25 @@ try:
     import queue
 except ImportError:
     import Queue as queue
+import collections
 import logging
+import operator
+import threading
 import time
-import json
 import sys
 
 import twitter_monitor
 from twitter_stream import settings, models
 from swapper import load_model
+from django.db import transaction
+from .journal import OverflowJournal
+from . import fastjson
+from .archive import RotatingArchiveWriter
+from .batch_size import BatchSizer
+from .dedup import RecentIds
+from .users import UserCache
 
-__all__ = ['FeelsTermChecker', 'QueueStreamListener']
+__all__ = ['FeelsTermChecker', 'QueueStreamListener', 'QueueWriter']
 
 logger = logging.getLogger(__name__)
 
@@ -19,8 +28,54 @@ logger = logging.getLogger(__name__)
 class TweetQueue(queue.Queue):
     """
     Simply extends the Queue class with get_all methods.
+
+    Also keeps track of when the oldest queued item arrived
+    so that a writer can wait for a batch to fill up or age out.
     """
 
+    def __init__(self, maxsize=0):
+        queue.Queue.__init__(self, maxsize)
+
+        # Notified when the queue becomes non-empty or reaches batch_size
+        self.batch_ready = threading.Condition(self.mutex)
+        self.batch_size = None
+        self.oldest_put_time = None
+
+    def wait_for_batch(self, batch_size, max_age, timeout=None):
+        """Block until the queue holds at least batch_size items,
+        or until the oldest queued item is max_age seconds old.
+
+        If the queue stays empty, gives up after 'timeout' seconds.
+        Returns True if a batch is ready, False otherwise.
+        """
+        self.batch_ready.acquire()
+        try:
+            self.batch_size = batch_size
+
+            if not self._qsize():
+                self.batch_ready.wait(timeout)
+                if not self._qsize():
+                    return False
+
+            deadline = self.oldest_put_time + max_age
+            while self._qsize() < batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0.0:
+                    break
+                self.batch_ready.wait(remaining)
+
+            return True
+        finally:
+            self.batch_ready.release()
+
+    def wake(self):
+        """Wake up anybody waiting for a batch."""
+        self.batch_ready.acquire()
+        try:
+            self.batch_ready.notify_all()
+        finally:
+            self.batch_ready.release()
+
     def get_all(self, block=True, timeout=None):
         """Remove and return all the items from the queue.
 
@@ -34,27 +89,15 @@ class TweetQueue(queue.Queue):
         """
         self.not_empty.acquire()
         try:
-            if not block:
-                if not self._qsize():
-                    raise queue.Empty
-            elif timeout is None:
-                while not self._qsize():
-                    self.not_empty.wait()
-            elif timeout < 0:
-                raise ValueError("'timeout' must be a non-negative number")
-            else:
-                endtime = time.time() + timeout
-                while not self._qsize():
-                    remaining = endtime - time.time()
-                    if remaining <= 0.0:
-                        raise queue.Empty
-                    self.not_empty.wait(remaining)
+            self._wait_for_items(block, timeout)
             items = self._get_all()
-            self.not_full.notify()
-            return items
+            self.not_full.notify_all()
         finally:
             self.not_empty.release()
 
+        # Copy outside the lock so the streaming thread is not held up
+        return list(items)
+
     def get_all_nowait(self):
         """Remove and return all the items from the queue without blocking.
 
@@ -63,13 +106,88 @@ class TweetQueue(queue.Queue):
         """
         return self.get_all(False)
 
+    def get_up_to(self, count, block=True, timeout=None):
+        """Remove and return at most 'count' items from the queue, oldest first.
+
+        The 'block' and 'timeout' arguments work as for get_all().
+        """
+        self.not_empty.acquire()
+        try:
+            self._wait_for_items(block, timeout)
+            if count >= self._qsize():
+                items = self._get_all()
+            else:
+                popleft = self.queue.popleft
+                items = [popleft() for _ in range(count)]
+            self.not_full.notify_all()
+        finally:
+            self.not_empty.release()
+
+        return list(items)
+
+    def get_up_to_nowait(self, count):
+        """Remove and return at most 'count' items from the queue without blocking.
+
+        Only get items if immediately available. Otherwise
+        raise the Empty exception.
+        """
+        return self.get_up_to(count, False)
+
+    def _wait_for_items(self, block, timeout):
+        """
+        Wait until the queue is not empty. Must hold the not_empty lock.
+        """
+        if not block:
+            if not self._qsize():
+                raise queue.Empty
+        elif timeout is None:
+            while not self._qsize():
+                self.not_empty.wait()
+        elif timeout < 0:
+            raise ValueError("'timeout' must be a non-negative number")
+        else:
+            endtime = time.time() + timeout
+            while not self._qsize():
+                remaining = endtime - time.time()
+                if remaining <= 0.0:
+                    raise queue.Empty
+                self.not_empty.wait(remaining)
+
+    def put_drop_oldest(self, item):
+        """Put an item into the queue without blocking, discarding
+        the oldest item if the queue is full.
+
+        Returns the number of items discarded (0 or 1).
+        """
+        self.not_empty.acquire()
+        try:
+            dropped = 0
+            if 0 < self.maxsize <= self._qsize():
+                self.queue.popleft()
+                dropped = 1
+            self._put(item)
+            self.unfinished_tasks += 1 - dropped
+            self.not_empty.notify()
+            return dropped
+        finally:
+            self.not_empty.release()
+
+    def _put(self, item):
+        size = len(self.queue)
+        if size == 0:
+            self.oldest_put_time = time.time()
+            self.batch_ready.notify()
+        elif self.batch_size is not None and size + 1 == self.batch_size:
+            self.batch_ready.notify()
+        self.queue.append(item)
+
     def _get_all(self):
         """
-        Get all the items from the queue.
+        Get all the items from the queue, by swapping in a fresh deque.
+        This takes constant time no matter how many items are waiting.
         """
-        result = []
-        while len(self.queue):
-            result.append(self.queue.popleft())
+        result = self.queue
+        self.queue = collections.deque()
         return result
 
 
@@ -79,7 +197,8 @@ class FeelsTermChecker(twitter_monitor.TermChecker):
 
     Note that because this is run every now and then, and
     so as not to block the streaming thread, this
-    object will actually also insert the tweets into the database.
+    object will actually also insert the tweets into the database,
+    unless the listener has a QueueWriter thread doing that.
     """
 
     def __init__(self, queue_listener, stream_process):
@@ -95,8 +214,12 @@ class FeelsTermChecker(twitter_monitor.TermChecker):
         # Process the tweet queue -- this is more important
         # to do regularly than updating the tracking terms
         # Update the process status in the database
-        self.process.tweet_rate = self.listener.process_tweet_queue()
+        if self.listener.writer is not None:
+            self.process.tweet_rate = self.listener.writer.get_tweet_rate()
+        else:
+            self.process.tweet_rate = self.listener.process_tweet_queue()
         self.process.error_count = self.error_count
+        self.listener.update_stats(self.process)
 
         # Check for new tracking terms
         filter_terms = models.FilterTerm.objects.filter(enabled=True)
@@ -126,20 +249,62 @@ class QueueStreamListener(twitter_monitor.JsonStreamListener):
     Note that this is operated by the streaming thread.
     """
 
-    def __init__(self, api=None, to_file=None):
+    OVERFLOW_BLOCK = 'block'
+    OVERFLOW_DROP_OLDEST = 'drop_oldest'
+    OVERFLOW_DROP_NEWEST = 'drop_newest'
+    OVERFLOW_SPILL = 'spill'
+    OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_SPILL)
+
+    # Journaled tweets to read back into memory and save at a time
+    REPLAY_BATCH_SIZE = 10000
+
+    # How long process_tweet_queue() may keep replaying the journal for,
+    # leaving the rest of the (default) poll interval for everything else
+    REPLAY_SECONDS = settings.POLL_INTERVAL / 2.0
+
+    def __init__(self, api=None, to_file=None, max_size=None, overflow_policy=None, raw=False,
+                 compression=None, rotate_bytes=None, rotate_seconds=None):
         """
         Listens for tweets from Tweepy and saves them in the database
         when process_tweet_queue() is called (in a separate thread, probably).
 
         If to_file is given, tweets are written to the file instead.
-        JSON formatted, one per line.
+        JSON formatted, one per line. If raw is also true, tweets are
+        written exactly as they came off the wire, without parsing them.
+        The file may be compressed ('gzip' or 'zstd'), and rotated
+        after rotate_bytes of tweets or rotate_seconds.
+
+        If max_size is given, at most that many tweets are held in memory.
+        The overflow_policy decides what happens to tweets beyond that.
+        With the spill policy, they go to an OverflowJournal on disk
+        and are saved after the queue has caught up.
         """
         super(QueueStreamListener, self).__init__(api)
 
         self.terminate = False
 
+        if raw and not to_file:
+            raise ValueError("Raw mode only works when writing to a file")
+        self.raw = raw
+
+        if max_size is None:
+            max_size = settings.QUEUE_MAX_SIZE
+        if overflow_policy is None:
+            overflow_policy = settings.QUEUE_OVERFLOW_POLICY
+        if overflow_policy not in self.OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy %s" % overflow_policy)
+
         # A place to put the tweets
-        self.queue = TweetQueue()
+        self.queue = TweetQueue(max_size)
+
+        # What to do when the queue is full, and how often it happened
+        self.overflow_policy = overflow_policy
+        self.overflow_counts = dict((policy, 0) for policy in self.OVERFLOW_POLICIES)
+
+        self.journal = None
+        if overflow_policy == self.OVERFLOW_SPILL:
+            self.journal = OverflowJournal(settings.QUEUE_SPILL_DIR,
+                                           settings.QUEUE_SPILL_SEGMENT_SIZE)
 
         # For calculating tweets / sec
         self.time = time.time()
@@ -147,17 +312,154 @@ class QueueStreamListener(twitter_monitor.JsonStreamListener):
         # Place for saving tweets if not in the database.
         self.to_file = to_file
         self._output_file = None
+        self.output_options = {
+            'compression': compression or settings.ARCHIVE_COMPRESSION,
+            'max_bytes': rotate_bytes or settings.ARCHIVE_ROTATE_BYTES,
+            'max_seconds': rotate_seconds or settings.ARCHIVE_ROTATE_SECONDS,
+        }
+
+        # How many tweets to insert per statement
+        self.batch_sizer = BatchSizer(settings.INSERT_BATCH_SIZE,
+                                      min_size=settings.INSERT_BATCH_SIZE_MIN,
+                                      max_size=settings.INSERT_BATCH_SIZE_MAX,
+                                      max_latency=settings.INSERT_MAX_LATENCY,
+                                      adaptive=settings.ADAPTIVE_BATCH_SIZE)
+
+        # Recently saved tweet ids, for skipping duplicates
+        self.recent_ids = None
+        if settings.DEDUP_CACHE_SIZE:
+            self.recent_ids = RecentIds(settings.DEDUP_CACHE_SIZE)
+
+        # Tweets the database skipped because they were already there
+        self.ignored_count = 0
+
+        # The users last saved, if they are kept in their own table
+        self.user_cache = None
+        if settings.NORMALIZE_USERS and not to_file:
+            self.user_cache = UserCache(settings.USER_CACHE_SIZE)
+
+        # The earliest and latest created_at saved by this listener,
+        # so the stored watermarks are only updated when they move
+        self.created_range = None
+
+        # Optional thread that drains the queue continuously
+        self.writer = None
+
+    def on_data(self, data):
+        if self.raw:
+            if not isinstance(data, bytes):
+                data = data.encode('utf-8')
+
+            # Queue statuses as they are, and let the
+            # base class parse anything else (deletes, limits, etc.)
+            if b'"in_reply_to_status_id"' in data:
+                return self.on_status(data.strip())
+
+        return super(QueueStreamListener, self).on_data(data)
 
     def on_status(self, status):
+        if self.journal is not None and self.journal.pending:
+            # Keep tweets in order until the journal has been replayed
+            self.spill(status)
+            return not self.terminate
+
         # construct a Tweet object from the raw status object.
-        self.queue.put_nowait(status)
+        try:
+            self.queue.put_nowait(status)
+        except queue.Full:
+            self.overflow(status)
 
         # If terminate gets set, this should take out the tweepy stream thread
         return not self.terminate
 
+    def overflow(self, status):
+        """
+        Deals with a status that did not fit in the queue.
+        """
+        policy = self.overflow_policy
+        if policy == self.OVERFLOW_SPILL:
+            self.spill(status)
+            return
+
+        self.overflow_counts[policy] += 1
+
+        if policy == self.OVERFLOW_BLOCK:
+            # Hold up the stream until there is room
+            while not self.terminate:
+                try:
+                    self.queue.put(status, timeout=1)
+                    break
+                except queue.Full:
+                    pass
+
+        elif policy == self.OVERFLOW_DROP_OLDEST:
+            self.queue.put_drop_oldest(status)
+
+        # OVERFLOW_DROP_NEWEST: nothing to do
+
+    def spill(self, status):
+        """
+        Appends a status to the end of the journal.
+        """
+        self.overflow_counts[self.OVERFLOW_SPILL] += 1
+        self.journal.append(status)
+
+    def journal_batch(self, batch):
+        """
+        Puts a batch that could not be saved at the front of the journal,
+        along with anything queued behind it, so tweets stay in order.
+
+        Only tweets that have not been journaled before should be given,
+        since they are counted as spilled.
+        """
+        statuses = list(batch)
+        try:
+            statuses.extend(self.queue.get_all_nowait())
+        except queue.Empty:
+            pass
+
+        self.overflow_counts[self.OVERFLOW_SPILL] += len(statuses)
+        self.journal.prepend(statuses)
+
+    def replay_journal(self):
+        """
+        Saves the next REPLAY_BATCH_SIZE tweets of the oldest journal segment,
+        if there is one, removing the segment once all its tweets are saved.
+
+        Returns the number of tweets saved. If saving fails, the exception
+        propagates and the tweets stay in the journal for next time
+        (they are not journaled, or counted as spilled, again).
+        """
+        sequence, batch = self.journal.read_oldest(self.REPLAY_BATCH_SIZE)
+        if sequence is None:
+            return 0
+
+        saved = self.save_batch(batch)
+        self.journal.mark_saved(sequence)
+
+        logger.info("Replayed %d journaled tweets (%d segments left)",
+                    saved, len(self.journal.segments))
+        return saved
+
+    def update_stats(self, stream_process):
+        """
+        Copies the queue overflow counters onto the stream process.
+        """
+        stream_process.blocked_count = self.overflow_counts[self.OVERFLOW_BLOCK]
+        stream_process.dropped_oldest_count = self.overflow_counts[self.OVERFLOW_DROP_OLDEST]
+        stream_process.dropped_newest_count = self.overflow_counts[self.OVERFLOW_DROP_NEWEST]
+        stream_process.spilled_count = self.overflow_counts[self.OVERFLOW_SPILL]
+        stream_process.insert_batch_size = self.batch_sizer.size
+        stream_process.insert_rate = self.batch_sizer.rate or 0
+        if self.recent_ids is not None:
+            stream_process.dedup_checked_count = self.recent_ids.checked
+            stream_process.dedup_hit_count = self.recent_ids.hits
+        stream_process.dedup_ignored_count = self.ignored_count
+
     def process_tweet_queue(self):
         """
-        Inserts any queued tweets into the database.
+        Inserts any queued tweets into the database, then replays
+        the journal (if any) for up to REPLAY_SECONDS.
 
         It is ok for this to be called on a thread other than the streaming thread.
         """
@@ -170,51 +472,130 @@ class QueueStreamListener(twitter_monitor.JsonStreamListener):
         try:
             batch = self.queue.get_all_nowait()
         except queue.Empty:
+            batch = []
+
+        journal_pending = self.journal is not None and self.journal.pending
+        if not batch and not journal_pending:
             return 0
 
+        saved = 0
+        batch_saved = False
+        try:
+            saved += self.save_batch(batch)
+            batch_saved = True
+
+            # Tweets keep spilling while the journal is replayed,
+            # so catch up as far as there is time for
+            deadline = time.time() + self.REPLAY_SECONDS
+            while self.journal is not None and self.journal.pending:
+                saved += self.replay_journal()
+                if time.time() >= deadline:
+                    break
+        except Exception:
+            if self.journal is None:
+                raise
+            logger.error("Failed to save tweets, journaling them", exc_info=True)
+            # Journaled tweets that failed again are still in the journal
+            if batch and not batch_saved:
+                self.journal_batch(batch)
+
+        if saved:
+            if self.to_file:
+                logger.info("Dumped %s tweets at %s tps to %s" % (saved, saved / diff, self.to_file))
+            else:
+                logger.info("Inserted %s tweets at %s tps" % (saved, saved / diff))
+        else:
+            logger.info("Saved 0 tweets")
+
+        return saved / diff
+
+    def save_batch(self, batch):
+        """
+        Writes a batch of raw statuses to the database (or the output file).
+        Returns the number of tweets saved.
+        """
+
         if len(batch) == 0:
             return 0
 
         Tweet = load_model("twitter_stream", "Tweet")
 
+        # Build plain rows instead of model instances if we can
+        insert_backend = None
+        if not self.to_file:
+            insert_backend = Tweet.get_insert_backend()
+
+        if insert_backend in (None, 'bulk_create'):
+            parse = Tweet.create_from_json
+        else:
+            parse = Tweet.row_from_json
+
+        # Ids remembered for this batch, to forget again if it is not saved
+        new_ids = []
+
+        # Details of the users who posted the tweets
+        users = []
+        user_row = None
+        if self.user_cache is not None:
+            user_row = models.TwitterUser.row_from_json
+
         tweets = []
         for status in batch:
-            if settings.CAPTURE_EMBEDDED and 'retweeted_status' in status:
+            if isinstance(status, bytes):
+                # Raw statuses from on_data()
+                tweets.extend(self.split_raw_status(status))
+                continue
+
+            # (Archived tweets only have the id of the retweeted status, with no user)
+            if (settings.CAPTURE_EMBEDDED and 'user' in status.get('retweeted_status', ()) and
+                    not self.is_duplicate(status['retweeted_status'], new_ids)):
                 if self.to_file:
-                    tweets.append(json.dumps(status['retweeted_status']))
+                    tweets.append(fastjson.dumps(status['retweeted_status']))
                 else:
                     try:
-                        retweeted = Tweet.create_from_json(status['retweeted_status'])
+                        retweeted = parse(status['retweeted_status'])
                         if retweeted is not None:
                             tweets.append(retweeted)
+                            if user_row:
+                                users.append(user_row(status['retweeted_status']['user']))
                     except:
                         logger.error("Failed to parse retweeted %s" % status['retweeted_status']['id_str'], exc_info=True)
 
+            if self.is_duplicate(status, new_ids):
+                continue
+
             if self.to_file:
                 if 'retweeted_status' in status:
                     del status['retweeted_status']
 
-                tweets.append(json.dumps(status))
+                tweets.append(fastjson.dumps(status))
             else:
                 try:
-                    tweet = Tweet.create_from_json(status)
+                    tweet = parse(status)
                     if tweet is not None:
                         tweets.append(tweet)
+                        if user_row:
+                            users.append(user_row(status['user']))
                 except:
                     logger.error("Failed to parse tweet %s" % status['id_str'], exc_info=True)
 
-        if tweets:
-            if self.to_file:
-                if not self._output_file or self._output_file.closed:
-                    self._output_file = open(self.to_file, 'ab')
-                self._output_file.write("\n".join(tweets) + "\n")
-                self._output_file.flush()
-                logger.info("Dumped %s tweets at %s tps to %s" % (len(tweets), len(tweets) / diff, self.to_file))
-            else:
-                Tweet.objects.bulk_create(tweets, settings.INSERT_BATCH_SIZE)
-                logger.info("Inserted %s tweets at %s tps" % (len(tweets), len(tweets) / diff))
-        else:
-            logger.info("Saved 0 tweets")
+        saved = len(tweets)
+        try:
+            if tweets:
+                if self.to_file:
+                    if not self._output_file:
+                        self._output_file = RotatingArchiveWriter(self.to_file, **self.output_options)
+                    self._output_file.write(b"\n".join(tweets) + b"\n")
+                    self._output_file.flush()
+                else:
+                    if users:
+                        self.save_users(users)
+                    saved = self.insert(Tweet, tweets, insert_backend)
+        except Exception:
+            # So they are not skipped when the batch is retried
+            if new_ids:
+                self.recent_ids.forget(new_ids)
+            raise
 
         if settings.DEBUG:
             # Prevent apparent memory leaks
@@ -222,7 +603,346 @@ class QueueStreamListener(twitter_monitor.JsonStreamListener):
             from django import db
             db.reset_queries()
 
-        return len(tweets) / diff
+        return saved
+
+    def insert(self, Tweet, tweets, insert_backend):
+        """
+        Inserts tweets (model instances or rows) in batches.
+        Returns the number of tweets inserted.
+
+        All the batches go in one transaction, so if any of them fails,
+        none of the tweets are saved, and the caller can retry them all.
+        The batch sizer is given the time for the whole transaction,
+        commit included, since that is what each batch size really costs.
+
+        With COUNT_ROLLUPS, the tweet counts are updated in the same transaction,
+        as is the running count of tweets if COUNT_APPROX_SOURCE is 'counter',
+        and the created_at watermarks.
+        """
+        sizer = self.batch_sizer
+
+        # Bigger batches than the database takes at once would be split up again
+        statement_rows = Tweet.max_statement_rows(tweets, insert_backend)
+        if statement_rows < len(tweets):
+            sizer.cap(statement_rows)
+
+        if insert_backend == 'bulk_create':
+            get_created_at = operator.attrgetter('created_at')
+        else:
+            get_created_at = operator.itemgetter(Tweet.ROW_FIELDS.index('created_at'))
+
+        # The database may skip some of the tweets, which must not be counted
+        count_new_only = settings.COUNT_ROLLUPS and settings.IGNORE_DUPLICATES
+
+        inserted = 0
+        batches = 0
+        created_range = self.created_range
+        watermarks_missing = False
+
+        began = time.time()
+        try:
+            with transaction.atomic():
+                start = 0
+                while start < len(tweets):
+                    batch = tweets[start:start + sizer.size]
+                    created_ats = [get_created_at(tweet) for tweet in batch]
+
+                    counted = created_ats
+                    if count_new_only:
+                        counted = self.new_created_ats(Tweet, batch, created_ats)
+
+                    if insert_backend == 'bulk_create':
+                        Tweet.objects.bulk_create(batch, len(batch))
+                        count = len(batch)
+                    else:
+                        count = Tweet.insert_rows(batch, len(batch), insert_backend)
+                    if count is None:
+                        count = len(batch)
+
+                    if settings.COUNT_ROLLUPS:
+                        if count != len(counted):
+                            # Another process saved some of the same tweets meanwhile
+                            logger.warning("Inserted %d tweets but counted %d; "
+                                           "run rebuild_tweet_counts to correct the counts",
+                                           count, len(counted))
+                        models.TweetCount.add_counts(counted)
+                    if settings.COUNT_APPROX_SOURCE == 'counter':
+                        models.TweetTableStats.add_tweets(Tweet, count)
+                    created_range = self.extend_created_range(Tweet, created_ats, created_range)
+                    if created_range is None:
+                        watermarks_missing = True
+
+                    inserted += count
+                    batches += 1
+                    start += len(batch)
+        except Exception:
+            sizer.failed()
+            raise
+        sizer.record(len(tweets), time.time() - began, batches)
+
+        if watermarks_missing:
+            # Set the watermarks from the table, now that the inserts are
+            # committed, instead of holding up the transaction with MIN / MAX
+            try:
+                models.TweetTableStats.refresh_created_range(Tweet)
+            except Exception:
+                logger.error("Failed to set the created_at watermarks", exc_info=True)
+
+        # Only once it is all committed
+        self.created_range = created_range
+        self.ignored_count += len(tweets) - inserted
+
+        return inserted
+
+    # How many tweet ids to look up per query (SQLite allows 999 parameters)
+    LOOKUP_BATCH_SIZE = 500
+
+    def new_created_ats(self, Tweet, tweets, created_ats):
+        """
+        Returns the created_at times of the tweets that are not in the table yet,
+        nor earlier in the list, i.e. the ones that IGNORE_DUPLICATES will insert.
+        """
+        if isinstance(tweets[0], Tweet):
+            get_tweet_id = operator.attrgetter('tweet_id')
+        else:
+            get_tweet_id = operator.itemgetter(Tweet.ROW_FIELDS.index('tweet_id'))
+        tweet_ids = [get_tweet_id(tweet) for tweet in tweets]
+
+        seen = set()
+        for start in range(0, len(tweet_ids), self.LOOKUP_BATCH_SIZE):
+            seen.update(Tweet.objects.filter(tweet_id__in=tweet_ids[start:start + self.LOOKUP_BATCH_SIZE])
+                        .values_list('tweet_id', flat=True))
+
+        new = []
+        for tweet_id, created_at in zip(tweet_ids, created_ats):
+            if tweet_id not in seen:
+                seen.add(tweet_id)
+                new.append(created_at)
+        return new
+
+    def extend_created_range(self, Tweet, created_ats, known):
+        """
+        Moves the stored created_at watermarks out to cover the given times,
+        skipping the queries when tweets at least as early and as late
+        are known to be saved already. Returns the new known range,
+        or None if there are no watermarks, and they need setting from the table.
+        """
+        earliest, latest = min(created_ats), max(created_ats)
+
+        if known is None:
+            if not models.TweetTableStats.extend_created_range(Tweet, earliest, latest):
+                return None
+            return earliest, latest
+
+        earliest = earliest if earliest < known[0] else None
+        latest = latest if latest > known[1] else None
+        if earliest is not None or latest is not None:
+            if not models.TweetTableStats.extend_created_range(Tweet, earliest, latest):
+                return None
+
+        return earliest or known[0], latest or known[1]
+
+    def save_users(self, rows):
+        """
+        Saves the user rows that changed since they were last saved.
+        """
+        changed = self.user_cache.changed(rows)
+        if changed:
+            models.TwitterUser.upsert_rows(changed)
+            self.user_cache.remember(changed)
+
+    def is_duplicate(self, status, new_ids):
+        """
+        Returns True if the status was saved recently, and should be skipped.
+        Otherwise its id is added to new_ids.
+        """
+        if self.recent_ids is None:
+            return False
+
+        if self.recent_ids.seen(status['id']):
+            return True
+
+        new_ids.append(status['id'])
+        return False
+
+    def split_raw_status(self, data):
+        """
+        Returns the lines to write for a raw status. The status is only
+        parsed if the embedded retweet needs to go on a line of its own.
+        """
+        if settings.CAPTURE_EMBEDDED and b'"retweeted_status"' in data:
+            status = fastjson.loads(data)
+            retweeted = status.pop('retweeted_status', None)
+            if retweeted is not None:
+                return [fastjson.dumps(retweeted), fastjson.dumps(status)]
+
+        return [data]
+
+    def start_writer(self, batch_size=None, max_age=None):
+        """
+        Start a QueueWriter thread that drains the queue continuously,
+        instead of waiting for process_tweet_queue() to be called.
+        """
+        if self.writer is None:
+            self.writer = QueueWriter(self, batch_size=batch_size, max_age=max_age)
+            self.writer.start()
+        return self.writer
+
+    def stop_writer(self, timeout=None):
+        """
+        Stop the writer thread, if any, after it saves whatever is left.
+        """
+        if self.writer is not None:
+            self.writer.stop()
+            self.writer.join(timeout)
+
+    def close(self):
+        """
+        Moves anything still queued into the journal (if there is one)
+        so it survives a restart, and closes any open files.
+        """
+        if self.journal is not None:
+            try:
+                self.journal_batch(self.queue.get_all_nowait())
+            except queue.Empty:
+                pass
+            self.journal.close()
+
+        if self._output_file:
+            self._output_file.close()
 
     def set_terminate(self):
         self.terminate = True
+
+
+class QueueWriter(threading.Thread):
+    """
+    Drains a listener's queue whenever batch_size tweets are waiting
+    or the oldest waiting tweet is max_age seconds old, whichever comes first.
+    At most batch_size tweets are saved at a time.
+
+    This keeps inserts small and steady regardless of the poll interval,
+    so the term checker only has to report the rate.
+
+    If the listener has a journal, the writer also replays it whenever
+    the queue is empty, and backs off while saving fails.
+    """
+
+    # How long to sleep when there is nothing to do
+    IDLE_TIMEOUT = 1.0
+
+    # How long to wait before trying again after a failure
+    MIN_BACKOFF = 1.0
+    MAX_BACKOFF = 30.0
+
+    def __init__(self, listener, batch_size=None, max_age=None):
+        super(QueueWriter, self).__init__(name="QueueWriter")
+        self.daemon = True
+
+        self.listener = listener
+        self.batch_size = batch_size or settings.WRITER_BATCH_SIZE
+        self.max_age = max_age if max_age is not None else settings.WRITER_MAX_AGE
+
+        self.stopping = False
+        self.error_count = 0
+        self.backoff = self.MIN_BACKOFF
+        self._stopped = threading.Event()
+
+        # For calculating tweets / sec
+        self._lock = threading.Lock()
+        self._saved = 0
+        self._time = time.time()
+
+    def run(self):
+        tweet_queue = self.listener.queue
+        journal = self.listener.journal
+        while not self.stopping:
+            # Don't sit idle while there is a journal to replay
+            timeout = self.IDLE_TIMEOUT
+            if journal is not None and journal.pending:
+                timeout = 0
+
+            if tweet_queue.wait_for_batch(self.batch_size, self.max_age, timeout):
+                self.drain()
+
+            # Everything still queued arrived before the journaled tweets,
+            # so only replay once the queue is empty
+            if journal is not None and journal.pending and not self.stopping and tweet_queue.empty():
+                self.replay()
+
+        # One last time, for anything that came in while stopping
+        while not tweet_queue.empty():
+            if self.drain() is None:
+                break
+
+    def drain(self):
+        """
+        Saves up to batch_size tweets from the queue.
+        Returns the number saved, or None if saving failed.
+        """
+        try:
+            batch = self.listener.queue.get_up_to_nowait(self.batch_size)
+        except queue.Empty:
+            return 0
+
+        try:
+            saved = self.listener.save_batch(batch)
+        except Exception:
+            self.error_count += 1
+            if self.listener.journal is not None:
+                logger.error("Failed to save %d tweets, journaling them", len(batch), exc_info=True)
+                self.listener.journal_batch(batch)
+            else:
+                logger.error("Failed to save %d tweets", len(batch), exc_info=True)
+            self.pause()
+            return None
+
+        self.count(saved)
+        return saved
+
+    def replay(self):
+        try:
+            saved = self.listener.replay_journal()
+        except Exception:
+            self.error_count += 1
+            logger.error("Failed to replay the journal", exc_info=True)
+            self.pause()
+            return 0
+
+        self.count(saved)
+        return saved
+
+    def count(self, saved):
+        self.backoff = self.MIN_BACKOFF
+        with self._lock:
+            self._saved += saved
+
+    def pause(self):
+        """
+        Waits a little longer after each consecutive failure.
+        """
+        self._stopped.wait(self.backoff)
+        self.backoff = min(2 * self.backoff, self.MAX_BACKOFF)
+
+    def get_tweet_rate(self):
+        """
+        Returns the tweets / sec saved since the last call.
+        """
+        with self._lock:
+            now = time.time()
+            diff = now - self._time
+            saved = self._saved
+            self._time = now
+            self._saved = 0
+
+        if saved:
+            logger.info("Saved %s tweets at %s tps" % (saved, saved / diff))
+        else:
+            logger.info("Saved 0 tweets")
+
+        return saved / diff
+
+    def stop(self):
+        self.stopping = True
+        self._stopped.set()
+        self.listener.queue.wake()
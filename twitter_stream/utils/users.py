@@ -0,0 +1,54 @@
+"""
+Saving user details only when they change.
+"""
+
+__all__ = ['UserCache']
+
+
+class UserCache(object):
+    """
+    Remembers a hash of the last saved details of each user,
+    so users whose details have not changed are not saved again.
+
+    Like the created_at cache, it is emptied when it fills up,
+    after which every user is saved once more.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.hashes = {}
+
+        # How many users were checked, and how many had changed
+        self.checked = 0
+        self.changed_count = 0
+
+    def changed(self, rows):
+        """
+        Given user rows (with the user_id first), returns the ones that are
+        new or different from the last ones remembered. If a user appears
+        more than once, only their last row is considered.
+        """
+        hashes = self.hashes
+        latest = {}
+        for row in rows:
+            latest[row[0]] = row
+
+        changed = []
+        for user_id, row in latest.items():
+            self.checked += 1
+            if hashes.get(user_id) != hash(row):
+                changed.append(row)
+
+        self.changed_count += len(changed)
+        return changed
+
+    def remember(self, rows):
+        """
+        Records that the given user rows have been saved.
+        """
+        hashes = self.hashes
+        if len(hashes) + len(rows) > self.size:
+            hashes.clear()
+
+        for row in rows:
+            hashes[row[0]] = hash(row)
@@ -1,13 +1,21 @@
 from datetime import timedelta
 import json
+import time
 from django.conf import settings
+from django.core.cache import cache
+from django.contrib.humanize.templatetags.humanize import naturaltime
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.encoding import force_text
+from django.utils.formats import localize
 from django.template import RequestContext
+from django.template.defaultfilters import floatformat
 from django.template.loader import render_to_string
 from django.views import generic
 from django.contrib.admin.views.decorators import staff_member_required
 from jsonview.decorators import json_view
-from twitter_stream.models import FilterTerm, StreamProcess
+from twitter_stream.models import FilterTerm, StreamProcess, TweetCount
+from twitter_stream import settings as stream_settings
 from swapper import load_model
 from django.db import models
 
@@ -22,6 +30,41 @@ def _render_to_string_request(request, template, dictionary):
     return render_to_string(template, context_instance=context)
 
 
+def count_tweets_per_minute(Tweet, since):
+    """
+    Counts the tweets created in each minute since the given time,
+    straight from the tweet table.
+    """
+    if settings.DATABASES['default']['ENGINE'].endswith('mysql'):
+        drop_seconds = "created_at - INTERVAL SECOND(created_at) SECOND"
+    elif settings.DATABASES['default']['ENGINE'].endswith('postgresql_psycopg2'):
+        drop_seconds = "date_trunc('minute', created_at)"
+    else:
+        drop_seconds = "created_at"
+
+    tweet_counts = Tweet.objects.extra(select={
+        'time': drop_seconds
+    }) \
+        .filter(created_at__gt=since) \
+        .values('time') \
+        .order_by('time') \
+        .annotate(tweets=models.Count('id'))
+
+    if drop_seconds != "created_at":
+        return list(tweet_counts)
+
+    # Other databases give a count per second, so add those up by minute
+    minutes = []
+    for row in tweet_counts:
+        time = row['time'].replace(second=0, microsecond=0)
+
+        if minutes and minutes[-1]['time'] == time:
+            minutes[-1]['tweets'] += row['tweets']
+        else:
+            minutes.append({'time': time, 'tweets': row['tweets']})
+    return minutes
+
+
 def stream_status():
     terms = FilterTerm.objects.filter(enabled=True)
     processes = StreamProcess.get_current_stream_processes()
@@ -37,30 +80,20 @@ def stream_status():
     latest_time = Tweet.get_latest_created_at()
 
     avg_rate = None
-    if earliest_time is not None and latest_time is not None:
+    if stream_settings.COUNT_ROLLUPS:
+        avg_rate = TweetCount.get_average_rate()
+    elif earliest_time is not None and latest_time is not None:
         avg_rate = float(tweet_count) / (latest_time - earliest_time).total_seconds()
 
-    # Get the tweets / minute over the past 10 minutes
+    # Get the tweets / minute over the past 20 minutes
     tweet_counts = []
     if latest_time is not None:
         latest_time_minute = latest_time.replace(second=0, microsecond=0)
 
-        if settings.DATABASES['default']['ENGINE'].endswith('mysql'):
-            drop_seconds = "created_at - INTERVAL SECOND(created_at) SECOND"
-        elif settings.DATABASES['default']['ENGINE'].endswith('postgresql_psycopg2'):
-            drop_seconds = "date_trunc('minute', created_at)"
+        if stream_settings.COUNT_ROLLUPS:
+            tweet_counts = TweetCount.get_timeline(latest_time_minute - timedelta(minutes=20))
         else:
-            drop_seconds = "created_at"
-
-        tweet_counts = Tweet.objects.extra(select={
-            'time': drop_seconds
-        }) \
-            .filter(created_at__gt=latest_time_minute - timedelta(minutes=20)) \
-            .values('time') \
-            .order_by('time') \
-            .annotate(tweets=models.Count('id'))
-
-        tweet_counts = list(tweet_counts)
+            tweet_counts = count_tweets_per_minute(Tweet, latest_time_minute - timedelta(minutes=20))
 
     for row in tweet_counts:
         row['time'] = row['time'].isoformat()
@@ -68,7 +101,7 @@ def stream_status():
     return {
         'running': running,
         'terms': [t.term for t in terms],
-        'processes': processes,
+        'processes': list(processes),
         'tweet_count': tweet_count,
         'earliest': earliest_time,
         'latest': latest_time,
@@ -77,15 +110,62 @@ def stream_status():
     }
 
 
+STATUS_CACHE_KEY = 'twitter_stream:status'
+STATUS_LOCK_KEY = 'twitter_stream:status:lock'
+
+# How long one viewer may take to compute the status before another one tries
+STATUS_LOCK_TIMEOUT = 30
+
+
+def cached_stream_status():
+    """
+    Returns stream_status(), computed at most once every STATUS_CACHE_SECONDS
+    no matter how many people are watching the status page.
+
+    When the cached status gets old, one viewer computes a new one
+    while the others keep getting the old one. If there is no status
+    at all yet, the others wait for it instead.
+    """
+    timeout = stream_settings.STATUS_CACHE_SECONDS
+    if not timeout:
+        return stream_status()
+
+    # The status is kept past its expiry time, to hand out while it is recomputed
+    cached = cache.get(STATUS_CACHE_KEY)
+    if cached is not None and cached[0] > time.time():
+        return cached[1]
+
+    if cache.add(STATUS_LOCK_KEY, True, STATUS_LOCK_TIMEOUT):
+        try:
+            status = stream_status()
+            cache.set(STATUS_CACHE_KEY, (time.time() + timeout, status),
+                      timeout + STATUS_LOCK_TIMEOUT)
+        finally:
+            cache.delete(STATUS_LOCK_KEY)
+        return status
+
+    if cached is not None:
+        return cached[1]
+
+    deadline = time.time() + STATUS_LOCK_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(0.1)
+        cached = cache.get(STATUS_CACHE_KEY)
+        if cached is not None:
+            return cached[1]
+
+    return stream_status()
+
 
 class StatusView(generic.TemplateView):
     template_name = 'twitter_stream/status.html'
 
     def get_context_data(self, **kwargs):
-        status = stream_status()
+        status = dict(cached_stream_status())
         status['timeline'] = json.dumps(status['timeline'])
         return {
-            'status': status
+            'status': status,
+            'events': stream_settings.STATUS_EVENTS,
         }
 
 status = staff_member_required(StatusView.as_view())
@@ -98,7 +178,7 @@ def json_status(request, task=None):
     HTML conveniently included.
     """
 
-    status = stream_status()
+    status = cached_stream_status()
 
     display = _render_to_string_request(request, 'twitter_stream/status_display.html', {
         'status': status
@@ -109,3 +189,167 @@ def json_status(request, task=None):
         'timeline': status['timeline']
     }
 
+
+
+# Render the display at least this often, so times like "2 minutes ago" move on
+STATUS_EVENTS_MAX_RENDER_AGE = 60
+
+# Cache keys for the open event streams, STATUS_EVENTS_MAX_CONNECTIONS at most
+STATUS_EVENTS_SLOT_KEY = 'twitter_stream:events:%d'
+
+
+def status_display_key(status):
+    """
+    Returns what shapes the status display, apart from the figures
+    in status_figures() and the timeline, which are sent on their own.
+    The display only needs rendering again when this changes.
+    """
+    return (status['running'], status['terms'],
+            [(p.pk, p.status, p.keys_id, p.hostname, p.process_id, p.error_count > 0)
+             for p in status['processes']])
+
+
+def _format_figure(value):
+    """
+    Formats a value the way the status display template shows it.
+    """
+    return force_text(localize(timezone.template_localtime(value)))
+
+
+def status_figures(status):
+    """
+    Returns the figures in the status display that change all the time,
+    like the tweet count and the heartbeats, as text for the elements
+    marked with the same data-figure name.
+    """
+    figures = {
+        'tweet_count': _format_figure(status['tweet_count']),
+        'earliest': _format_figure(status['earliest']),
+        'latest': _format_figure(status['latest']),
+        'avg_rate': floatformat(status['avg_rate']),
+    }
+
+    for p in status['processes']:
+        prefix = '%s:' % p.pk
+        figures.update({
+            prefix + 'last_heartbeat': naturaltime(p.last_heartbeat),
+            prefix + 'tweet_rate': floatformat(p.tweet_rate),
+            prefix + 'insert_batch_size': _format_figure(p.insert_batch_size),
+            prefix + 'memory_usage': _format_figure(p.memory_usage),
+            prefix + 'error_count': _format_figure(p.error_count),
+            prefix + 'dropped_count': _format_figure(p.dropped_count),
+            prefix + 'duplicate_count': _format_figure(p.duplicate_count),
+        })
+    return figures
+
+
+def _server_sent_event(event, data):
+    return "event: %s\ndata: %s\n\n" % (event, json.dumps(data))
+
+
+def _status_events(request, slot=None):
+    """
+    Generates server-sent events for the status page, checking the
+    (cached) status every STATUS_CACHE_SECONDS, and sending only what changed:
+    a 'display' event with the re-rendered display when its layout changes,
+    a 'figures' event with the figures that changed, and a 'timeline' event
+    with the minutes that are new or have more tweets.
+
+    The cache key of the connection slot, if given, is freed at the end.
+    """
+    interval = stream_settings.STATUS_CACHE_SECONDS or 10
+    ends = time.time() + stream_settings.STATUS_EVENTS_SECONDS
+
+    try:
+        # Have the browser reconnect soon after the stream ends
+        yield "retry: 1000\n\n"
+
+        display_key = None
+        rendered = 0
+        figures = {}
+        timeline = None
+
+        while True:
+            status = cached_stream_status()
+            sent = False
+
+            key = status_display_key(status)
+            if key != display_key or time.time() - rendered > STATUS_EVENTS_MAX_RENDER_AGE:
+                display = _render_to_string_request(request, 'twitter_stream/status_display.html', {
+                    'status': status
+                })
+                yield _server_sent_event('display', display)
+                display_key = key
+                rendered = time.time()
+                figures = status_figures(status)
+                sent = True
+            else:
+                latest = status_figures(status)
+                changed = dict((name, text) for name, text in latest.items()
+                               if figures.get(name) != text)
+                if changed:
+                    yield _server_sent_event('figures', changed)
+                    figures = latest
+                    sent = True
+
+            rows = dict((row['time'], row['tweets']) for row in status['timeline'])
+            if rows != timeline:
+                # With no start, the browser clears the timeline
+                yield _server_sent_event('timeline', {
+                    'start': status['timeline'][0]['time'] if status['timeline'] else None,
+                    'changed': [row for row in status['timeline']
+                                if (timeline or {}).get(row['time']) != row['tweets']],
+                })
+                timeline = rows
+                sent = True
+
+            if time.time() + interval > ends:
+                break
+
+            if not sent:
+                # A comment, to keep proxies from closing the connection
+                yield ": nothing new\n\n"
+            time.sleep(interval)
+    finally:
+        if slot is not None:
+            cache.delete(slot)
+
+
+def _take_events_slot():
+    """
+    Returns the cache key of a free connection slot for the status events,
+    or None if STATUS_EVENTS_MAX_CONNECTIONS are open already. Slots expire
+    by themselves in case a connection is never closed properly.
+    """
+    timeout = stream_settings.STATUS_EVENTS_SECONDS + STATUS_LOCK_TIMEOUT
+    for number in range(stream_settings.STATUS_EVENTS_MAX_CONNECTIONS):
+        slot = STATUS_EVENTS_SLOT_KEY % number
+        if cache.add(slot, True, timeout):
+            return slot
+    return None
+
+
+@staff_member_required
+def status_events(request):
+    """
+    Pushes status updates to the status page as server-sent events,
+    instead of it polling json_status. Each connection is held for
+    STATUS_EVENTS_SECONDS, after which the browser reconnects.
+    Past STATUS_EVENTS_MAX_CONNECTIONS, new connections are turned away.
+    """
+    if not stream_settings.STATUS_EVENTS:
+        raise Http404
+
+    slot = None
+    if stream_settings.STATUS_EVENTS_MAX_CONNECTIONS:
+        slot = _take_events_slot()
+        if slot is None:
+            # The page goes back to polling
+            return HttpResponse("Too many status event streams open", status=503,
+                                content_type='text/plain')
+
+    response = StreamingHttpResponse(_status_events(request, slot), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the events
+    response['X-Accel-Buffering'] = 'no'
+    return response